@@ -0,0 +1,89 @@
+"""Benchmark comparing barcode matching strategies.
+
+Compares the naive matcher (checking ``barcode in sequence`` for every
+barcode) with the k-mer based BarcodeIndex for increasing numbers of
+barcodes. Usage::
+
+    python benchmarks/bench_barcodes.py [--reads N] [--length L]
+
+"""
+
+import argparse
+import random
+import timeit
+
+from pyim.align.barcode import BarcodeIndex
+
+
+def naive_match(barcodes, sequence):
+    """Matches barcodes by checking each barcode for occurrence."""
+    return {k for k, v in barcodes.items() if v in sequence}
+
+
+def random_sequence(length, rng):
+    """Generates a random DNA sequence."""
+    return ''.join(rng.choice('ACGT') for _ in range(length))
+
+
+def build_data(num_barcodes, num_reads, read_length, barcode_length, rng):
+    """Generates barcodes and reads, with barcodes at the read start."""
+
+    sequences = set()
+    while len(sequences) < num_barcodes:
+        sequences.add(random_sequence(barcode_length, rng))
+
+    barcodes = {'BC{:03d}'.format(i): seq
+                for i, seq in enumerate(sorted(sequences))}
+    barcode_seqs = list(barcodes.values())
+
+    reads = [
+        rng.choice(barcode_seqs) +
+        random_sequence(read_length - barcode_length, rng)
+        for _ in range(num_reads)
+    ]
+
+    return barcodes, reads
+
+
+def main():
+    """Main function for the benchmark."""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reads', type=int, default=20000)
+    parser.add_argument('--length', type=int, default=150)
+    parser.add_argument('--barcode_length', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+
+    print('{:>9} {:>12} {:>12} {:>12} {:>8}'.format(
+        'barcodes', 'naive (s)', 'index (s)', 'index-1 (s)', 'speedup'))
+
+    for num_barcodes in [8, 96, 384]:
+        barcodes, reads = build_data(num_barcodes, args.reads, args.length,
+                                     args.barcode_length, rng)
+
+        index = BarcodeIndex(barcodes)
+        index_mm = BarcodeIndex(barcodes, mismatches=1)
+
+        # Sanity check: index should give the same results.
+        for read in reads[:1000]:
+            assert index.match(read) == naive_match(barcodes, read)
+
+        def _time(func):
+            return min(timeit.repeat(
+                lambda: [func(read) for read in reads],
+                number=1, repeat=args.repeats))
+
+        naive_time = _time(lambda read: naive_match(barcodes, read))
+        index_time = _time(index.match)
+        index_mm_time = _time(index_mm.match)
+
+        print('{:>9} {:>12.3f} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+            num_barcodes, naive_time, index_time, index_mm_time,
+            naive_time / index_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Benchmark comparing frame/object conversions of insertions.
+
+Compares the vectorized ``Insertion.from_frame`` and ``Insertion.to_frame``
+with the previous row-wise implementations for increasing numbers of
+insertions. Usage::
+
+    python benchmarks/bench_model.py [--max_rows N] [--repeats R]
+
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+import toolz
+
+from pyim.model import Insertion
+from pyim.vendor.frozendict import frozendict
+
+
+def legacy_from_frame(df):
+    """Previous row-wise implementation of from_frame."""
+
+    basic_fields = Insertion._non_metadata_fields()
+    metadata_fields = list(set(df.columns) - set(basic_fields))
+
+    for row in df.itertuples():
+        row_dict = row._asdict()
+
+        metadata = {k: row_dict.pop(k) for k in metadata_fields}
+        metadata = frozendict(toolz.valfilter(_not_nan, metadata))
+
+        row_dict.pop('Index', None)
+
+        yield Insertion(metadata=metadata, **row_dict)
+
+
+def legacy_to_frame(insertions):
+    """Previous row-wise implementation of to_frame."""
+
+    def _to_dict(obj):
+        obj_data = obj._asdict()
+        metadata = obj_data.pop('metadata')
+        return toolz.merge(metadata, obj_data)
+
+    df = pd.DataFrame.from_records(_to_dict(ins) for ins in insertions)
+    return Insertion.format_frame(df)
+
+
+def _not_nan(value):
+    if value is None:
+        return False
+    elif isinstance(value, str) and value == '':
+        return False
+    else:
+        try:
+            return not np.isnan(value)
+        except TypeError:
+            return True
+
+
+def build_frame(num_rows, rng):
+    """Generates an insertion frame with (partially missing) metadata."""
+
+    depth = rng.randint(1, 100, size=num_rows).astype(float)
+    depth[rng.rand(num_rows) < 0.2] = np.nan
+
+    return pd.DataFrame({
+        'id': ['INS_{}'.format(i) for i in range(num_rows)],
+        'chromosome': rng.choice(['1', '2', 'X'], size=num_rows),
+        'position': rng.randint(0, 10**8, size=num_rows),
+        'strand': rng.choice([-1, 1], size=num_rows),
+        'support': rng.randint(1, 50, size=num_rows),
+        'sample': rng.choice(['s1', 's2', 's3'], size=num_rows),
+        'depth': depth,
+        'gene_name': rng.choice(['Myc', 'Pten', ''], size=num_rows)
+    })
+
+
+def main():
+    """Main function for the benchmark."""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max_rows', type=int, default=10**7)
+    parser.add_argument('--repeats', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+
+    print('{:>9} {:>14} {:>14} {:>8} {:>14} {:>14} {:>8}'.format(
+        'rows', 'from (legacy)', 'from (new)', 'speedup', 'to (legacy)',
+        'to (new)', 'speedup'))
+
+    num_rows = 10**4
+    while num_rows <= args.max_rows:
+        frame = build_frame(num_rows, rng)
+
+        insertions = list(Insertion.from_frame(frame))
+
+        # Sanity check: results should be identical.
+        assert insertions[:1000] == list(legacy_from_frame(frame[:1000]))
+        pd.testing.assert_frame_equal(
+            Insertion.to_frame(insertions[:1000]),
+            legacy_to_frame(insertions[:1000]))
+
+        def _time(func):
+            return min(timeit.repeat(
+                func, number=1, repeat=args.repeats))
+
+        times = [
+            _time(lambda: list(legacy_from_frame(frame))),
+            _time(lambda: list(Insertion.from_frame(frame))),
+            _time(lambda: legacy_to_frame(insertions)),
+            _time(lambda: Insertion.to_frame(insertions))
+        ]
+
+        print('{:>9} {:>14.3f} {:>14.3f} {:>7.1f}x {:>14.3f} {:>14.3f} '
+              '{:>7.1f}x'.format(num_rows, times[0], times[1],
+                                 times[0] / times[1], times[2], times[3],
+                                 times[2] / times[3]))
+
+        num_rows *= 10
+
+
+if __name__ == '__main__':
+    main()
@@ -12,10 +12,11 @@ with open('HISTORY.rst') as history_file:
 REQUIREMENTS = [
     'pyfaidx>=0.4.8.1', 'intervaltree>=2.1', 'tqdm>=4.7', 'toolz>=0.8',
     'rpy2>=2.8.2', 'numpy', 'pandas>=0.18', 'pysam>=0.9', 'natsort',
-    'cutadapt >=1.8'
+    'cutadapt >=1.10,<2.0'
 ]
 
 EXTRAS_REQUIRE = {
+    'arrow': ['pyarrow'],
     'dev': [
         'pytest', 'pytest-cov', 'pytest-mock', 'pytest-helpers-namespace',
         'python-coveralls', 'sphinx', 'sphinx-autobuild', 'sphinx_rtd_theme',
@@ -56,6 +57,7 @@ setup(
             'pyim-cis = pyim.main.pyim_cis:main',
             'pyim-annotate = pyim.main.pyim_annotate:main',
             'pyim-bed = pyim.main.pyim_bed:main',
-            'pyim-split = pyim.main.pyim_split:main'
+            'pyim-split = pyim.main.pyim_split:main',
+            'pyim-index-genes = pyim.main.pyim_index_genes:main'
         ]
     })
@@ -1,3 +1,3 @@
 from .base import Aligner, AlignerCommand
-# from .shear_splink import ShearSplinkPipeline, MultiplexedShearSplinkPipeline
+from .shear_splink import ShearSplinkAligner, MultiplexedShearSplinkAligner
 from .nextera import NexteraAligner
@@ -1,19 +1,31 @@
 """Module containing the nextera pipeline."""
 
+from collections import Counter, OrderedDict
+from functools import partial
 import logging
 from pathlib import Path
+import shutil
 
-import pysam
+from cutadapt import seqio
+import pandas as pd
 import toolz
 
-from pyim.external.bowtie2 import bowtie2
-from pyim.external.cutadapt import cutadapt, cutadapt_summary
+from pyim.external.bowtie2 import (bowtie2, bowtie2_piped, bowtie2_stdin,
+                                   bowtie2_index_files)
+from pyim.external.cutadapt import (cutadapt, cutadapt_stream_args,
+                                    check_interleaved_support,
+                                    cutadapt_summary)
 from pyim.external.util import flatten_arguments
 from pyim.model import Insertion
+from pyim.util.cache import StageCache, file_digest, file_stamp
 from pyim.util.path import WorkDirectory, shorten_path, extract_suffix
 
-from .base import Aligner, PairedEndCommand
-from ..util import AlignmentSummary
+from .base import Aligner, AlignerCommand, PairedEndCommand
+from ..reads import format_reads
+from ..util import ColumnarAlignmentSummary, iter_collated_mates
+
+# Separator used to tag read names with their sample in pooled alignments.
+SAMPLE_SEPARATOR = '|'
 
 
 class NexteraAligner(Aligner):
@@ -65,6 +77,34 @@ class NexteraAligner(Aligner):
         to slight variations in alignments.
     threads : int
         The number of threads to use for the alignment.
+    extract_processes : int
+        The number of processes to use for extracting insertions from the
+        alignment. If larger than one, the alignment is indexed and
+        insertions are extracted per contig (or per region, if
+        ``extract_region_size`` is given) in parallel.
+    extract_region_size : int
+        Optional size of the genomic regions that are processed in
+        parallel during extraction. Defaults to entire contigs.
+    collate : bool
+        Whether to group alignments by read name instead of sorting them by
+        position. This allows mates to be paired using constant memory
+        during extraction, but cannot be combined with parallel extraction.
+        Mates whose partner is missing (for example due to filtering on
+        mapping quality) are counted and reported as orphans.
+    stream : bool
+        Whether to stream reads through the trimming and alignment steps.
+        If True, both cutadapt steps and bowtie2 run concurrently and are
+        connected through pipes carrying interleaved mates, so that no
+        trimmed reads are written to disk (unless a work directory is
+        kept, in which case the trimmed reads are also written to the
+        work directory for inspection). Requires a version of cutadapt
+        that supports the ``--interleaved`` option (1.15 or newer), which
+        is checked before streaming.
+    cache_dir : Path
+        Optional directory in which trimmed reads and alignments are
+        cached. Cached outputs are keyed by the inputs that produced them
+        (read files, transposon sequence and trimming/alignment options),
+        and are re-used by subsequent runs with the same inputs.
 
     """
 
@@ -77,10 +117,20 @@ class NexteraAligner(Aligner):
                  min_mapq=23,
                  merge_distance=None,
                  threads=1,
+                 extract_processes=1,
+                 extract_region_size=None,
+                 collate=False,
+                 stream=False,
+                 cache_dir=None,
                  sample_name=None,
                  logger=None):
         super().__init__()
 
+        if collate and (extract_processes > 1 or
+                        extract_region_size is not None):
+            raise ValueError('Collated alignments cannot be '
+                             'extracted in parallel')
+
         self._transposon_path = transposon_path
         self._index_path = bowtie_index_path
         self._bowtie_options = bowtie_options or {}
@@ -92,10 +142,20 @@ class NexteraAligner(Aligner):
         self._merge_distance = merge_distance
         self._threads = threads
 
+        self._extract_processes = extract_processes
+        self._extract_region_size = extract_region_size
+        self._collate = collate
+        self._stream = stream
+
         self._sample_name = sample_name
 
         self._logger = logger or logging.getLogger()
 
+        if cache_dir is not None:
+            self._cache = StageCache(cache_dir, logger=self._logger)
+        else:
+            self._cache = None
+
     def trim(self, read_paths, output_paths, work_dir=None):
         """Trims reads to remove transposon/nextera sequences."""
 
@@ -119,9 +179,10 @@ class NexteraAligner(Aligner):
                                 work_dir / ('trimmed.nextera.R2' + suffix))
             self._trim_nextera(trimmed_tr_paths, trimmed_nt_paths)
 
-            # Move outputs into position.
+            # Move outputs into position. Note that the (temporary) work
+            # directory may be on a different file system than the outputs.
             for file_path, output_path in zip(trimmed_nt_paths, output_paths):
-                file_path.rename(output_path)
+                shutil.move(str(file_path), str(output_path))
 
     def _check_read_paths(self, read_paths):
         """Checks read paths input for validity."""
@@ -130,21 +191,29 @@ class NexteraAligner(Aligner):
             raise ValueError(self.__class__.__name__ +
                              ' only supports paired-end data')
 
-    def _trim_transposon(self, read_paths, output_paths):
-        """Selects and trims mates with transposon sequence in second read."""
-
-        cutadapt_opts = {
+    def _transposon_options(self):
+        return {
             '-G': 'file:' + str(self._transposon_path),
             '--discard-untrimmed': True,
             '--pair-filter=both': True
         }
 
+    def _nextera_options(self):
+        return {
+            '-a': 'CTGTCTCTTATA',
+            '-A': 'CTGTCTCTTATA',
+            '--minimum-length': self._min_length,
+        }
+
+    def _trim_transposon(self, read_paths, output_paths):
+        """Selects and trims mates with transposon sequence in second read."""
+
         process = cutadapt(
             read_path=read_paths[0],
             read2_path=read_paths[1],
             out_path=output_paths[0],
             out2_path=output_paths[1],
-            options=cutadapt_opts)
+            options=self._transposon_options())
 
         summary = cutadapt_summary(process.stdout, padding='   ')
         self._logger.info('Trimmed transposon sequence' + summary)
@@ -152,18 +221,12 @@ class NexteraAligner(Aligner):
     def _trim_nextera(self, read_paths, output_paths):
         """Trims nextera sequences from mates and filters for min length."""
 
-        cutadapt_opts = {
-            '-a': 'CTGTCTCTTATA',
-            '-A': 'CTGTCTCTTATA',
-            '--minimum-length': self._min_length,
-        }
-
         process = cutadapt(
             read_path=read_paths[0],
             read2_path=read_paths[1],
             out_path=output_paths[0],
             out2_path=output_paths[1],
-            options=cutadapt_opts)
+            options=self._nextera_options())
 
         summary = cutadapt_summary(process.stdout, padding='    ')
         self._logger.info('Trimmed nextera sequences and '
@@ -173,9 +236,7 @@ class NexteraAligner(Aligner):
         """Aligns mates to reference using bowtie2."""
 
         self._check_read_paths(read_paths)
-
-        extra_opts = {'--threads': self._threads}
-        options = toolz.merge(self._bowtie_options, extra_opts)
+        options = self._align_options()
 
         # Align reads to genome.
         # logger.info('Aligning to reference')
@@ -189,46 +250,105 @@ class NexteraAligner(Aligner):
             index_path=self._index_path,
             output_path=output_path,
             options=options,
+            sort_order=self._sort_order(),
             verbose=True)
 
-    def extract(self, bam_path):
-        """Extract insertions from alignment."""
+    def _align_options(self):
+        extra_opts = {'--threads': self._threads}
+        return toolz.merge(self._bowtie_options, extra_opts)
 
-        bam_file = pysam.AlignmentFile(str(bam_path))
+    def _sort_order(self):
+        return 'collate' if self._collate else 'coordinate'
 
-        try:
-            summary = AlignmentSummary.from_alignments(
-                iter(bam_file),
-                position_func=self._position_for_mates,
-                sample_func=lambda m1, m2: self._sample_name,
-                min_mapq=self._min_mapq,
-                paired=True)
-        finally:
-            bam_file.close()
+    def trim_and_align(self, read_paths, output_path, work_dir=None):
+        """Trims and aligns mates in a single streamed pipeline.
 
-        if self._merge_distance is not None:
-            summary = summary.merge_within_distance(self._merge_distance)
+        Both trimming steps and the alignment run concurrently, with
+        (interleaved) mates being piped between the steps. If work_dir is
+        given, the trimmed mates of each step are also written to the
+        work directory.
+        """
 
-        insertions = summary.to_insertions(min_support=self._min_support)
+        self._check_read_paths(read_paths)
+        check_interleaved_support()
 
-        yield from insertions
+        transposon_args = cutadapt_stream_args(
+            self._transposon_options(),
+            read_path=read_paths[0],
+            read2_path=read_paths[1])
+        nextera_args = cutadapt_stream_args(self._nextera_options())
+
+        if work_dir is None:
+            input_args = [transposon_args, nextera_args]
+        else:
+            # Also write intermediate outputs to the work directory.
+            suffix = extract_suffix(read_paths[0]).replace('.gz', '')
+            tr_path = work_dir / ('trimmed.transposon.interleaved' + suffix)
+            nt_path = work_dir / ('trimmed.interleaved' + suffix)
+
+            input_args = [
+                transposon_args, ['tee', str(tr_path)],
+                nextera_args, ['tee', str(nt_path)]
+            ]
+
+        processes = bowtie2_piped(
+            input_args,
+            index_path=self._index_path,
+            output_path=output_path,
+            options=self._align_options(),
+            fasta=_is_fasta(read_paths[0]),
+            interleaved=True,
+            sort_order=self._sort_order(),
+            verbose=True)
+
+        # Cutadapt writes its reports to stderr when writing to stdout.
+        transposon_process = processes[0]
+        nextera_process = processes[input_args.index(nextera_args)]
+
+        summary = cutadapt_summary(transposon_process.stderr, padding='   ')
+        self._logger.info('Trimmed transposon sequence' + summary)
+
+        summary = cutadapt_summary(nextera_process.stderr, padding='    ')
+        self._logger.info('Trimmed nextera sequences and '
+                          'filtered for length' + summary)
 
-    @staticmethod
-    def _position_for_mates(mate1, mate2):
-        """Returns transposon/linker positions for given mates."""
+    def extract(self, bam_path, sample_func=None):
+        """Extract insertions from alignment.
 
-        ref = mate1.reference_name
+        By default, all insertions are assigned to the sample given by
+        ``sample_name``. A different ``sample_func`` can be given to
+        assign alignments to samples based on the aligned mates.
+        """
 
-        if mate1.is_reverse:
-            transposon_pos = mate2.reference_start
-            linker_pos = mate1.reference_end
-            strand = 1
+        if sample_func is None:
+            sample_func = partial(_sample_for_mates, self._sample_name)
+
+        if self._collate:
+            mate_counts = Counter()
+            mate_func = partial(iter_collated_mates, counts=mate_counts)
         else:
-            transposon_pos = mate2.reference_end
-            linker_pos = mate1.reference_start
-            strand = -1
+            mate_counts, mate_func = None, None
+
+        summary = ColumnarAlignmentSummary.from_bam(
+            bam_path,
+            position_func=_position_for_mates,
+            sample_func=sample_func,
+            min_mapq=self._min_mapq,
+            paired=True,
+            mate_func=mate_func,
+            processes=self._extract_processes,
+            region_size=self._extract_region_size)
+
+        if mate_counts is not None:
+            self._logger.info('Paired %d mates (%d orphaned mates skipped)',
+                              mate_counts['pairs'], mate_counts['orphans'])
+
+        if self._merge_distance is not None:
+            summary = summary.merge_within_distance(self._merge_distance)
 
-        return (ref, transposon_pos, strand), linker_pos
+        insertions = summary.to_insertions(min_support=self._min_support)
+
+        yield from insertions
 
     def run(self, read_paths, work_dir=None):
         """Runs aligner on given read files."""
@@ -236,20 +356,220 @@ class NexteraAligner(Aligner):
         self._check_read_paths(read_paths)
         suffix = extract_suffix(read_paths[0])
 
-        with WorkDirectory(work_dir, keep=work_dir is not None) as work_dir:
-            # Trim reads and align to reference.
-            trimmed_paths = (work_dir / ('trimmed.R1' + suffix),
-                             work_dir / ('trimmed.R2' + suffix))
-            self.trim(read_paths, trimmed_paths, work_dir=work_dir)
-
-            alignment_path = work_dir / 'alignment.bam'
-            self.align(trimmed_paths, output_path=alignment_path)
+        keep = work_dir is not None
+
+        with WorkDirectory(work_dir, keep=keep) as work_dir:
+            if self._cache is not None:
+                # Re-use cached alignment if available.
+                alignment_path = self._cached_alignment(
+                    read_paths, work_dir=work_dir if keep else None)
+            elif self._stream:
+                # Trim and align reads without intermediate files.
+                alignment_path = work_dir / 'alignment.bam'
+                self.trim_and_align(
+                    read_paths,
+                    output_path=alignment_path,
+                    work_dir=work_dir if keep else None)
+            else:
+                # Trim reads and align to reference.
+                trimmed_paths = (work_dir / ('trimmed.R1' + suffix),
+                                 work_dir / ('trimmed.R2' + suffix))
+                self.trim(read_paths, trimmed_paths, work_dir=work_dir)
+
+                alignment_path = work_dir / 'alignment.bam'
+                self.align(trimmed_paths, output_path=alignment_path)
 
             # Extract insertions.
             insertions = list(self.extract(alignment_path))
 
         return insertions
 
+    def _cached_alignment(self, read_paths, work_dir=None):
+        """Trims and aligns reads, re-using cached outputs if possible."""
+
+        suffix = extract_suffix(read_paths[0])
+
+        trim_inputs = {
+            'reads': [file_stamp(path) for path in read_paths],
+            'transposon': file_digest(self._transposon_path),
+            'transposon_options': self._transposon_options(),
+            'nextera_options': self._nextera_options()
+        }
+
+        align_inputs = {
+            'trim': trim_inputs,
+            'index': [file_stamp(path) for path in bowtie2_index_files(
+                self._index_path)],
+            'options': self._align_options(),
+            'sort_order': self._sort_order()
+        }
+
+        def _trim(*output_paths):
+            self.trim(read_paths, output_paths, work_dir=work_dir)
+
+        def _align(output_path):
+            if self._stream:
+                self.trim_and_align(
+                    read_paths, output_path=output_path, work_dir=work_dir)
+            else:
+                # Trimmed reads are only needed (and cached)
+                # if the alignment itself is not cached.
+                trimmed_paths = self._cache.run(
+                    'trim', trim_inputs,
+                    ['trimmed.R1' + suffix, 'trimmed.R2' + suffix], _trim)
+                self.align(trimmed_paths, output_path=output_path)
+
+        alignment_path, = self._cache.run('align', align_inputs,
+                                          ['alignment.bam'], _align)
+
+        return alignment_path
+
+    def align_pooled(self, read_paths, output_path):
+        """Aligns mates of multiple samples using a single bowtie2 run.
+
+        Read names are tagged with their sample name (as a
+        ``{sample}|{read_name}`` prefix), so that alignments can be assigned
+        to samples during extraction using ``_sample_for_tagged_mates``.
+
+        Parameters
+        ----------
+        read_paths : Dict[str, Tuple[Path, Path]]
+            Dictionary mapping sample names to paths of the (trimmed)
+            mates of the corresponding sample.
+        output_path : Path
+            Output path for the pooled alignment.
+
+        """
+
+        for sample, sample_paths in read_paths.items():
+            if SAMPLE_SEPARATOR in sample:
+                raise ValueError('Sample names cannot contain {!r} ({})'
+                                 .format(SAMPLE_SEPARATOR, sample))
+            self._check_read_paths(sample_paths)
+
+        first_path = next(iter(read_paths.values()))[0]
+
+        bowtie2_stdin(
+            _tagged_read_chunks(read_paths),
+            index_path=self._index_path,
+            output_path=output_path,
+            options=self._align_options(),
+            fasta=_is_fasta(first_path),
+            interleaved=True,
+            sort_order=self._sort_order(),
+            verbose=True)
+
+    def run_pooled(self, read_paths, work_dir=None):
+        """Runs aligner on multiple samples, using a single alignment.
+
+        Reads of each sample are trimmed separately, after which the
+        trimmed reads of all samples are aligned in a single bowtie2
+        run (so that the index is only loaded once). Insertions are then
+        extracted per sample from the pooled alignment.
+
+        Parameters
+        ----------
+        read_paths : Dict[str, Tuple[Path, Path]]
+            Dictionary mapping sample names to the paths of the mates
+            of the corresponding sample.
+        work_dir : Path
+            Optional work directory, which is kept after the run.
+
+        Returns
+        -------
+        List[Insertion]
+            Insertions of all samples, ordered by sample (in the order
+            of read_paths) and by insertion within each sample.
+
+        """
+
+        keep = work_dir is not None
+
+        with WorkDirectory(work_dir, keep=keep) as work_dir:
+            # Trim reads per sample.
+            trimmed_paths = OrderedDict()
+
+            for sample, sample_paths in read_paths.items():
+                self._check_read_paths(sample_paths)
+                suffix = extract_suffix(sample_paths[0])
+
+                sample_dir = work_dir / sample
+                sample_dir.mkdir(exist_ok=True, parents=True)
+
+                self._logger.info('Trimming reads for sample %s', sample)
+
+                trimmed_paths[sample] = (sample_dir / ('trimmed.R1' + suffix),
+                                         sample_dir / ('trimmed.R2' + suffix))
+                self.trim(sample_paths, trimmed_paths[sample],
+                          work_dir=sample_dir)
+
+            # Align pooled reads.
+            alignment_path = work_dir / 'alignment.bam'
+            self.align_pooled(trimmed_paths, output_path=alignment_path)
+
+            # Extract insertions per sample.
+            insertions = list(
+                self.extract(
+                    alignment_path, sample_func=_sample_for_tagged_mates))
+
+        sample_order = {sample: i for i, sample in enumerate(read_paths)}
+        insertions.sort(key=lambda ins: sample_order[ins.sample])
+
+        return insertions
+
+
+def _tagged_read_chunks(read_paths, chunk_size=10000):
+    """Yields chunks of interleaved mates, tagged with their sample."""
+
+    for sample, (read_path, read2_path) in read_paths.items():
+        prefix = sample + SAMPLE_SEPARATOR
+
+        with seqio.open(str(read_path), file2=str(read2_path)) as reads:
+            for chunk in toolz.partition_all(chunk_size, reads):
+                records = []
+
+                for mate1, mate2 in chunk:
+                    records.append((prefix + mate1.name, mate1.sequence,
+                                    mate1.qualities))
+                    records.append((prefix + mate2.name, mate2.sequence,
+                                    mate2.qualities))
+
+                yield format_reads(records)
+
+
+def _sample_for_tagged_mates(mate1, mate2):
+    """Returns the sample for mates whose name is tagged with a sample."""
+    # pylint: disable=unused-argument
+    return mate1.query_name.split(SAMPLE_SEPARATOR, 1)[0]
+
+
+def _is_fasta(read_path):
+    """Checks if given read file is in fasta format."""
+    return any(ext in Path(read_path).suffixes for ext in {'.fa', '.fna'})
+
+
+def _position_for_mates(mate1, mate2):
+    """Returns transposon/linker positions for given mates."""
+
+    ref = mate1.reference_name
+
+    if mate1.is_reverse:
+        transposon_pos = mate2.reference_start
+        linker_pos = mate1.reference_end
+        strand = 1
+    else:
+        transposon_pos = mate2.reference_end
+        linker_pos = mate1.reference_start
+        strand = -1
+
+    return (ref, transposon_pos, strand), linker_pos
+
+
+def _sample_for_mates(sample_name, mate1, mate2):
+    """Returns the (fixed) sample name for given mates."""
+    # pylint: disable=unused-argument
+    return sample_name
+
 
 class NexteraCommand(PairedEndCommand):
     """Command for the Nextera aligner."""
@@ -257,40 +577,107 @@ class NexteraCommand(PairedEndCommand):
     name = 'nextera'
 
     def configure(self, parser):
-        super().configure(parser)
+        # Reads are not required if insertions are extracted from an
+        # existing alignment, so we don't call the base configure here.
+        inputs = parser.add_mutually_exclusive_group(required=True)
+        inputs.add_argument('--reads', nargs=2)
+        inputs.add_argument('--from_bam', '--from-bam', type=Path)
 
-        parser.add_argument('--transposon', type=Path, required=True)
-        parser.add_argument('--bowtie_index', type=Path, required=True)
+        parser.add_argument('--output', required=True, type=Path)
 
         parser.add_argument('--sample_name', required=True)
+        _configure_aligner_args(parser)
+
+        parser.add_argument('--stream', default=False, action='store_true')
+        parser.add_argument('--cache_dir', default=None, type=Path)
+
+        return parser
+
+    def run(self, args):
+        aligner = _aligner_from_args(
+            args,
+            sample_name=args.sample_name,
+            stream=args.stream,
+            cache_dir=args.cache_dir)
+
+        if args.from_bam is not None:
+            # Skip trimming/alignment and extract from given alignment.
+            insertions = list(aligner.extract(args.from_bam))
+        else:
+            insertions = aligner.run(args.reads, work_dir=args.work_dir)
+
+        args.output.parent.mkdir(exist_ok=True, parents=True)
+        Insertion.write(args.output, insertions)
+
 
-        parser.add_argument('--min_length', type=int, default=15)
-        parser.add_argument('--min_support', type=int, default=2)
-        parser.add_argument('--min_mapq', type=int, default=23)
-        parser.add_argument('--merge_distance', type=int, default=None)
+class NexteraPooledCommand(AlignerCommand):
+    """Command for running the Nextera aligner on pooled samples.
 
-        parser.add_argument('--local', default=False, action='store_true')
+    Samples should be given as a tsv file containing ``sample``, ``read1``
+    and ``read2`` columns, listing the paths to the mates of each sample.
+    """
 
-        parser.add_argument('--work_dir', default=None)
-        parser.add_argument('--threads', default=1, type=int)
+    name = 'nextera-pooled'
+
+    def configure(self, parser):
+        parser.add_argument('--samples', required=True, type=Path)
+        parser.add_argument('--output', required=True, type=Path)
+
+        _configure_aligner_args(parser)
 
         return parser
 
     def run(self, args):
-        bowtie_options = {'--local': args.local, '--threads': args.threads}
-
-        aligner = NexteraAligner(
-            transposon_path=args.transposon,
-            bowtie_index_path=args.bowtie_index,
-            min_length=args.min_length,
-            min_support=args.min_support,
-            min_mapq=args.min_mapq,
-            merge_distance=args.merge_distance,
-            bowtie_options=bowtie_options,
-            sample_name=args.sample_name,
-            threads=args.threads)
+        sample_df = pd.read_csv(str(args.samples), sep='\t', dtype=str)
+
+        read_paths = OrderedDict(
+            (sample, (Path(read1), Path(read2)))
+            for sample, read1, read2 in zip(
+                sample_df['sample'], sample_df['read1'], sample_df['read2']))
 
-        insertions = aligner.run(args.reads, work_dir=args.work_dir)
+        aligner = _aligner_from_args(args)
+        insertions = aligner.run_pooled(read_paths, work_dir=args.work_dir)
 
         args.output.parent.mkdir(exist_ok=True, parents=True)
-        Insertion.to_csv(args.output, insertions, sep='\t', index=False)
+        Insertion.write(args.output, insertions)
+
+
+def _configure_aligner_args(parser):
+    """Adds (shared) arguments for Nextera aligner commands."""
+
+    parser.add_argument('--transposon', type=Path, required=True)
+    parser.add_argument('--bowtie_index', type=Path, required=True)
+
+    parser.add_argument('--min_length', type=int, default=15)
+    parser.add_argument('--min_support', type=int, default=2)
+    parser.add_argument('--min_mapq', type=int, default=23)
+    parser.add_argument('--merge_distance', type=int, default=None)
+
+    parser.add_argument('--local', default=False, action='store_true')
+
+    parser.add_argument('--work_dir', default=None)
+    parser.add_argument('--threads', default=1, type=int)
+
+    parser.add_argument('--extract_processes', default=1, type=int)
+    parser.add_argument('--extract_region_size', default=None, type=int)
+    parser.add_argument('--collate', default=False, action='store_true')
+
+
+def _aligner_from_args(args, **kwargs):
+    """Builds Nextera aligner from parsed command line arguments."""
+
+    bowtie_options = {'--local': args.local, '--threads': args.threads}
+
+    return NexteraAligner(
+        transposon_path=args.transposon,
+        bowtie_index_path=args.bowtie_index,
+        min_length=args.min_length,
+        min_support=args.min_support,
+        min_mapq=args.min_mapq,
+        merge_distance=args.merge_distance,
+        bowtie_options=bowtie_options,
+        threads=args.threads,
+        extract_processes=args.extract_processes,
+        extract_region_size=args.extract_region_size,
+        collate=args.collate,
+        **kwargs)
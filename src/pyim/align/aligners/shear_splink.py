@@ -1,27 +1,33 @@
-"""Module containing the ShearSplink pipelines."""
+"""Module containing the ShearSplink aligners."""
 
+from collections import Counter
+from functools import partial
 import logging
 from pathlib import Path
 
 from cutadapt import seqio
 import pandas as pd
-import pysam
 
 from pyim.external.cutadapt import cutadapt, cutadapt_summary
-from pyim.external.bowtie2 import bowtie2
+from pyim.external.bowtie2 import (bowtie2, bowtie2_stdin,
+                                   bowtie2_index_files)
 from pyim.external.util import flatten_arguments
 from pyim.model import Insertion
-from pyim.util.path import shorten_path, extract_suffix
+from pyim.util.cache import StageCache, file_digest, file_stamp
+from pyim.util.path import WorkDirectory, shorten_path, extract_suffix
 
-from .base import Pipeline, register_pipeline
-from ..util import extract_insertions
+from .base import Aligner, SingleEndCommand
+from ..barcode import BarcodeIndex, extract_barcode_mapping
+from ..reads import format_reads
+from ..trim import ShearSplinkTrimmer, trim_reads, trim_summary
+from ..util import ColumnarAlignmentSummary
 
 DEFAULT_OVERLAP = 3
 DEFAULT_ERROR_RATE = 0.1
 
 
-class ShearSplinkPipeline(Pipeline):
-    """ShearSplink pipeline.
+class ShearSplinkAligner(Aligner):
+    """ShearSplink aligner.
 
     Analyzes (single-end) sequencing data that was prepared using the
     ShearSplink protocol. Sequence reads are expected to have the following
@@ -35,7 +41,7 @@ class ShearSplinkPipeline(Pipeline):
     The linker sequence is optional and may be omitted if the linker is not
     included in sequencing.
 
-    The pipeline essentially performs the following steps:
+    The aligner essentially performs the following steps:
 
         - If contaminants are provided, sequence reads are filtered
           (using Cutadapt) for the contaminant sequences.
@@ -47,9 +53,9 @@ class ShearSplinkPipeline(Pipeline):
         - The genomic reads are aligned to the reference genome.
         - The resulting alignment is used to identify insertions.
 
-    Note that this pipeline does **NOT** support multiplexed datasets (which is
+    Note that this aligner does **NOT** support multiplexed datasets (which is
     the default output of the ShearSplink protocol). For multiplexed datasets,
-    use the ``MultiplexedShearSplinkPipeline``.
+    use the ``MultiplexedShearSplinkAligner``.
 
     Parameters
     ----------
@@ -86,6 +92,25 @@ class ShearSplinkPipeline(Pipeline):
         Maximum error rate to use when recognizing transposon, linker and
         contaminant sequences (see Cutadapts documentation for more
         information). Keys should be the same as for ``min_overlaps``.
+    extract_processes : int
+        The number of processes to use for extracting insertions from the
+        alignment. If larger than one, insertions are extracted per contig
+        (or per region of ``extract_region_size`` bp) in parallel.
+    extract_region_size : int
+        Optional size of the genomic regions that are processed in
+        parallel during extraction. Defaults to entire contigs.
+    native_trim : bool
+        Whether to trim reads in-process in a single pass (see
+        ``pyim.align.trim.ShearSplinkTrimmer``), streaming the genomic reads
+        directly to bowtie2, instead of running cutadapt for each step.
+    trim_processes : int
+        The number of processes to use for native trimming.
+    cache_dir : Path
+        Optional directory in which genomic reads and alignments are
+        cached. Cached outputs are keyed by the inputs that produced them
+        (read file, transposon/linker/contaminant sequences and
+        trimming/alignment options), and are re-used by subsequent runs
+        with the same inputs.
 
     """
 
@@ -100,7 +125,12 @@ class ShearSplinkPipeline(Pipeline):
                  merge_distance=None,
                  bowtie_options=None,
                  min_overlaps=None,
-                 error_rates=None):
+                 error_rates=None,
+                 extract_processes=1,
+                 extract_region_size=None,
+                 native_trim=False,
+                 trim_processes=1,
+                 cache_dir=None):
         super().__init__()
 
         self._transposon_path = transposon_path
@@ -119,177 +149,190 @@ class ShearSplinkPipeline(Pipeline):
         self._min_overlaps = min_overlaps or {}
         self._error_rates = error_rates or {}
 
-    @classmethod
-    def configure_args(cls, parser):
-        cls._setup_base_args(parser, paired=False)
+        self._extract_processes = extract_processes
+        self._extract_region_size = extract_region_size
 
-        parser.description = 'ShearSplink pipeline'
+        self._native_trim = native_trim
+        self._trim_processes = trim_processes
 
-        # Paths to various sequences.
-        seq_options = parser.add_argument_group('Sequences')
+        if cache_dir is not None:
+            self._cache = StageCache(cache_dir)
+        else:
+            self._cache = None
 
-        seq_options.add_argument(
-            '--transposon',
-            type=Path,
-            required=True,
-            help='Fasta file containing the transposon sequence.')
+    def run(self, read_path, work_dir=None):
+        """Runs aligner on given read file, returning insertions."""
 
-        seq_options.add_argument(
-            '--contaminants',
-            type=Path,
-            default=None,
-            help='Fasta file containing contaminant sequences.')
+        logger = logging.getLogger()
 
-        seq_options.add_argument(
-            '--linker',
-            type=Path,
-            default=None,
-            help='Fasta file containing the linker sequence.')
+        with WorkDirectory(work_dir, keep=work_dir is not None) as work_dir:
+            # Extract genomic sequences and align to reference.
+            if self._cache is not None:
+                # Re-use cached alignment if available.
+                alignment_path = self._cached_alignment(
+                    read_path, work_dir, logger)
+            else:
+                alignment_path = self._extract_and_align(
+                    read_path, work_dir, logger)
 
-        # Trimming options (used for cutadapt).
-        trim_options = parser.add_argument_group('Trimming')
+            # Extract insertions from bam file.
+            insertions = self.extract(alignment_path, read_path=read_path)
 
-        trim_options.add_argument(
-            '--min_length',
-            type=int,
-            default=15,
-            help='Minimum length for (trimmed) genomic sequences.')
+        return insertions
 
-        trim_options.add_argument(
-            '--contaminant_error',
-            default=0.1,
-            type=float,
-            help='Maximum error rate for matching contaminants.')
+    def extract(self, bam_path, read_path=None):
+        """Extracts insertions from an (existing) alignment.
 
-        trim_options.add_argument(
-            '--contaminant_overlap',
-            default=3,
-            type=int,
-            help='Minimum overlap for matching contaminants.')
+        Parameters
+        ----------
+        bam_path : Path
+            Path to the alignment of the genomic reads.
+        read_path : Path
+            Path to the original reads. Only used by aligners that
+            assign alignments to samples using the reads.
 
-        trim_options.add_argument(
-            '--transposon_error',
-            default=0.1,
-            type=float,
-            help='Maximum error rate for matching the transposon.')
+        Returns
+        -------
+        List[Insertion]
+            Insertions identified from the alignment.
 
-        trim_options.add_argument(
-            '--transposon_overlap',
-            default=3,
-            type=int,
-            help='Minimum overlap for matching the transposon.')
+        """
 
-        trim_options.add_argument(
-            '--linker_error',
-            default=0.1,
-            type=float,
-            help='Maximum error rate for matching the linker.')
+        sample_func = self._sample_func(read_path)
+        return list(self._extract_insertions(bam_path, sample_func))
 
-        trim_options.add_argument(
-            '--linker_overlap',
-            default=3,
-            type=int,
-            help='Minimum overlap for matching the linker.')
+    def _sample_func(self, read_path):
+        """Returns function assigning alignments to samples."""
+        # pylint: disable=unused-argument
+        return partial(_sample_for_alignment, None)
 
-        align_options = parser.add_argument_group('Alignment')
+    def _extract_insertions(self, alignment_path, sample_func):
+        """Extracts insertions from the alignment."""
 
-        align_options.add_argument(
-            '--bowtie_index',
-            type=Path,
-            required=True,
-            help='Bowtie2 index to use for alignment.')
+        summary = ColumnarAlignmentSummary.from_bam(
+            alignment_path,
+            position_func=_process_alignment,
+            sample_func=sample_func,
+            min_mapq=self._min_mapq,
+            processes=self._extract_processes,
+            region_size=self._extract_region_size)
 
-        align_options.add_argument(
-            '--local',
-            default=False,
-            action='store_true',
-            help='Use local alignment.')
+        if self._merge_distance is not None:
+            summary = summary.merge_within_distance(self._merge_distance)
 
-        ins_options = parser.add_argument_group('Insertions')
+        return summary.to_insertions(min_support=self._min_support)
 
-        ins_options.add_argument(
-            '--min_mapq',
-            type=int,
-            default=23,
-            help=('Minimum mapping quality for reads '
-                  'used to identify insertions.'))
+    def _extract_and_align(self, read_path, work_dir, logger):
+        """Extracts genomic sequences and aligns them to the reference."""
 
-        ins_options.add_argument(
-            '--merge_distance',
-            type=int,
-            default=None,
-            help=('Distance within which insertions (from same '
-                  'sample) are merged.'))
+        alignment_path = work_dir / 'alignment.bam'
 
-        ins_options.add_argument(
-            '--min_support',
-            type=int,
-            default=2,
-            help='Minimum support for insertions.')
+        if self._native_trim:
+            self._trim_and_align(read_path, alignment_path, logger)
+        else:
+            genomic_path = work_dir / ('genomic' + extract_suffix(read_path))
+            self._extract_genomic(read_path, genomic_path, work_dir, logger)
+            self._align(genomic_path, alignment_path, logger)
 
-    @classmethod
-    def _extract_args(cls, args):
-        bowtie_options = {'--local': args.local}
+        return alignment_path
 
-        min_overlaps = {
-            'contaminant': args.contaminant_overlap,
-            'transposon': args.transposon_overlap,
-            'linker': args.linker_overlap
+    def _cached_alignment(self, read_path, work_dir, logger):
+        """Extracts and aligns reads, re-using cached outputs if possible."""
+
+        suffix = extract_suffix(read_path)
+
+        trim_inputs = {
+            'reads': file_stamp(read_path),
+            'transposon': file_digest(self._transposon_path),
+            'linker': _optional_digest(self._linker_path),
+            'contaminants': _optional_digest(self._contaminant_path),
+            'options': self._trim_options()
         }
 
-        error_rates = {
-            'contaminant': args.contaminant_error,
-            'transposon': args.transposon_error,
-            'linker': args.linker_error
+        align_inputs = {
+            'trim': trim_inputs,
+            'native_trim': self._native_trim,
+            'index': [file_stamp(path) for path in bowtie2_index_files(
+                self._index_path)],
+            'options': self._bowtie_options
         }
 
-        return dict(
-            transposon_path=args.transposon,
-            bowtie_index_path=args.bowtie_index,
-            linker_path=args.linker,
-            contaminant_path=args.contaminants,
-            min_length=args.min_length,
-            min_support=args.min_support,
-            min_mapq=args.min_mapq,
-            merge_distance=args.merge_distance,
-            bowtie_options=bowtie_options,
-            min_overlaps=min_overlaps,
-            error_rates=error_rates)
+        def _trim(output_path):
+            self._extract_genomic(read_path, output_path, work_dir, logger)
 
-    def run(self, read_path, output_dir, read2_path=None):
-        if read2_path is not None:
-            raise ValueError('Pipeline does not support paired-end data')
+        def _align(output_path):
+            if self._native_trim:
+                self._trim_and_align(read_path, output_path, logger)
+            else:
+                # Genomic reads are only needed (and cached)
+                # if the alignment itself is not cached.
+                genomic_path, = self._cache.run(
+                    'trim', trim_inputs, ['genomic' + suffix], _trim)
+                self._align(genomic_path, output_path, logger)
 
-        logger = logging.getLogger()
+        alignment_path, = self._cache.run('align', align_inputs,
+                                          ['alignment.bam'], _align)
 
-        # Ensure output dir exists.
-        output_dir.mkdir(exist_ok=True, parents=True)
+        return alignment_path
+
+    def _trim_options(self):
+        return {
+            'min_length': self._min_length,
+            'min_overlaps': self._min_overlaps,
+            'error_rates': self._error_rates
+        }
 
-        # Extract genomic sequences and align to reference.
-        genomic_path = self._extract_genomic(read_path, output_dir, logger)
-        alignment_path = self._align(genomic_path, output_dir, logger)
+    def _trim_and_align(self, read_path, output_path, logger):
+        """Trims reads in a single pass, streaming them to bowtie2."""
+
+        # Log parameters
+        if logger is not None:
+            logger.info('Extracting genomic sequences and aligning '
+                        'to reference')
+            logger.info('  %-18s: %s', 'Transposon',
+                        shorten_path(self._transposon_path))
+            logger.info('  %-18s: %s', 'Linker',
+                        shorten_path(self._linker_path))
+            logger.info('  %-18s: %s', 'Contaminants',
+                        shorten_path(self._contaminant_path))
+            logger.info('  %-18s: %s', 'Minimum length', self._min_length)
+            logger.info('  %-18s: %s', 'Reference',
+                        shorten_path(self._index_path))
+            logger.info('  %-18s: %s', 'Bowtie options',
+                        flatten_arguments(self._bowtie_options))
 
-        # Extract insertions from bam file.
-        bam_file = pysam.AlignmentFile(str(alignment_path))
+        trimmer = ShearSplinkTrimmer(
+            transposon_path=self._transposon_path,
+            linker_path=self._linker_path,
+            contaminant_path=self._contaminant_path,
+            min_length=self._min_length,
+            min_overlaps=self._min_overlaps,
+            error_rates=self._error_rates)
 
-        try:
-            insertions = extract_insertions(
-                iter(bam_file),
-                func=_process_alignment,
-                merge_dist=self._merge_distance,
-                min_mapq=self._min_mapq,
-                min_support=self._min_support,
-                logger=logger)
-        finally:
-            bam_file.close()
+        counts = Counter()
 
-        # Write insertions to output file.
-        insertion_path = output_dir / 'insertions.txt'
+        with seqio.open(str(read_path)) as reads:
+            batches = trim_reads(
+                reads,
+                trimmer=trimmer,
+                processes=self._trim_processes,
+                counts=counts)
+
+            bowtie2_stdin(
+                (format_reads(batch) for batch in batches),
+                index_path=self._index_path,
+                output_path=output_path,
+                options=self._bowtie_options,
+                fasta=any(ext in Path(read_path).suffixes
+                          for ext in {'.fa', '.fna'}),
+                verbose=True)
 
-        ins_frame = Insertion.to_frame(insertions)
-        ins_frame.to_csv(str(insertion_path), sep='\t', index=False)
+        if logger is not None:
+            summary = trim_summary(counts, padding='   ')
+            logger.info('Trimmed contaminant, linker and transposon '
+                        'sequences' + summary)
 
-    def _extract_genomic(self, read_path, output_dir, logger):
+    def _extract_genomic(self, read_path, output_path, work_dir, logger):
         """Extracts the genomic part of sequence reads."""
 
         # Log parameters
@@ -311,7 +354,7 @@ class ShearSplinkPipeline(Pipeline):
 
         if self._contaminant_path is not None:
             # Remove contaminants.
-            contaminant_out_path = output_dir / (
+            contaminant_out_path = work_dir / (
                 'trimmed_contaminant' + suffix)
 
             contaminant_opts = {
@@ -334,7 +377,7 @@ class ShearSplinkPipeline(Pipeline):
 
         if self._linker_path is not None:
             # Remove linker.
-            linker_out_path = output_dir / ('trimmed_linker' + suffix)
+            linker_out_path = work_dir / ('trimmed_linker' + suffix)
             linker_opts = {
                 '-a': 'file:' + str(self._linker_path),
                 '--discard-untrimmed': True,
@@ -364,8 +407,7 @@ class ShearSplinkPipeline(Pipeline):
         if self._min_length is not None:
             transposon_opts['--minimum-length'] = self._min_length
 
-        genomic_path = output_dir / ('genomic' + suffix)
-        process = cutadapt(linker_out_path, genomic_path, transposon_opts)
+        process = cutadapt(linker_out_path, output_path, transposon_opts)
 
         if logger is not None:
             summary = cutadapt_summary(process.stdout, padding='   ')
@@ -376,9 +418,7 @@ class ShearSplinkPipeline(Pipeline):
         for file_path in interim_files:
             file_path.unlink()
 
-        return genomic_path
-
-    def _align(self, read_path, output_dir, logger):
+    def _align(self, read_path, output_path, logger):
         """Aligns genomic reads to the reference genome using Bowtie."""
 
         # Log parameters
@@ -389,20 +429,13 @@ class ShearSplinkPipeline(Pipeline):
             logger.info('  %-18s: %s', 'Bowtie options',
                         flatten_arguments(self._bowtie_options))
 
-        alignment_path = output_dir / 'alignment.bam'
-
         bowtie2(
             [read_path],
             index_path=self._index_path,
-            output_path=alignment_path,
+            output_path=output_path,
             options=self._bowtie_options,
             verbose=True)
 
-        return alignment_path
-
-
-register_pipeline(name='shearsplink', pipeline=ShearSplinkPipeline)
-
 
 def _process_alignment(aln):
     """Analyzes an alignment to determine the tranposon/linker breakpoints."""
@@ -420,8 +453,22 @@ def _process_alignment(aln):
     return (ref, transposon_pos, strand), linker_pos
 
 
-class MultiplexedShearSplinkPipeline(ShearSplinkPipeline):
-    """ShearSplink pipeline supporting multiplexed reads.
+def _optional_digest(file_path):
+    """Returns digest of an optional file (or None if not given)."""
+    return file_digest(file_path) if file_path is not None else None
+
+
+def _sample_for_alignment(read_map, aln):
+    """Looks up the sample of an alignment in the given read mapping."""
+
+    if read_map is None:
+        return None
+
+    return read_map.get(aln.query_name, None)
+
+
+class MultiplexedShearSplinkAligner(ShearSplinkAligner):
+    """ShearSplink aligner supporting multiplexed reads.
 
     Analyzes multiplexed (single-end) sequencing data that was prepared using
     the ShearSplink protocol. Sequence reads are expected to have the following
@@ -430,7 +477,7 @@ class MultiplexedShearSplinkPipeline(ShearSplinkPipeline):
         [Barcode][Transposon][Genomic][Linker]
 
     Here, the ``transposon``, ``genomic`` and ``linker`` sequences are the
-    same as for the ``ShearSplinkPipeline``. The ``barcode`` sequence is an
+    same as for the ``ShearSplinkAligner``. The ``barcode`` sequence is an
     index that indicates which sample the read originated for.
 
     Barcode sequences should be provided using the ``barcode_path`` argument.
@@ -448,6 +495,8 @@ class MultiplexedShearSplinkPipeline(ShearSplinkPipeline):
     barcode_mapping : Path
         Path to a tsv file specifying a mapping from barcodes to sample names.
         Should contain ``sample`` and ``barcode`` columns.
+    barcode_mismatches : int
+        Maximum number of mismatches allowed when matching barcodes.
     linker_path : Path
         Path to the linker sequence (fasta).
     contaminant_path : Path
@@ -477,6 +526,23 @@ class MultiplexedShearSplinkPipeline(ShearSplinkPipeline):
         Maximum error rate to use when recognizing transposon, linker and
         contamintant sequences (see Cutadapts documentation for more
         information). Keys should be the same as for ``min_overlaps``.
+    extract_processes : int
+        The number of processes to use for extracting insertions from the
+        alignment.
+    extract_region_size : int
+        Optional size of the genomic regions that are processed in
+        parallel during extraction. Defaults to entire contigs.
+    native_trim : bool
+        Whether to trim reads in-process in a single pass, streaming the
+        genomic reads directly to bowtie2.
+    trim_processes : int
+        The number of processes to use for native trimming.
+    cache_dir : Path
+        Optional directory in which genomic reads and alignments are
+        cached. Cached outputs are keyed by the inputs that produced them
+        (read file, transposon/linker/contaminant sequences and
+        trimming/alignment options), and are re-used by subsequent runs
+        with the same inputs.
 
     """
 
@@ -485,6 +551,7 @@ class MultiplexedShearSplinkPipeline(ShearSplinkPipeline):
                  bowtie_index_path,
                  barcode_path,
                  barcode_mapping=None,
+                 barcode_mismatches=0,
                  linker_path=None,
                  contaminant_path=None,
                  min_length=15,
@@ -493,7 +560,12 @@ class MultiplexedShearSplinkPipeline(ShearSplinkPipeline):
                  merge_distance=0,
                  bowtie_options=None,
                  min_overlaps=None,
-                 error_rates=None):
+                 error_rates=None,
+                 extract_processes=1,
+                 extract_region_size=None,
+                 native_trim=False,
+                 trim_processes=1,
+                 cache_dir=None):
         super().__init__(
             transposon_path=transposon_path,
             bowtie_index_path=bowtie_index_path,
@@ -505,111 +577,286 @@ class MultiplexedShearSplinkPipeline(ShearSplinkPipeline):
             merge_distance=merge_distance,
             bowtie_options=bowtie_options,
             min_overlaps=min_overlaps,
-            error_rates=error_rates)
+            error_rates=error_rates,
+            extract_processes=extract_processes,
+            extract_region_size=extract_region_size,
+            native_trim=native_trim,
+            trim_processes=trim_processes,
+            cache_dir=cache_dir)
 
         self._barcode_path = barcode_path
         self._barcode_mapping = barcode_mapping
+        self._barcode_mismatches = barcode_mismatches
 
-    @classmethod
-    def configure_args(cls, parser):
-        super().configure_args(parser)
+    def _sample_func(self, read_path):
+        if read_path is None:
+            raise ValueError('Reads are required for assigning '
+                             'alignments to samples')
 
-        parser.add_argument('--barcodes', required=True, type=Path)
-        parser.add_argument(
-            '--barcode_mapping', required=False, type=Path, default=None)
+        # Map reads to specific barcodes/samples.
+        logger = logging.getLogger()
+        logger.info('Extracting barcode/sample mapping')
+        logger.info('  %-18s: %s', 'Barcodes',
+                    shorten_path(self._barcode_path))
+        read_map = self._get_barcode_mapping(read_path)
 
-    @classmethod
-    def _extract_args(cls, args):
-        arg_dict = super()._extract_args(args)
+        return partial(_sample_for_alignment, read_map)
 
-        if args.barcode_mapping is not None:
-            map_df = pd.read_csv(args.barcode_mapping, sep='\t')
-            arg_dict['barcode_mapping'] = dict(
-                zip(map_df['barcode'], map_df['sample']))
-        else:
-            arg_dict['barcode_mapping'] = None
+    def _get_barcode_mapping(self, read_path):
+        # Build index of barcode sequences.
+        index = BarcodeIndex.from_fasta(
+            self._barcode_path,
+            barcode_mapping=self._barcode_mapping,
+            mismatches=self._barcode_mismatches)
 
-        arg_dict['barcode_path'] = args.barcodes
+        # Extract read --> barcode mapping.
+        with seqio.open(str(read_path)) as reads:
+            return extract_barcode_mapping(reads, index)
 
-        return arg_dict
 
-    def run(self, read_path, output_dir, read2_path=None):
-        if read2_path is not None:
-            raise ValueError('Pipeline does not support paired-end data')
+class ShearSplinkCommand(SingleEndCommand):
+    """Command for the ShearSplink aligner."""
 
-        logger = logging.getLogger()
+    name = 'shearsplink'
 
-        # Ensure output dir exists.
-        output_dir.mkdir(exist_ok=True, parents=True)
+    def configure(self, parser):
+        # Reads are not required if insertions are extracted from an
+        # existing alignment, so we don't call the base configure here.
+        self._configure_inputs(parser)
+        parser.add_argument('--output', required=True, type=Path)
 
-        # Extract genomic sequences and align to reference.
-        genomic_path = self._extract_genomic(read_path, output_dir, logger)
-        alignment_path = self._align(genomic_path, output_dir, logger)
+        parser.description = 'ShearSplink aligner'
+        parser.add_argument('--work_dir', default=None, type=Path)
+        parser.add_argument('--cache_dir', default=None, type=Path)
 
-        # Map reads to specific barcodes/samples.
-        logger.info('Extracting barcode/sample mapping')
-        logger.info('  %-18s: %s', 'Barcodes',
-                    shorten_path(self._barcode_path))
-        read_map = self._get_barcode_mapping(read_path)
+        # Paths to various sequences.
+        seq_options = parser.add_argument_group('Sequences')
 
-        # Extract insertions from bam file.
-        bam_file = pysam.AlignmentFile(str(alignment_path))
+        seq_options.add_argument(
+            '--transposon',
+            type=Path,
+            required=True,
+            help='Fasta file containing the transposon sequence.')
 
-        try:
-            insertions = extract_insertions(
-                iter(bam_file),
-                func=_process_alignment,
-                group_func=lambda aln: read_map.get(aln.query_name, None),
-                merge_dist=self._merge_distance,
-                min_mapq=self._min_mapq,
-                min_support=self._min_support,
-                logger=logger)
-        finally:
-            bam_file.close()
+        seq_options.add_argument(
+            '--contaminants',
+            type=Path,
+            default=None,
+            help='Fasta file containing contaminant sequences.')
 
-        # Write insertions to output file.
-        insertion_path = output_dir / 'insertions.txt'
+        seq_options.add_argument(
+            '--linker',
+            type=Path,
+            default=None,
+            help='Fasta file containing the linker sequence.')
 
-        ins_frame = Insertion.to_frame(insertions)
-        ins_frame.to_csv(str(insertion_path), sep='\t', index=False)
+        # Trimming options (used for cutadapt).
+        trim_options = parser.add_argument_group('Trimming')
 
-    def _get_barcode_mapping(self, read_path):
-        # Read barcode sequences.
-        with seqio.open(str(self._barcode_path)) as barcode_file:
-            barcodes = list(barcode_file)
+        trim_options.add_argument(
+            '--min_length',
+            type=int,
+            default=15,
+            help='Minimum length for (trimmed) genomic sequences.')
 
-        # Extract read --> barcode mapping.
-        with seqio.open(str(read_path)) as reads:
-            return _extract_barcode_mapping(reads, barcodes,
-                                            self._barcode_mapping)
+        trim_options.add_argument(
+            '--contaminant_error',
+            default=0.1,
+            type=float,
+            help='Maximum error rate for matching contaminants.')
+
+        trim_options.add_argument(
+            '--contaminant_overlap',
+            default=3,
+            type=int,
+            help='Minimum overlap for matching contaminants.')
 
+        trim_options.add_argument(
+            '--transposon_error',
+            default=0.1,
+            type=float,
+            help='Maximum error rate for matching the transposon.')
 
-register_pipeline(
-    name='shearsplink-multiplexed', pipeline=MultiplexedShearSplinkPipeline)
+        trim_options.add_argument(
+            '--transposon_overlap',
+            default=3,
+            type=int,
+            help='Minimum overlap for matching the transposon.')
 
+        trim_options.add_argument(
+            '--linker_error',
+            default=0.1,
+            type=float,
+            help='Maximum error rate for matching the linker.')
 
-def _extract_barcode_mapping(reads, barcodes, barcode_mapping=None):
+        trim_options.add_argument(
+            '--linker_overlap',
+            default=3,
+            type=int,
+            help='Minimum overlap for matching the linker.')
 
-    # Create barcode/sample dict.
-    barcode_dict = {bc.name: bc.sequence for bc in barcodes}
+        trim_options.add_argument(
+            '--native_trim',
+            default=False,
+            action='store_true',
+            help=('Trim reads in a single in-process pass, streaming '
+                  'genomic reads directly to bowtie2.'))
+
+        trim_options.add_argument(
+            '--trim_processes',
+            default=1,
+            type=int,
+            help='Number of processes to use for native trimming.')
+
+        align_options = parser.add_argument_group('Alignment')
+
+        align_options.add_argument(
+            '--bowtie_index',
+            type=Path,
+            required=True,
+            help='Bowtie2 index to use for alignment.')
 
-    if barcode_mapping is not None:
-        barcode_dict = {sample: barcode_dict[barcode]
-                        for barcode, sample in barcode_mapping.items()}
+        align_options.add_argument(
+            '--local',
+            default=False,
+            action='store_true',
+            help='Use local alignment.')
 
-    # Build mapping.
-    mapping = {}
+        ins_options = parser.add_argument_group('Insertions')
 
-    for read in reads:
-        # Check each barcode for match in read.
-        matched = [k for k, v in barcode_dict.items() if v in read.sequence]
+        ins_options.add_argument(
+            '--min_mapq',
+            type=int,
+            default=23,
+            help=('Minimum mapping quality for reads '
+                  'used to identify insertions.'))
+
+        ins_options.add_argument(
+            '--merge_distance',
+            type=int,
+            default=None,
+            help=('Distance within which insertions (from same '
+                  'sample) are merged.'))
+
+        ins_options.add_argument(
+            '--min_support',
+            type=int,
+            default=2,
+            help='Minimum support for insertions.')
+
+        ins_options.add_argument(
+            '--extract_processes',
+            type=int,
+            default=1,
+            help=('Number of processes to use for extracting '
+                  'insertions from the alignment.'))
+
+        ins_options.add_argument(
+            '--extract_region_size',
+            type=int,
+            default=None,
+            help=('Size of the regions that are processed in parallel '
+                  'during extraction (defaults to entire contigs).'))
+
+        return parser
+
+    @staticmethod
+    def _configure_inputs(parser):
+        inputs = parser.add_mutually_exclusive_group(required=True)
+        inputs.add_argument('--reads', type=Path)
+        inputs.add_argument('--from_bam', '--from-bam', type=Path)
+
+    def run(self, args):
+        aligner = self._build_aligner(args)
+
+        if args.from_bam is not None:
+            # Skip trimming/alignment and extract from given alignment.
+            insertions = aligner.extract(args.from_bam, read_path=args.reads)
+        else:
+            insertions = aligner.run(args.reads, work_dir=args.work_dir)
+
+        args.output.parent.mkdir(exist_ok=True, parents=True)
+        Insertion.write(args.output, insertions)
+
+    @classmethod
+    def _build_aligner(cls, args):
+        return ShearSplinkAligner(**cls._aligner_kwargs(args))
+
+    @classmethod
+    def _aligner_kwargs(cls, args):
+        bowtie_options = {'--local': args.local}
+
+        min_overlaps = {
+            'contaminant': args.contaminant_overlap,
+            'transposon': args.transposon_overlap,
+            'linker': args.linker_overlap
+        }
+
+        error_rates = {
+            'contaminant': args.contaminant_error,
+            'transposon': args.transposon_error,
+            'linker': args.linker_error
+        }
+
+        return dict(
+            transposon_path=args.transposon,
+            bowtie_index_path=args.bowtie_index,
+            linker_path=args.linker,
+            contaminant_path=args.contaminants,
+            min_length=args.min_length,
+            min_support=args.min_support,
+            min_mapq=args.min_mapq,
+            merge_distance=args.merge_distance,
+            bowtie_options=bowtie_options,
+            min_overlaps=min_overlaps,
+            error_rates=error_rates,
+            extract_processes=args.extract_processes,
+            extract_region_size=args.extract_region_size,
+            native_trim=args.native_trim,
+            trim_processes=args.trim_processes,
+            cache_dir=args.cache_dir)
+
+
+class MultiplexedShearSplinkCommand(ShearSplinkCommand):
+    """Command for the multiplexed ShearSplink aligner."""
+
+    name = 'shearsplink-multiplexed'
+
+    def configure(self, parser):
+        super().configure(parser)
+
+        parser.description = 'Multiplexed ShearSplink aligner'
+
+        parser.add_argument('--barcodes', required=True, type=Path)
+        parser.add_argument(
+            '--barcode_mapping', required=False, type=Path, default=None)
+        parser.add_argument('--barcode_mismatches', type=int, default=0)
+
+        return parser
+
+    @staticmethod
+    def _configure_inputs(parser):
+        # Reads are also required when extracting insertions from an
+        # existing alignment, as samples are identified by their barcodes.
+        parser.add_argument('--reads', required=True, type=Path)
+        parser.add_argument('--from_bam', '--from-bam', type=Path)
+
+    @classmethod
+    def _build_aligner(cls, args):
+        return MultiplexedShearSplinkAligner(**cls._aligner_kwargs(args))
+
+    @classmethod
+    def _aligner_kwargs(cls, args):
+        kwargs = super()._aligner_kwargs(args)
+
+        if args.barcode_mapping is not None:
+            map_df = pd.read_csv(args.barcode_mapping, sep='\t')
+            kwargs['barcode_mapping'] = dict(
+                zip(map_df['barcode'], map_df['sample']))
+        else:
+            kwargs['barcode_mapping'] = None
 
-        if len(matched) == 1:
-            # Record single matches.
-            name = read.name.split()[0]
-            mapping[name] = matched[0]
-        elif len(matched) > 1:
-            logging.warning('Skipping %s due to multiple matching barcodes',
-                            read.name.split()[0])
+        kwargs['barcode_path'] = args.barcodes
+        kwargs['barcode_mismatches'] = args.barcode_mismatches
 
-    return mapping
+        return kwargs
@@ -0,0 +1,402 @@
+"""Module providing fast matching of barcodes in sequence reads.
+
+Barcodes are matched using a hash of (barcode-length) k-mers, which
+allows all barcodes to be matched in a single scan of each read,
+independent of the number of barcodes.
+"""
+
+from collections import Counter, defaultdict
+from functools import partial
+import gzip
+from itertools import combinations, product
+import logging
+from multiprocessing import Pool
+
+from cutadapt import seqio
+import toolz
+
+from pyim.util.path import extract_suffix
+from pyim.util.pool import imap_bounded
+
+from .reads import format_reads
+
+BASES = 'ACGTN'
+
+# Maximum number of (variant) sequences for which barcodes are matched by
+# searching for each sequence separately, which is faster than scanning
+# all k-mers of a read when there are only a few sequences to search for.
+SEARCH_THRESHOLD = 16
+
+# Compression level used for compressed de-multiplexed outputs.
+COMPRESS_LEVEL = 6
+
+
+class BarcodeIndex(object):
+    """Index for matching barcodes within sequence reads.
+
+    Barcodes are indexed by sequence (together with all sequences within
+    the allowed Hamming distance), after which barcodes are matched by
+    looking up all k-mers of a read in the index. Barcodes are matched
+    anywhere in the read, similar to checking ``barcode in sequence``.
+
+    Parameters
+    ----------
+    barcodes : Dict[str, str]
+        Dictionary mapping barcode names to barcode sequences.
+    mismatches : int
+        Maximum number of mismatches (Hamming distance) allowed
+        when matching barcodes.
+
+    """
+
+    def __init__(self, barcodes, mismatches=0):
+        if mismatches < 0:
+            raise ValueError('Number of mismatches should be non-negative')
+
+        self._barcodes = dict(barcodes)
+        self._mismatches = mismatches
+
+        self._index = defaultdict(set)
+
+        for name, sequence in self._barcodes.items():
+            for variant in _hamming_variants(sequence.upper(), mismatches):
+                self._index[variant].add(name)
+
+        self._index = {key: frozenset(value)
+                       for key, value in self._index.items()}
+        self._keys = frozenset(self._index)
+        self._lengths = sorted({len(seq) for seq in self._index})
+
+    @classmethod
+    def from_fasta(cls, fasta_path, barcode_mapping=None, mismatches=0):
+        """Builds index from barcode sequences in a fasta file.
+
+        Parameters
+        ----------
+        fasta_path : Path
+            Path to barcode sequences (fasta).
+        barcode_mapping : Dict[str, str]
+            Optional mapping from barcode names to sample names. If given,
+            matches are reported using the sample names, and barcodes that
+            are not included in the mapping are ignored.
+        mismatches : int
+            Maximum number of mismatches allowed when matching barcodes.
+
+        """
+
+        with seqio.open(str(fasta_path)) as barcode_file:
+            barcodes = {bc.name: bc.sequence for bc in barcode_file}
+
+        if barcode_mapping is not None:
+            barcodes = {sample: barcodes[barcode]
+                        for barcode, sample in barcode_mapping.items()}
+
+        return cls(barcodes, mismatches=mismatches)
+
+    @property
+    def names(self):
+        """Names of the indexed barcodes."""
+        return list(self._barcodes.keys())
+
+    @property
+    def mismatches(self):
+        """Maximum number of mismatches allowed when matching."""
+        return self._mismatches
+
+    def match(self, sequence):
+        """Returns names of barcodes that occur in given sequence.
+
+        Parameters
+        ----------
+        sequence : str
+            Sequence to match against.
+
+        Returns
+        -------
+        Set[str]
+            Names of the barcodes that were found in the sequence.
+
+        """
+
+        sequence = sequence.upper()
+        matched = set()
+
+        for key in self._matching_keys(sequence):
+            matched |= self._index[key]
+
+        return matched
+
+    def locate(self, sequence):
+        """Locates the first occurrence of each barcode in given sequence.
+
+        Parameters
+        ----------
+        sequence : str
+            Sequence to match against.
+
+        Returns
+        -------
+        Dict[str, Tuple[int, int]]
+            Dictionary mapping names of the matched barcodes to
+            the (start, end) positions of their first match.
+
+        """
+
+        sequence = sequence.upper()
+        located = {}
+
+        for key in self._matching_keys(sequence):
+            start = sequence.find(key)
+
+            for name in self._index[key]:
+                if name not in located or located[name][0] > start:
+                    located[name] = (start, start + len(key))
+
+        return located
+
+    def _matching_keys(self, sequence):
+        """Returns indexed sequences that occur in given sequence."""
+
+        if len(self._keys) <= SEARCH_THRESHOLD:
+            return [key for key in self._keys if key in sequence]
+
+        matched = []
+
+        for length in self._lengths:
+            kmers = {sequence[i:i + length]
+                     for i in range(len(sequence) - length + 1)}
+            matched.extend(kmers & self._keys)
+
+        return matched
+
+
+def _hamming_variants(sequence, max_distance):
+    """Yields all sequences within max_distance of given sequence."""
+
+    yield sequence
+
+    for distance in range(1, max_distance + 1):
+        for positions in combinations(range(len(sequence)), distance):
+            options = [[base for base in BASES if base != sequence[pos]]
+                       for pos in positions]
+
+            for bases in product(*options):
+                variant = list(sequence)
+
+                for pos, base in zip(positions, bases):
+                    variant[pos] = base
+
+                yield ''.join(variant)
+
+
+def extract_barcode_mapping(reads, index):
+    """Maps reads to barcodes (or samples) using given barcode index.
+
+    Reads matching multiple barcodes are skipped with a warning.
+
+    Parameters
+    ----------
+    reads : Iterable[cutadapt.seqio.Sequence]
+        Reads to map.
+    index : BarcodeIndex
+        Index of the barcodes to match.
+
+    Returns
+    -------
+    Dict[str, str]
+        Dictionary mapping read names to barcode (or sample) names.
+
+    """
+
+    mapping = {}
+
+    for read in reads:
+        matched = index.match(read.sequence)
+
+        if len(matched) == 1:
+            # Record single matches.
+            name = read.name.split()[0]
+            mapping[name] = matched.pop()
+        elif len(matched) > 1:
+            logging.warning('Skipping %s due to multiple matching barcodes',
+                            read.name.split()[0])
+
+    return mapping
+
+
+def demultiplex_reads(read_path,
+                      output_dir,
+                      index,
+                      read2_path=None,
+                      processes=1,
+                      chunk_size=50000,
+                      compress=None,
+                      counts=None):
+    """De-multiplexes reads into separate files per barcode (or sample).
+
+    Reads are assigned to a barcode if they match exactly one barcode.
+    Similar to de-multiplexing using cutadapt, matched barcodes (and any
+    preceding sequence) are trimmed from the reads. For paired-end data,
+    barcodes are matched (and trimmed) in the first mate and both mates
+    are written to separate R1/R2 files per barcode.
+
+    Reads are processed in chunks of records, which are matched and
+    formatted (and compressed) on a pool of worker processes. Compressed
+    outputs are written as a series of gzip members (one per chunk),
+    which together form a valid gzip file.
+
+    Parameters
+    ----------
+    read_path : Path
+        Path to the input reads file (in fasta/fastq format).
+    output_dir : Path
+        Output directory to which the de-multiplexed files will be written.
+    index : BarcodeIndex
+        Index of the barcodes to match.
+    read2_path : Path
+        Path to the second mates (for paired-end data).
+    processes : int
+        Number of worker processes to use. If 1, reads are processed
+        within the current process.
+    chunk_size : int
+        Number of reads (or pairs) per chunk.
+    compress : bool
+        Whether to gzip-compress the outputs. Defaults to compressing
+        if the input is compressed.
+    counts : collections.Counter
+        Optional counter, which is updated with the number of reads
+        written per barcode (or sample), the number of reads without
+        barcode (``unmatched``) and with multiple barcodes (``ambiguous``).
+
+    Returns
+    -------
+    Dict[str, Union[Path, Tuple[Path, Path]]]
+        Dictionary mapping barcodes (or samples) to the respective
+        de-multiplexed file (or files, for paired-end data).
+
+    """
+
+    output_dir.mkdir(exist_ok=True, parents=True)
+
+    # Determine output paths.
+    suffix = extract_suffix(read_path)
+
+    if compress is None:
+        compress = suffix.endswith('.gz')
+
+    suffix = suffix.replace('.gz', '') + ('.gz' if compress else '')
+
+    if read2_path is None:
+        output_paths = {name: output_dir / (name + suffix)
+                        for name in index.names}
+    else:
+        output_paths = {name: (output_dir / (name + '.R1' + suffix),
+                               output_dir / (name + '.R2' + suffix))
+                        for name in index.names}
+
+    # Read and demultiplex chunks of reads.
+    if read2_path is None:
+        reader = seqio.open(str(read_path))
+    else:
+        reader = seqio.open(str(read_path), file2=str(read2_path))
+
+    handles = {}
+
+    try:
+        for name, paths in output_paths.items():
+            paths = [paths] if read2_path is None else paths
+            handles[name] = [path.open('wb') for path in paths]
+
+        with reader as reads:
+            chunks = (_to_records(chunk, paired=read2_path is not None)
+                      for chunk in toolz.partition_all(chunk_size, reads))
+
+            for chunk_outputs, chunk_counts in _map_chunks(
+                    chunks, index, compress=compress, processes=processes):
+                for name, outputs in chunk_outputs.items():
+                    for handle, data in zip(handles[name], outputs):
+                        handle.write(data)
+
+                if counts is not None:
+                    counts.update(chunk_counts)
+    finally:
+        for name_handles in handles.values():
+            for handle in name_handles:
+                if compress and handle.tell() == 0:
+                    # Write an empty member to produce a valid gzip file.
+                    handle.write(gzip.compress(b''))
+                handle.close()
+
+    return output_paths
+
+
+def _to_records(reads, paired=False):
+    if paired:
+        return [((r1.name, r1.sequence, r1.qualities),
+                 (r2.name, r2.sequence, r2.qualities)) for r1, r2 in reads]
+    return [((read.name, read.sequence, read.qualities), ) for read in reads]
+
+
+def _map_chunks(chunks, index, compress, processes=1):
+    if processes == 1:
+        yield from (_demultiplex_chunk(
+            chunk, index=index, compress=compress) for chunk in chunks)
+    else:
+        pool = Pool(
+            processes, initializer=_init_worker, initargs=(index, ))
+
+        try:
+            # Limit the number of chunks in flight, as the writer may
+            # consume chunks more slowly than they are demultiplexed.
+            func = partial(_demultiplex_chunk, compress=compress)
+            yield from imap_bounded(
+                pool, func, chunks, max_pending=2 * processes)
+        finally:
+            pool.terminate()
+
+
+_WORKER_INDEX = None
+
+
+def _init_worker(index):
+    global _WORKER_INDEX  # pylint: disable=global-statement
+    _WORKER_INDEX = index
+
+
+def _demultiplex_chunk(chunk, index=None, compress=False):
+    """Demultiplexes a chunk of reads, returning formatted outputs."""
+
+    index = index or _WORKER_INDEX
+
+    counts = Counter()
+    matched = defaultdict(list)
+
+    for record in chunk:
+        name, sequence, qualities = record[0]
+        located = index.locate(sequence)
+
+        if len(located) == 1:
+            barcode, (_, end) = located.popitem()
+
+            # Trim barcode from the first read.
+            qualities = qualities[end:] if qualities is not None else None
+            trimmed = (name, sequence[end:], qualities)
+
+            matched[barcode].append((trimmed, ) + record[1:])
+            counts[barcode] += 1
+        elif len(located) > 1:
+            counts['ambiguous'] += 1
+        else:
+            counts['unmatched'] += 1
+
+    outputs = {}
+    for barcode, records in matched.items():
+        data = [format_reads(mates) for mates in zip(*records)]
+
+        if compress:
+            data = [gzip.compress(item, compresslevel=COMPRESS_LEVEL)
+                    for item in data]
+
+        outputs[barcode] = data
+
+    return outputs, counts
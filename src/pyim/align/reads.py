@@ -0,0 +1,20 @@
+"""Module providing helper functions for handling sequence reads.
+
+Reads are represented as plain (name, sequence, qualities) tuples, so that
+this module does not depend on any of cutadapt's internal classes.
+"""
+
+
+def format_reads(reads):
+    """Formats (name, sequence, qualities) tuples as fastq/fasta records."""
+
+    records = []
+
+    for name, sequence, qualities in reads:
+        if qualities is None:
+            records.append('>{}\n{}\n'.format(name, sequence))
+        else:
+            records.append('@{}\n{}\n+\n{}\n'.format(name, sequence,
+                                                      qualities))
+
+    return ''.join(records).encode()
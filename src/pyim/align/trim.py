@@ -0,0 +1,288 @@
+"""Module providing in-process (single-pass) trimming of sequence reads.
+
+Reads are matched using cutadapt's adapter classes, giving the same
+error rate/overlap semantics as running cutadapt from the command line.
+"""
+
+from collections import Counter
+from multiprocessing import Pool
+
+from cutadapt.adapters import AdapterParser
+from cutadapt.seqio import Sequence
+import toolz
+
+from pyim.util.pool import imap_bounded
+
+DEFAULT_OVERLAP = 3
+DEFAULT_ERROR_RATE = 0.1
+
+# Trimming statuses, in the order in which they are reported.
+TRIM_STATUSES = [('contaminant', 'Reads with contaminants'),
+                 ('no_linker', 'Reads without linker'),
+                 ('too_short', 'Reads that were too short'),
+                 ('no_transposon', 'Reads without transposon'),
+                 ('written', 'Reads written (passing filters)')]
+
+
+class ShearSplinkTrimmer(object):
+    """Trims ShearSplink reads to their genomic sequences in a single pass.
+
+    For each read, the trimmer performs the following steps:
+
+        - Reads containing any of the contaminant sequences are discarded
+          (equivalent to cutadapt's ``-g`` with ``--discard-trimmed``).
+        - The linker sequence is trimmed from the 3' end of the read,
+          discarding reads without the linker (``-a`` with
+          ``--discard-untrimmed``).
+        - The transposon sequence is trimmed from the 5' end of the read
+          (``-g`` with ``--discard-untrimmed``). Reads that are shorter than
+          the minimum length after trimming are discarded.
+
+    Contaminant and linker steps are skipped if no contaminant or linker
+    sequences are given.
+
+    Parameters
+    ----------
+    transposon_path : Path
+        Path to the (flanking) transposon sequence (fasta).
+    linker_path : Path
+        Path to the linker sequence (fasta).
+    contaminant_path : Path
+        Path to file containing contaminant sequences (fasta).
+    min_length : int
+        Minimum length for genomic reads to be kept for alignment.
+    min_overlaps : Dict[str, int]
+        Minimum overlap required to recognize the transposon, linker and
+        contaminant sequences. Keys should be one of the following:
+        ``linker``, ``transposon`` or ``contaminant``.
+    error_rates : Dict[str, float]
+        Maximum error rate to use when recognizing transposon, linker and
+        contaminant sequences. Keys should be the same as for
+        ``min_overlaps``.
+
+    """
+
+    def __init__(self,
+                 transposon_path,
+                 linker_path=None,
+                 contaminant_path=None,
+                 min_length=15,
+                 min_overlaps=None,
+                 error_rates=None):
+        self._transposon_path = transposon_path
+        self._linker_path = linker_path
+        self._contaminant_path = contaminant_path
+
+        self._min_length = min_length
+
+        self._min_overlaps = min_overlaps or {}
+        self._error_rates = error_rates or {}
+
+        self._build_adapters()
+
+    def __getstate__(self):
+        # Adapters wrap compiled aligners, which cannot be pickled. We
+        # therefore only pickle the configuration and rebuild the adapters.
+        state = dict(self.__dict__)
+
+        for key in ['_contaminants', '_linkers', '_transposons']:
+            del state[key]
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_adapters()
+
+    def _build_adapters(self):
+        self._contaminants = self._parse_adapters(
+            self._contaminant_path, name='contaminant', where='front')
+        self._linkers = self._parse_adapters(
+            self._linker_path, name='linker', where='back')
+        self._transposons = self._parse_adapters(
+            self._transposon_path, name='transposon', where='front')
+
+    def _parse_adapters(self, fasta_path, name, where):
+        if fasta_path is None:
+            return []
+
+        parser = AdapterParser(
+            max_error_rate=self._error_rates.get(name, DEFAULT_ERROR_RATE),
+            min_overlap=self._min_overlaps.get(name, DEFAULT_OVERLAP))
+
+        return list(parser.parse('file:' + str(fasta_path), where))
+
+    def trim_read(self, read):
+        """Trims a single read.
+
+        Parameters
+        ----------
+        read : cutadapt.seqio.Sequence
+            Read to trim.
+
+        Returns
+        -------
+        Tuple[Sequence, str]
+            Tuple containing the trimmed read (None if the read was
+            discarded) and the status of the read, which is one of the
+            statuses listed in ``TRIM_STATUSES``.
+
+        """
+
+        if self._contaminants:
+            if _best_match(self._contaminants, read) is not None:
+                return None, 'contaminant'
+
+        if self._linkers:
+            match = _best_match(self._linkers, read)
+
+            if match is None:
+                return None, 'no_linker'
+
+            read = match.adapter.trimmed(match)
+
+        match = _best_match(self._transposons, read)
+
+        if match is not None:
+            read = match.adapter.trimmed(match)
+
+        # Length is checked before the presence of the transposon,
+        # as is done by cutadapt when counting filtered reads.
+        if self._min_length is not None and len(read) < self._min_length:
+            return None, 'too_short'
+
+        if match is None:
+            return None, 'no_transposon'
+
+        return read, 'written'
+
+    def trim(self, reads, counts=None):
+        """Trims reads, yielding reads that pass all trimming steps.
+
+        Parameters
+        ----------
+        reads : Iterable[cutadapt.seqio.Sequence]
+            Reads to trim.
+        counts : collections.Counter
+            Optional counter, which is updated with the number of
+            processed reads (``total``) and the number of reads
+            per trimming status.
+
+        """
+
+        for read in reads:
+            trimmed, status = self.trim_read(read)
+
+            if counts is not None:
+                counts['total'] += 1
+                counts[status] += 1
+
+            if trimmed is not None:
+                yield trimmed
+
+
+def _best_match(adapters, read):
+    """Returns best match of adapters to read (as in cutadapt)."""
+
+    best = None
+
+    for adapter in adapters:
+        match = adapter.match_to(read)
+
+        if match is not None and (best is None or
+                                  match.matches > best.matches):
+            best = match
+
+    return best
+
+
+def trim_reads(reads, trimmer, processes=1, batch_size=10000, counts=None):
+    """Trims reads in batches using a pool of worker processes.
+
+    Parameters
+    ----------
+    reads : Iterable[cutadapt.seqio.Sequence]
+        Reads to trim.
+    trimmer : ShearSplinkTrimmer
+        Trimmer used to trim the reads.
+    processes : int
+        Number of worker processes to use. If 1, reads are trimmed
+        within the current process.
+    batch_size : int
+        Number of reads per batch. When using multiple processes, at most
+        two batches per process are read ahead of the consumer, so that
+        reads are not accumulated in memory if the consumer (for example
+        the aligner) is slower than trimming.
+    counts : collections.Counter
+        Optional counter, which is updated with the trimming statistics
+        (see ``ShearSplinkTrimmer.trim``).
+
+    Yields
+    ------
+    List[Tuple[str, str, str]]
+        Batches of trimmed reads, in the same order as the input reads.
+        Reads are given as (name, sequence, qualities) tuples.
+
+    """
+
+    batches = (_to_tuples(batch)
+               for batch in toolz.partition_all(batch_size, reads))
+
+    if processes == 1:
+        results = (_trim_batch(batch, trimmer=trimmer) for batch in batches)
+        yield from _collect_counts(results, counts)
+    else:
+        pool = Pool(
+            processes, initializer=_init_worker, initargs=(trimmer, ))
+
+        try:
+            results = imap_bounded(
+                pool, _trim_batch, batches, max_pending=2 * processes)
+            yield from _collect_counts(results, counts)
+        finally:
+            pool.terminate()
+
+
+def _collect_counts(results, counts):
+    for trimmed, batch_counts in results:
+        if counts is not None:
+            counts.update(batch_counts)
+        yield trimmed
+
+
+_WORKER_TRIMMER = None
+
+
+def _init_worker(trimmer):
+    global _WORKER_TRIMMER  # pylint: disable=global-statement
+    _WORKER_TRIMMER = trimmer
+
+
+def _trim_batch(batch, trimmer=None):
+    trimmer = trimmer or _WORKER_TRIMMER
+
+    counts = Counter()
+    reads = (Sequence(*tup) for tup in batch)
+    trimmed = _to_tuples(trimmer.trim(reads, counts=counts))
+
+    return trimmed, counts
+
+
+def _to_tuples(reads):
+    return [(read.name, read.sequence, read.qualities) for read in reads]
+
+
+def trim_summary(counts, padding=''):
+    """Formats trimming counts into a summary (similar to cutadapt)."""
+
+    total = counts.get('total', 0)
+    lines = ['{:<35}{:>12,}'.format('Total reads processed:', total)]
+
+    for status, label in TRIM_STATUSES:
+        count = counts.get(status, 0)
+        fraction = (count / total) * 100 if total > 0 else 0.0
+        lines.append('{:<35}{:>12,} ({:.1f}%)'.format(label + ':', count,
+                                                       fraction))
+
+    delim = '\n' + padding
+    return padding + delim.join([''] + lines)
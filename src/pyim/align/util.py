@@ -1,9 +1,14 @@
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from itertools import groupby, chain
+from multiprocessing import Pool
+from pathlib import Path
 
 import numpy as np
+import pandas as pd
+import pysam
+import toolz
 
-from pyim.model import Insertion
+from pyim.model import Insertion, InsertionTable
 from pyim.vendor.frozendict import frozendict
 
 
@@ -25,20 +30,24 @@ class AlignmentSummary(object):
                         sample_func,
                         paired=False,
                         min_mapq=30,
-                        primary=True):
-        """Constructs alignment summary from the given alignments."""
-
-        # Optionally filter alignments.
-        if primary:
-            alignments = (aln for aln in alignments if not aln.is_secondary)
-
-        if min_mapq is not None:
-            alignments = (aln for aln in alignments
-                          if aln.mapping_quality >= min_mapq)
-
-        # Generate position/sample summaries.
-        iter_func = cls._iter_paired if paired else cls._iter_single
-        summaries = iter_func(alignments, position_func, sample_func)
+                        primary=True,
+                        mate_func=None):
+        """Constructs alignment summary from the given alignments.
+
+        For paired-end data, mates are paired using ``mate_func``, which
+        defaults to ``iter_mates``. For name-collated alignments, the
+        ``iter_collated_mates`` function can be used to pair mates
+        using constant memory.
+        """
+
+        summaries = cls._iter_summaries(
+            alignments,
+            position_func=position_func,
+            sample_func=sample_func,
+            paired=paired,
+            min_mapq=min_mapq,
+            primary=primary,
+            mate_func=mate_func)
 
         # Track alignment positions per sample. Each entry tracks positions
         # for a specific sample. Note that this dict contains two layers:
@@ -56,9 +65,38 @@ class AlignmentSummary(object):
 
         return cls(dict(alignment_map))
 
+    @classmethod
+    def _iter_summaries(cls,
+                        alignments,
+                        position_func,
+                        sample_func,
+                        paired,
+                        min_mapq,
+                        primary,
+                        mate_func=None):
+        """Yields (transposon_pos, linker_pos, sample) tuples for alignments."""
+
+        # Optionally filter alignments.
+        if primary:
+            alignments = (aln for aln in alignments if not aln.is_secondary)
+
+        if min_mapq is not None:
+            alignments = (aln for aln in alignments
+                          if aln.mapping_quality >= min_mapq)
+
+        # Generate position/sample summaries.
+        if paired:
+            yield from cls._iter_paired(
+                alignments, position_func, sample_func, mate_func=mate_func)
+        else:
+            yield from cls._iter_single(alignments, position_func,
+                                        sample_func)
+
     @staticmethod
-    def _iter_paired(alignments, position_func, sample_func):
-        for mate1, mate2 in iter_mates(alignments):
+    def _iter_paired(alignments, position_func, sample_func, mate_func=None):
+        mate_func = mate_func or iter_mates
+
+        for mate1, mate2 in mate_func(alignments):
             transposon_pos, linker_pos = position_func(mate1, mate2)
             sample = sample_func(mate1, mate2)
             yield transposon_pos, linker_pos, sample
@@ -156,6 +194,596 @@ class AlignmentSummary(object):
                         metadata=metadata)
 
 
+class ColumnarAlignmentSummary(AlignmentSummary):
+    """Alignment summary backed by NumPy arrays.
+
+    Instead of nesting dicts of linker position lists, this summary stores
+    every aligned read as a row in a set of columns (sample codes, contig
+    codes, transposon positions, strands and linker positions). Samples and
+    contigs are encoded as integer codes, which index into the ``samples``
+    and ``contigs`` lists respectively.
+
+    Rows are kept in the order in which they were added. This order
+    determines the order of the summary entries (and therefore the
+    numbering of the insertions), which matches the order of the
+    dict-based ``AlignmentSummary``.
+
+    """
+
+    def __init__(self, samples, contigs, sample_codes, contig_codes,
+                 positions, strands, linker_positions):
+        # pylint: disable=super-init-not-called,too-many-arguments
+        self._samples = list(samples)
+        self._contigs = list(contigs)
+
+        self._sample_codes = np.asarray(sample_codes, dtype=np.int32)
+        self._contig_codes = np.asarray(contig_codes, dtype=np.int32)
+        self._positions = np.asarray(positions, dtype=np.int64)
+        self._strands = np.asarray(strands, dtype=np.int8)
+        self._linker_positions = np.asarray(linker_positions, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._positions)
+
+    @property
+    def values(self):
+        """Returns alignment summary map."""
+
+        groups = self._group_rows()
+        linkers = self._linker_positions[groups['order']].tolist()
+
+        bounds = zip(groups['starts'].tolist(), groups['ends'].tolist())
+        keys = zip(groups['sample'].tolist(), groups['contig'].tolist(),
+                   groups['position'].tolist(), groups['strand'].tolist())
+
+        values = defaultdict(dict)
+        for (sample, contig, pos, strand), (start, end) in zip(keys, bounds):
+            key = (self._contigs[contig], pos, strand)
+            values[self._samples[sample]][key] = linkers[start:end]
+
+        return dict(values)
+
+    @classmethod
+    def from_values(cls, values):
+        """Builds a columnar summary from a (dict-based) summary map."""
+
+        builder = _ColumnarSummaryBuilder()
+
+        for sample, sample_values in values.items():
+            rows = ((key, linker_pos, sample)
+                    for key, ends in sample_values.items()
+                    for linker_pos in ends)  # yapf: disable
+            builder.add(rows)
+
+        return builder.build(cls)
+
+    @classmethod
+    def from_alignments(cls,
+                        alignments,
+                        position_func,
+                        sample_func,
+                        paired=False,
+                        min_mapq=30,
+                        primary=True,
+                        mate_func=None,
+                        chunk_size=65536):
+        """Constructs alignment summary from the given alignments.
+
+        Alignments are summarized in chunks of ``chunk_size`` reads, which
+        are appended to the underlying arrays in bulk. See
+        ``AlignmentSummary.from_alignments`` for the other arguments.
+        """
+
+        summaries = cls._iter_summaries(
+            alignments,
+            position_func=position_func,
+            sample_func=sample_func,
+            paired=paired,
+            min_mapq=min_mapq,
+            primary=primary,
+            mate_func=mate_func)
+
+        builder = _ColumnarSummaryBuilder()
+
+        for chunk in toolz.partition_all(chunk_size, summaries):
+            builder.add(chunk)
+
+        return builder.build(cls)
+
+    @classmethod
+    def from_bam(cls,
+                 bam_path,
+                 position_func,
+                 sample_func,
+                 paired=False,
+                 min_mapq=30,
+                 primary=True,
+                 mate_func=None,
+                 processes=1,
+                 region_size=None):
+        """Constructs alignment summary from a coordinate-sorted bam file.
+
+        If ``processes`` is larger than one (or a ``region_size`` is given),
+        the bam file is indexed and alignments are summarized per contig (or
+        per genomic chunk of ``region_size`` bp) in separate worker
+        processes. The partial summaries are concatenated in genomic order,
+        which gives the same result as summarizing the file serially. Note
+        that in this mode, ``position_func`` and ``sample_func`` must be
+        picklable and that unplaced (unmapped) reads are not considered.
+
+        For paired-end data, mate pairs are assigned to the region
+        containing the mate that is encountered last, as is the case when
+        pairing mates in a single pass over the file. As such, a custom
+        ``mate_func`` (for example for name-collated bam files) is only
+        supported when summarizing serially.
+        """
+
+        summary_kws = dict(
+            position_func=position_func,
+            sample_func=sample_func,
+            paired=paired,
+            min_mapq=min_mapq,
+            primary=primary,
+            mate_func=mate_func)
+
+        parallel = processes > 1 or region_size is not None
+
+        if parallel and mate_func is not None:
+            raise ValueError('A custom mate_func is not supported when '
+                             'summarizing regions in parallel')
+
+        if not parallel:
+            bam_file = pysam.AlignmentFile(str(bam_path))
+
+            try:
+                summary = cls.from_alignments(iter(bam_file), **summary_kws)
+            finally:
+                bam_file.close()
+        else:
+            _ensure_bam_index(bam_path)
+            regions = _bam_regions(bam_path, region_size=region_size)
+
+            # Summary arguments (which may include large objects, such as
+            # read --> sample mappings) are passed once per worker.
+            pool = Pool(
+                processes,
+                initializer=_init_worker,
+                initargs=(str(bam_path), cls, summary_kws))
+
+            try:
+                summaries = pool.map(_summarize_region, regions)
+            finally:
+                pool.terminate()
+
+            summary = cls.concat(summaries)
+
+        return summary
+
+    @classmethod
+    def concat(cls, summaries):
+        """Concatenates summaries, in the given order, into one summary."""
+
+        builder = _ColumnarSummaryBuilder()
+
+        for summary in summaries:
+            builder.add_summary(summary)
+
+        return builder.build(cls)
+
+    def _group_rows(self):
+        """Groups rows by (sample, contig, position, strand).
+
+        Returns a dict of arrays describing the groups, ordered by sample
+        and by the first row of each group. The ``order`` array sorts rows
+        by group (keeping the original row order within groups), whereas
+        ``starts`` and ``ends`` give the bounds of each group in ``order``.
+        The ``depth`` and ``support`` arrays contain the number of reads and
+        unique linker positions (ligation points) in each group.
+        """
+
+        num_rows = len(self)
+
+        if num_rows == 0:
+            empty = np.array([], dtype=np.int64)
+            return {
+                'order': empty, 'starts': empty, 'ends': empty,
+                'sample': empty, 'contig': empty, 'position': empty,
+                'strand': empty, 'depth': empty, 'support': empty
+            }  # yapf: disable
+
+        # Sort rows by key. Lexsort is stable, so rows within a group stay
+        # in their original order and each group starts with its first row.
+        columns = (self._positions, self._strands, self._contig_codes,
+                   self._sample_codes)
+        order = np.lexsort(columns)
+
+        is_start = np.zeros(num_rows, dtype=bool)
+        is_start[0] = True
+
+        for column in columns:
+            sorted_col = column[order]
+            is_start[1:] |= sorted_col[1:] != sorted_col[:-1]
+
+        starts = np.flatnonzero(is_start)
+        group_ids = np.cumsum(is_start) - 1
+
+        # Count unique linker positions per group by sorting linker
+        # positions within groups and flagging changes in value.
+        linkers = self._linker_positions[order]
+        linker_order = np.lexsort((linkers, group_ids))
+
+        sorted_linkers = linkers[linker_order]
+        is_unique = is_start.copy()
+        is_unique[1:] |= sorted_linkers[1:] != sorted_linkers[:-1]
+
+        support = np.add.reduceat(is_unique.astype(np.int64), starts)
+        depth = np.diff(np.append(starts, num_rows))
+
+        # Order groups by sample and by first appearance, which
+        # mirrors the insertion order of the dict-based summary.
+        first_rows = order[starts]
+        group_order = np.lexsort((first_rows,
+                                  self._sample_codes[first_rows]))
+
+        # Re-arrange rows so that groups are contiguous in group order.
+        starts = starts[group_order]
+        depth = depth[group_order]
+
+        new_starts = np.concatenate([[0], np.cumsum(depth)[:-1]])
+        row_index = (np.repeat(starts - new_starts, depth) +
+                     np.arange(num_rows))
+
+        first_rows = first_rows[group_order]
+
+        return {
+            'order': order[row_index],
+            'starts': new_starts,
+            'ends': new_starts + depth,
+            'sample': self._sample_codes[first_rows],
+            'contig': self._contig_codes[first_rows],
+            'position': self._positions[first_rows],
+            'strand': self._strands[first_rows],
+            'depth': depth,
+            'support': support[group_order]
+        }
+
+    def merge_within_distance(self, max_dist, across_samples=False):
+        """Merges summary values that are within given max dist.
+
+        Positions are clustered per sample, contig and strand by chaining
+        positions that lie within max_dist of the previous position. Each
+        cluster is merged into a single entry located at the mean position
+        of its reads, which gives the same result as the dict-based
+        ``AlignmentSummary.merge_within_distance``.
+
+        Parameters
+        ----------
+        max_dist : int
+            Maximum distance between consecutive positions in a cluster.
+        across_samples : bool
+            Whether to cluster positions across samples. If True, reads of
+            all samples are used to determine clusters and their positions,
+            but entries are still kept separately for each sample.
+
+        Returns
+        -------
+        ColumnarAlignmentSummary
+            Summary containing the merged entries.
+
+        """
+
+        if len(self) == 0:
+            return self
+
+        # Rank contigs by name, as entries are ordered by name when merging.
+        contig_ranks = np.empty(len(self._contigs), dtype=np.int64)
+        contig_ranks[sorted(
+            range(len(self._contigs)), key=self._contigs.__getitem__)] = \
+            np.arange(len(self._contigs))
+        contig_ranks = contig_ranks[self._contig_codes]
+
+        # Sort rows by position within each sample/strand/contig. Positions
+        # are grouped across samples if requested.
+        group_cols = [contig_ranks, self._strands]
+
+        if not across_samples:
+            group_cols.append(self._sample_codes)
+
+        order = np.lexsort([self._positions] + group_cols)
+        positions = self._positions[order]
+
+        # Start new clusters for new groups or positions beyond max_dist.
+        is_start = np.zeros(len(order), dtype=bool)
+        is_start[0] = True
+        is_start[1:] = np.diff(positions) > max_dist
+
+        for column in group_cols:
+            sorted_col = column[order]
+            is_start[1:] |= sorted_col[1:] != sorted_col[:-1]
+
+        starts = np.flatnonzero(is_start)
+        sizes = np.diff(np.append(starts, len(order)))
+
+        # Calculate mean positions, rounding half to even (as round does).
+        means = np.add.reduceat(positions, starts) / sizes
+        merged = np.empty_like(self._positions)
+        merged[order] = np.repeat(np.rint(means).astype(np.int64), sizes)
+
+        # Order rows by sample and merged position, followed by the original
+        # position (and row order), so that the linker positions of each
+        # merged entry are concatenated in the same order as before.
+        new_order = np.lexsort((self._positions, merged, contig_ranks,
+                                self._strands, self._sample_codes))
+
+        return self.__class__(
+            samples=self._samples,
+            contigs=self._contigs,
+            sample_codes=self._sample_codes[new_order],
+            contig_codes=self._contig_codes[new_order],
+            positions=merged[new_order],
+            strands=self._strands[new_order],
+            linker_positions=self._linker_positions[new_order])
+
+    def to_insertions(self, id_fmt='{sample}.INS_{num}', min_support=0):
+        """Converts alignment map to a list of insertions."""
+
+        groups = self._group_rows()
+
+        # Number entries within each sample.
+        sample_codes = groups['sample']
+        sample_starts = np.searchsorted(sample_codes, sample_codes)
+        numbers = np.arange(len(sample_codes)) - sample_starts
+
+        rows = zip(sample_codes.tolist(), numbers.tolist(),
+                   groups['contig'].tolist(), groups['position'].tolist(),
+                   groups['strand'].tolist(), groups['depth'].tolist(),
+                   groups['support'].tolist())
+
+        for sample_code, num, contig, pos, strand, depth, support in rows:
+            if support >= min_support:
+                sample = self._samples[sample_code]
+                metadata = frozendict(depth=depth, depth_unique=support)
+
+                yield Insertion(
+                    id=id_fmt.format(sample=sample, num=num),
+                    sample=sample,
+                    chromosome=self._contigs[contig],
+                    position=pos,
+                    strand=strand,
+                    support=metadata['depth_unique'],
+                    metadata=metadata)
+
+    def to_table(self, id_fmt='{sample}.INS_{num}', min_support=0):
+        """Converts alignment map to an insertion table.
+
+        Gives the same insertions as ``to_insertions``, but builds the
+        table directly from the summary columns.
+        """
+
+        groups = self._group_rows()
+
+        # Number entries within each sample.
+        sample_codes = groups['sample']
+        sample_starts = np.searchsorted(sample_codes, sample_codes)
+        numbers = np.arange(len(sample_codes)) - sample_starts
+
+        mask = groups['support'] >= min_support
+
+        samples = np.array(self._samples, dtype=object)[sample_codes[mask]]
+        contigs = np.array(self._contigs, dtype=object)[groups['contig'][mask]]
+
+        ids = [id_fmt.format(sample=sample, num=num)
+               for sample, num in zip(samples, numbers[mask].tolist())]
+
+        frame = pd.DataFrame(
+            OrderedDict([
+                ('id', ids),
+                ('chromosome', contigs),
+                ('position', groups['position'][mask].astype(np.int64)),
+                ('strand', groups['strand'][mask].astype(np.int64)),
+                ('support', groups['support'][mask].astype(np.int64)),
+                ('sample', samples),
+                ('depth', groups['depth'][mask].astype(np.int64)),
+                ('depth_unique', groups['support'][mask].astype(np.int64))
+            ]))  # yapf: disable
+
+        return InsertionTable(frame)
+
+
+class _ColumnarSummaryBuilder(object):
+    """Helper class for building columnar alignment summaries."""
+
+    def __init__(self):
+        self._sample_map = {}
+        self._contig_map = {}
+
+        self._sample_codes = _GrowableArray(np.int32)
+        self._contig_codes = _GrowableArray(np.int32)
+        self._positions = _GrowableArray(np.int64)
+        self._strands = _GrowableArray(np.int8)
+        self._linker_positions = _GrowableArray(np.int64)
+
+    def add(self, summaries):
+        """Adds (transposon_pos, linker_pos, sample) summary tuples."""
+
+        summaries = list(summaries)
+
+        if len(summaries) == 0:
+            return
+
+        keys, linker_positions, samples = zip(*summaries)
+        contigs, positions, strands = zip(*keys)
+
+        self._sample_codes.extend(
+            [self._encode(self._sample_map, s) for s in samples])
+        self._contig_codes.extend(
+            [self._encode(self._contig_map, c) for c in contigs])
+        self._positions.extend(positions)
+        self._strands.extend(strands)
+        self._linker_positions.extend(linker_positions)
+
+    def add_summary(self, summary):
+        """Adds the rows of an existing columnar summary."""
+
+        # Translate codes of the summary into codes of the builder.
+        sample_lookup = np.array(
+            [self._encode(self._sample_map, s) for s in summary._samples],
+            dtype=np.int32)
+        contig_lookup = np.array(
+            [self._encode(self._contig_map, c) for c in summary._contigs],
+            dtype=np.int32)
+
+        if len(summary) > 0:
+            self._sample_codes.extend(sample_lookup[summary._sample_codes])
+            self._contig_codes.extend(contig_lookup[summary._contig_codes])
+            self._positions.extend(summary._positions)
+            self._strands.extend(summary._strands)
+            self._linker_positions.extend(summary._linker_positions)
+
+    @staticmethod
+    def _encode(code_map, value):
+        try:
+            return code_map[value]
+        except KeyError:
+            code = code_map[value] = len(code_map)
+            return code
+
+    def build(self, summary_class):
+        """Builds a summary instance of the given class."""
+
+        return summary_class(
+            samples=list(self._sample_map.keys()),
+            contigs=list(self._contig_map.keys()),
+            sample_codes=self._sample_codes.to_array(),
+            contig_codes=self._contig_codes.to_array(),
+            positions=self._positions.to_array(),
+            strands=self._strands.to_array(),
+            linker_positions=self._linker_positions.to_array())
+
+
+class _GrowableArray(object):
+    """One-dimensional NumPy array that doubles in size when full."""
+
+    def __init__(self, dtype, capacity=1024):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def extend(self, values):
+        """Appends given values to the array."""
+
+        values = np.asarray(values, dtype=self._data.dtype)
+        new_size = self._size + len(values)
+
+        if new_size > len(self._data):
+            capacity = max(new_size, 2 * len(self._data))
+            data = np.empty(capacity, dtype=self._data.dtype)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+
+        self._data[self._size:new_size] = values
+        self._size = new_size
+
+    def to_array(self):
+        """Returns a (trimmed) copy of the array values."""
+        return self._data[:self._size].copy()
+
+
+def _ensure_bam_index(bam_path):
+    """Indexes the given bam file, if no index exists yet."""
+
+    bam_path = Path(bam_path)
+    index_path = bam_path.with_suffix(bam_path.suffix + '.bai')
+
+    if not index_path.exists():
+        pysam.index(str(bam_path))
+
+
+def _bam_regions(bam_path, region_size=None):
+    """Returns list of (contig, start, end) regions covering the bam file.
+
+    Regions span entire contigs (with start/end set to None) if no
+    region_size is given.
+    """
+
+    bam_file = pysam.AlignmentFile(str(bam_path))
+
+    try:
+        contigs = list(zip(bam_file.references, bam_file.lengths))
+    finally:
+        bam_file.close()
+
+    if region_size is None:
+        return [(contig, None, None) for contig, _ in contigs]
+
+    return [(contig, start, min(start + region_size, length))
+            for contig, length in contigs
+            for start in range(0, length, region_size)]  # yapf: disable
+
+
+_WORKER_ARGS = None
+
+
+def _init_worker(bam_path, summary_class, summary_kws):
+    global _WORKER_ARGS  # pylint: disable=global-statement
+    _WORKER_ARGS = bam_path, summary_class, summary_kws
+
+
+def _summarize_region(region, bam_path=None, summary_class=None,
+                      summary_kws=None):
+    """Summarizes alignments within the given region of a bam file.
+
+    Arguments other than the region default to those passed to the
+    worker process on initialization (see ``_init_worker``).
+    """
+
+    if bam_path is None:
+        bam_path, summary_class, summary_kws = _WORKER_ARGS
+
+    contig, start, end = region
+    bam_file = pysam.AlignmentFile(bam_path)
+
+    try:
+        if start is None:
+            alignments = bam_file.fetch(contig)
+        else:
+            alignments = _fetch_region(
+                bam_file, contig, start, end, paired=summary_kws['paired'])
+
+        summary = summary_class.from_alignments(alignments, **summary_kws)
+    finally:
+        bam_file.close()
+
+    return summary
+
+
+def _fetch_region(bam_file, contig, start, end, paired=False):
+    """Fetches alignments that start within the given region.
+
+    For paired-end data, mates that start before the region are also
+    returned if the other mate of the pair starts within the region, so
+    that each proper pair is returned for exactly one region.
+    """
+
+    fetch_start = start
+
+    if paired and start > 0:
+        # Look back far enough to include mates of pairs in the region.
+        mate_starts = (aln.next_reference_start
+                       for aln in bam_file.fetch(contig, start, end)
+                       if aln.is_proper_pair and aln.reference_start >= start)
+        fetch_start = min(mate_starts, default=start)
+        fetch_start = max(min(fetch_start, start), 0)
+
+    for aln in bam_file.fetch(contig, fetch_start, end):
+        if aln.reference_start >= start:
+            yield aln
+        elif paired and aln.next_reference_start >= start:
+            yield aln
+
+
 def iter_mates(alignments):
     """Iterates over mate pairs in alignments."""
 
@@ -174,3 +802,51 @@ def iter_mates(alignments):
                     yield aln, mate
                 else:
                     yield mate, aln
+
+
+def iter_collated_mates(alignments, counts=None):
+    """Iterates over mate pairs in name-collated alignments.
+
+    In contrast to ``iter_mates``, this function expects alignments to be
+    grouped by read name (for example, as produced by ``samtools collate``
+    or directly by bowtie2), so that mates arrive adjacent to each other.
+    This allows mates to be paired without caching any unpaired mates.
+
+    Parameters
+    ----------
+    alignments : Iterable[pysam.AlignedSegment]
+        Name-collated alignments.
+    counts : collections.Counter
+        Optional counter, which is updated with the number of paired mates
+        (``pairs``) and the number of mates without a partner (``orphans``).
+
+    """
+
+    num_pairs, num_orphans = 0, 0
+
+    pending = None
+    for aln in alignments:
+        if aln.is_proper_pair:
+            if pending is None:
+                pending = aln
+            elif pending.query_name == aln.query_name:
+                num_pairs += 1
+
+                if aln.is_read1:
+                    yield aln, pending
+                else:
+                    yield pending, aln
+
+                pending = None
+            else:
+                # Mate of pending alignment was not found (e.g. due
+                # to filtering), so we count it as an orphan.
+                num_orphans += 1
+                pending = aln
+
+    if pending is not None:
+        num_orphans += 1
+
+    if counts is not None:
+        counts['pairs'] += num_pairs
+        counts['orphans'] += num_orphans
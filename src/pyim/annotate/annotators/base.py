@@ -7,10 +7,11 @@ import numpy as np
 import pandas as pd
 
 from pyim.main import Command
-from pyim.model import Insertion, CisSite
-from pyim.vendor.genopandas import GenomicDataFrame
+from pyim.model import Insertion, InsertionTable, CisSiteTable
+from pyim.util.frame import frame_format
 
-from ..util import annotate_insertion
+from ..genes import read_genes_from_gtf
+from ..util import annotate_insertion, GENE_METADATA_COLUMNS
 
 
 class Annotator(abc.ABC):
@@ -20,6 +21,17 @@ class Annotator(abc.ABC):
     def annotate(self, insertions):
         """Annotates given insertions with predicted target genes."""
 
+    def annotate_frame(self, insertions):
+        """Annotates insertions given in frame format.
+
+        Returns a frame of the annotated insertions, containing a row per
+        hit of each insertion. The default implementation annotates
+        insertion objects (see ``annotate``), which annotators can
+        override with a columnar implementation.
+        """
+        return Insertion.to_frame(
+            self.annotate(Insertion.from_frame(insertions)))
+
 
 class AnnotatorCommand(Command):
     """Base annotator command."""
@@ -27,25 +39,58 @@ class AnnotatorCommand(Command):
     def configure(self, parser):
         parser.add_argument('--insertions', type=Path, required=True)
         parser.add_argument('--output', type=Path, required=True)
+        parser.add_argument('--chunk_size', type=int, default=None)
 
     @staticmethod
-    def _read_insertions(insertion_path):
-        return Insertion.from_csv(insertion_path, sep='\t')
+    def _read_insertions(insertion_path, chunk_size=None):
+        if chunk_size is not None and frame_format(insertion_path) == 'text':
+            # Stream insertions from (tsv) file in chunks.
+            return Insertion.iter_csv(
+                insertion_path, chunksize=chunk_size, sep='\t',
+                as_frame=True)
+        return [InsertionTable.read(insertion_path).to_frame()]
 
     @staticmethod
     def _read_cis_sites(cis_path):
-        return CisSite.from_csv(cis_path, sep='\t')
+        return CisSiteTable.read(cis_path)
 
     @staticmethod
-    def _read_genes_from_gtf(gtf_path):
-        genes = GenomicDataFrame.from_gtf(
-            gtf_path, filter_=lambda rec: rec['feature'] == 'gene')
-        genes['strand'] = genes['strand'].map({'+': 1, '-': -1})
-        return genes
+    def _read_genes_from_gtf(gtf_path, cache_dir=None, processes=1):
+        return read_genes_from_gtf(
+            gtf_path, cache_dir=cache_dir, processes=processes)
+
+    def _annotate(self, annotator, insertion_path, output_path,
+                  chunk_size=None):
+        """Annotates insertions from file, writing annotated insertions.
+
+        Insertions are annotated in frame format (per chunk if chunk_size
+        is given), so that gene metadata is only joined with the insertions
+        when writing the annotated insertions.
+        """
+
+        frames = self._read_insertions(insertion_path, chunk_size=chunk_size)
+        annotated = (annotator.annotate_frame(frame) for frame in frames)
+
+        if chunk_size is not None and frame_format(output_path) == 'text':
+            # Determine output columns in advance for chunked writing.
+            metadata_columns = (
+                Insertion.read_metadata_columns(insertion_path) +
+                GENE_METADATA_COLUMNS)
+
+            with Insertion.csv_writer(
+                    output_path, metadata_columns=metadata_columns,
+                    sep='\t') as writer:
+                for frame in annotated:
+                    writer.write_frame(frame)
+        else:
+            annotated = list(annotated)
 
-    @staticmethod
-    def _write_output(output_path, insertions):
-        Insertion.to_csv(output_path, insertions, sep='\t', index=False)
+            if len(annotated) > 0:
+                frame = pd.concat(annotated, axis=0, ignore_index=True)
+            else:
+                frame = Insertion.to_frame([])
+
+            Insertion.write_frame(output_path, Insertion.format_frame(frame))
 
 
 class CisAnnotator(Annotator):
@@ -55,13 +100,16 @@ class CisAnnotator(Annotator):
         super().__init__()
 
         if cis_sites is not None:
-            # Copy unstranded CISs to both strands.
-            cis_sites = self._expand_unstranded_sites(cis_sites)
+            # Copy unstranded CISs to both strands. Sites are stored as
+            # a list, as they are annotated once per call to annotate.
+            cis_sites = list(self._expand_unstranded_sites(cis_sites))
 
         self._annotator = annotator
         self._genes = genes.set_index('gene_id', drop=False)
         self._cis_sites = cis_sites
 
+        self._cis_gene_mapping = None
+
     @staticmethod
     def _expand_unstranded_sites(cis_sites):
         """Copies unstranded CISs to both strands."""
@@ -73,9 +121,14 @@ class CisAnnotator(Annotator):
                 yield cis
 
     def annotate(self, insertions):
-        # Annotate cis sites.
-        annotated_sites = self._annotator.annotate(self._cis_sites)
-        cis_gene_mapping = self._extract_gene_mapping(annotated_sites)
+        # Annotate cis sites (once, re-using the mapping for any
+        # further chunks of insertions).
+        if self._cis_gene_mapping is None:
+            annotated_sites = self._annotator.annotate(self._cis_sites)
+            self._cis_gene_mapping = self._extract_gene_mapping(
+                annotated_sites)
+
+        cis_gene_mapping = self._cis_gene_mapping
 
         # Annotate insertions.
         annotated = chain.from_iterable((self._annotate_insertion(
@@ -102,7 +155,7 @@ class CisAnnotator(Annotator):
         if gene_ids is None:
             hits = pd.DataFrame().reindex(columns=self._genes.columns)
         else:
-            hits = self._genes.loc[gene_ids]
+            hits = self._genes.loc[sorted(gene_ids)]
 
         # Annotate insertion with identified hits.
         yield from annotate_insertion(insertion, hits)
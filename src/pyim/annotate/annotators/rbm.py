@@ -30,11 +30,28 @@ class RbmAnnotator(Annotator):
 
         windows = self._build_windows(window_sizes)
         self._annotator = WindowAnnotator(
-            windows=windows, genes=genes, closest=closest, blacklist=blacklist)
+            windows=windows,
+            genes=genes,
+            closest=closest,
+            blacklist=blacklist,
+            single_query=True)
 
     def annotate(self, insertions):
         yield from self._annotator.annotate(insertions)
 
+    def annotate_table(self, insertions):
+        """Annotates insertions, returning the hits as a columnar table
+        (see ``WindowAnnotator.annotate_table``)."""
+        return self._annotator.annotate_table(insertions)
+
+    def annotate_frame(self, insertions):
+        return self._annotator.annotate_frame(insertions)
+
+    def read_segment_map(self, file_path):
+        """Reads the segment map used for looking up hits from a file
+        (see ``WindowAnnotator.read_segment_map``)."""
+        self._annotator.read_segment_map(file_path)
+
     def _build_windows(self, window_sizes):
         us, ua, ds, da = window_sizes
 
@@ -75,32 +92,34 @@ class RbmAnnotatorCommand(AnnotatorCommand):
 
         parser.add_argument('--cis_sites', default=None, type=Path)
 
+        parser.add_argument('--cache_dir', default=None, type=Path)
+        parser.add_argument('--processes', default=1, type=int)
+        parser.add_argument('--segment_map', default=None, type=Path)
+
     def run(self, args):
-        # Read insertions and genes.
-        insertions = self._read_insertions(args.insertions)
-        genes = self._read_genes_from_gtf(args.gtf)
+        # Read genes.
+        genes = self._read_genes_from_gtf(
+            args.gtf, cache_dir=args.cache_dir, processes=args.processes)
 
         # Setup annotator.
-        if args.cis_sites is not None:
-            cis_sites = list(self._read_cis_sites(args.cis_sites))
+        annotator = RbmAnnotator(
+            genes=genes,
+            window_sizes=args.window_sizes,
+            preset=args.preset,
+            closest=args.closest,
+            blacklist=args.blacklist)
 
-            sub_annotator = RbmAnnotator(
-                genes=genes,
-                window_sizes=args.window_sizes,
-                preset=args.preset,
-                closest=args.closest,
-                blacklist=args.blacklist)
+        if args.segment_map is not None:
+            annotator.read_segment_map(args.segment_map)
 
+        if args.cis_sites is not None:
+            cis_sites = list(self._read_cis_sites(args.cis_sites))
             annotator = CisAnnotator(
-                annotator=sub_annotator, genes=genes, cis_sites=cis_sites)
-        else:
-            annotator = RbmAnnotator(
-                genes=genes,
-                window_sizes=args.window_sizes,
-                preset=args.preset,
-                closest=args.closest,
-                blacklist=args.blacklist)
+                annotator=annotator, genes=genes, cis_sites=cis_sites)
 
         # Annotate insertions and write output.
-        annotated = annotator.annotate(insertions)
-        self._write_output(args.output, insertions=annotated)
+        self._annotate(
+            annotator,
+            insertion_path=args.insertions,
+            output_path=args.output,
+            chunk_size=args.chunk_size)
@@ -1,19 +1,60 @@
 from collections import namedtuple
 from itertools import chain
+import logging
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import toolz
 
-from pyim.vendor.genopandas import GenomicDataFrame
+from pyim.vendor.frozendict import frozendict
+from pyim.vendor.genopandas import GenomicDataFrame, GenomicIntervalArray
 
 from .base import Annotator, AnnotatorCommand, CisAnnotator
+from ..segments import SegmentMap
+from ..table import AnnotationTable
 from ..util import filter_blacklist, select_closest, annotate_insertion
 
 
 class WindowAnnotator(Annotator):
-    """Window annotator class."""
+    """Window annotator class.
+
+    Parameters
+    ----------
+    genes : GenomicDataFrame
+        Genes to annotate insertions with.
+    windows : List[Window]
+        Windows in which to search for genes.
+    closest : bool
+        Whether to only select the closest gene(s) for each insertion.
+    blacklist : Set[str]
+        Ids of genes that should not be used for annotation.
+    batch_size : int
+        Number of insertions that are annotated together, by searching
+        all windows of all insertions in the batch at once. If None,
+        insertions are annotated one at a time using the genomic index
+        of the genes, which is much slower for large numbers of insertions.
+    single_query : bool
+        Whether to search genes in a single query per insertion (covering
+        all of its windows), after which hits are assigned to windows. This
+        is cheaper than searching each window separately if windows are
+        adjacent or overlapping (as in RBM annotation), but not if windows
+        are far apart. Only applies to batch annotation.
+    segment_map : SegmentMap
+        Precomputed segment map of the genes and windows, which is used
+        to look up hits instead of searching genes in batch annotation
+        (see ``read_segment_map``).
+
+    """
 
-    def __init__(self, genes, windows, closest=False, blacklist=None):
+    def __init__(self,
+                 genes,
+                 windows,
+                 closest=False,
+                 blacklist=None,
+                 batch_size=10000,
+                 single_query=False,
+                 segment_map=None):
         super().__init__()
 
         self._windows = windows
@@ -22,6 +63,15 @@ class WindowAnnotator(Annotator):
         self._closest = closest
         self._blacklist = blacklist
 
+        self._batch_size = batch_size
+        self._single_query = single_query
+
+        self._gene_index = None
+        self._segment_map = None
+
+        if segment_map is not None:
+            self.segment_map = segment_map
+
     @classmethod
     def from_window_size(cls, genes, window_size, **kwargs):
         """Creates instance using given window size."""
@@ -36,9 +86,256 @@ class WindowAnnotator(Annotator):
 
         return cls(genes=genes, windows=[window], **kwargs)
 
+    @property
+    def segment_map(self):
+        """Segment map used for looking up hits (if any)."""
+        return self._segment_map
+
+    @segment_map.setter
+    def segment_map(self, value):
+        if value is not None and value.key != SegmentMap.compute_key(
+                self._genes, self._windows):
+            raise ValueError('Segment map does not match the genes '
+                             'and windows of the annotator')
+        self._segment_map = value
+
+    def read_segment_map(self, file_path):
+        """Reads the segment map used for looking up hits from a file.
+
+        If the file does not exist or its segment map was built for
+        different genes or windows, the segment map is built and
+        written to the file instead.
+        """
+
+        logger = logging.getLogger()
+        key = SegmentMap.compute_key(self._genes, self._windows)
+
+        if file_path.exists():
+            segment_map = SegmentMap.load(file_path)
+        else:
+            segment_map = None
+
+        if segment_map is None or segment_map.key != key:
+            logger.info('Building segment map')
+            segment_map = SegmentMap.build(self._genes, self._windows)
+
+            logger.info('Writing segment map with %d segments to %s',
+                        segment_map.num_segments, file_path)
+            segment_map.save(file_path)
+
+        self.segment_map = segment_map
+
     def annotate(self, insertions):
-        yield from chain.from_iterable((self._annotate_insertion(ins)
-                                        for ins in insertions))
+        if self._batch_size is None:
+            yield from chain.from_iterable((self._annotate_insertion(ins)
+                                            for ins in insertions))
+        else:
+            for batch in toolz.partition_all(self._batch_size, insertions):
+                yield from self._annotate_batch(batch)
+
+    def annotate_table(self, insertions):
+        """Annotates insertions, returning the hits as a columnar table.
+
+        Parameters
+        ----------
+        insertions : pd.DataFrame
+            Insertions to annotate (in frame format).
+
+        Returns
+        -------
+        AnnotationTable
+            Table containing the genes hit by the insertions (see
+            ``AnnotationTable.join`` for adding these to the insertions).
+
+        """
+
+        return self._annotate_positions(
+            insertions['chromosome'],
+            insertions['position'].to_numpy(dtype=np.int64),
+            insertions['strand'].to_numpy())
+
+    def annotate_frame(self, insertions):
+        return self.annotate_table(insertions).join(insertions)
+
+    def _annotate_positions(self, chromosomes, positions, strands):
+        # Identify overlapping features.
+        ins_idx, gene_idx, window_idx = self.search_windows(
+            chromosomes, positions, strands)
+
+        table = AnnotationTable.from_hits(
+            self._genes,
+            ins_idx,
+            gene_idx,
+            window_idx,
+            positions,
+            strands,
+            windows=self._windows)
+
+        # Filter for closest/blacklist.
+        if self._closest:
+            table = table.select_closest()
+
+        if self._blacklist is not None:
+            table = table.filter_blacklist(self._blacklist)
+
+        return table
+
+    def _annotate_batch(self, insertions):
+        table = self._annotate_positions(
+            [ins.chromosome for ins in insertions],
+            np.array([ins.position for ins in insertions], dtype=np.int64),
+            np.array([ins.strand for ins in insertions]))
+
+        # Annotate insertions with identified hits.
+        hits = table.hits
+        gene_idx = hits['gene'].to_numpy()
+
+        gene_ids = self._genes['gene_id'].to_numpy()[gene_idx].tolist()
+        gene_names = self._genes['gene_name'].to_numpy()[gene_idx].tolist()
+        distances = hits['distance'].tolist()
+        orientations = hits['orientation'].tolist()
+
+        bounds = np.searchsorted(hits['insertion'].to_numpy(),
+                                 np.arange(len(insertions) + 1))
+
+        for i, insertion in enumerate(insertions):
+            if bounds[i] == bounds[i + 1]:
+                # In case of no overlap, return original insertion.
+                yield insertion
+            else:
+                for j in range(bounds[i], bounds[i + 1]):
+                    gene_metadata = {
+                        'gene_id': gene_ids[j],
+                        'gene_name': gene_names[j],
+                        'gene_distance': distances[j],
+                        'gene_orientation': orientations[j]
+                    }
+
+                    metadata = {**insertion.metadata,
+                                **gene_metadata}  # yapf: disable
+                    yield insertion._replace(metadata=frozendict(metadata))
+
+    def search_windows(self, chromosomes, positions, strands):
+        """Searches genes within the windows of the given positions.
+
+        Each window is resolved for all positions at once, using an
+        array-based genomic index of the genes (see GenomicIntervalArray).
+        In single query mode, genes are searched once in a range covering
+        all windows, after which hits are assigned to the windows. If the
+        annotator has a segment map, hits are looked up in the map instead.
+
+        Parameters
+        ----------
+        chromosomes : List[str]
+            Chromosomes of the positions.
+        positions : np.ndarray
+            Genomic positions.
+        strands : np.ndarray
+            Strands of the positions (1 or -1).
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray, np.ndarray]
+            Arrays containing the indices of the position, the (positional)
+            index of the gene and the index of the window of each hit.
+            Hits are sorted by position, window and gene (in the order
+            of the index of the genes frame).
+
+        """
+
+        if self._segment_map is not None:
+            return self._segment_map.search(chromosomes, positions, strands)
+
+        if self._gene_index is None:
+            self._gene_index = _build_gene_index(self._genes)
+
+        gene_index, gene_ranks = self._gene_index
+
+        chromosomes = np.asarray(chromosomes, dtype=object)
+        regions = [
+            window.apply(chromosomes, positions, strands)
+            for window in self._windows
+        ]
+
+        if self._single_query:
+            hits = self._search_union(gene_index, regions)
+        else:
+            hits = self._search_regions(gene_index, regions)
+
+        ins_idx, gene_idx, window_idx = (np.concatenate(arrays)
+                                         for arrays in zip(*hits))
+
+        # Sort hits by insertion, window and gene (as in sort_index).
+        order = np.lexsort(
+            (gene_ranks[gene_idx], window_idx, ins_idx))
+
+        return ins_idx[order], gene_idx[order], window_idx[order]
+
+    def _search_regions(self, gene_index, regions):
+        """Searches genes for each region separately."""
+
+        gene_strands = self._genes['strand'].to_numpy()
+
+        hits = []
+        for window_idx, region in enumerate(regions):
+            hit_query, hit_gene = gene_index.search_many(
+                region.chromosome,
+                region.start,
+                region.end,
+                strict_left=region.strict_left,
+                strict_right=region.strict_right)
+
+            if region.strand is not None:
+                strand_mask = (
+                    gene_strands[hit_gene] == region.strand[hit_query])
+                hit_query = hit_query[strand_mask]
+                hit_gene = hit_gene[strand_mask]
+
+            hits.append((hit_query, hit_gene,
+                         np.full(len(hit_query), window_idx)))
+
+        return hits
+
+    def _search_union(self, gene_index, regions):
+        """Searches genes once for all regions, assigning hits to regions."""
+
+        starts = np.stack([region.start for region in regions])
+        ends = np.stack([region.end for region in regions])
+
+        # Determine range covering all (non-empty) regions of each position.
+        # Positions without non-empty regions get an empty range.
+        non_empty = starts < ends
+
+        union_start = np.where(non_empty, starts,
+                               np.iinfo(np.int64).max).min(axis=0)
+        union_end = np.where(non_empty, ends,
+                             np.iinfo(np.int64).min).max(axis=0)
+
+        hit_query, hit_gene = gene_index.search_many(
+            regions[0].chromosome, union_start, union_end)
+
+        gene_starts = self._genes.gi.start.to_numpy()[hit_gene]
+        gene_ends = self._genes.gi.end.to_numpy()[hit_gene]
+        gene_strands = self._genes['strand'].to_numpy()[hit_gene]
+
+        # Assign hits to the regions they overlap with, using the same
+        # semantics as searching the regions separately.
+        hits = []
+        for window_idx, region in enumerate(regions):
+            start = region.start[hit_query]
+            end = region.end[hit_query]
+
+            mask = (start < end) & (gene_starts < end) & (gene_ends > start)
+            mask &= (~region.strict_left[hit_query] | (gene_starts >= start))
+            mask &= (~region.strict_right[hit_query] | (gene_ends < end))
+
+            if region.strand is not None:
+                mask &= gene_strands == region.strand[hit_query]
+
+            hits.append((hit_query[mask], hit_gene[mask],
+                         np.full(mask.sum(), window_idx)))
+
+        return hits
 
     def _annotate_insertion(self, insertion):
         # Identify overlapping features.
@@ -100,7 +397,15 @@ class Window(object):
         self.strict_right = strict_right
 
     def apply(self, chromosome, position, strand):
-        """Applies window to given position."""
+        """Applies window to given position.
+
+        Positions and strands may also be given as arrays, in which case
+        the window is applied to each position and the start, end, strand
+        and strictness of the returned region are arrays as well.
+        """
+
+        if isinstance(position, np.ndarray):
+            return self._apply_many(chromosome, position, strand)
 
         # Determine start/end position.
         if strand == 1:
@@ -128,12 +433,61 @@ class Window(object):
             strict_left=strict_left,
             strict_right=strict_right)
 
+    def _apply_many(self, chromosome, positions, strands):
+        strands = np.asarray(strands)
+
+        forward = strands == 1
+        invalid = ~(forward | (strands == -1))
+
+        if np.any(invalid):
+            raise ValueError('Unknown value for strand ({})'.format(
+                strands[invalid][0]))
+
+        start = np.where(forward, positions - self.upstream,
+                         positions - self.downstream)
+        end = np.where(forward, positions + self.downstream,
+                       positions + self.upstream)
+
+        strict_left = np.where(forward, self.strict_left, self.strict_right)
+        strict_right = np.where(forward, self.strict_right, self.strict_left)
+
+        strand = None if self.strand is None else self.strand * strands
+
+        return Region(
+            chromosome,
+            start,
+            end,
+            strand,
+            strict_left=strict_left,
+            strict_right=strict_right)
+
 
 Region = namedtuple('Region', [
     'chromosome', 'start', 'end', 'strand', 'strict_left', 'strict_right'
 ])
 
 
+def _build_gene_index(genes):
+    """Builds an array-based index of genes for searching many ranges.
+
+    Re-uses the genomic index of the genes if it is array-based. Also
+    returns the rank of each gene in the (sorted) index of the genes frame.
+    """
+
+    if genes.gi.backend == 'array':
+        index = genes.gi
+    else:
+        index = GenomicIntervalArray.from_arrays(
+            genes.gi.chromosome.to_numpy(), genes.gi.start.to_numpy(),
+            genes.gi.end.to_numpy())
+
+    ranks = np.empty(len(genes), dtype=np.int64)
+    ranks[np.argsort(genes.index.to_numpy(), kind='stable')] = \
+        np.arange(len(genes))
+
+    return index, ranks
+
+
 class WindowAnnotatorCommand(AnnotatorCommand):
     """WindowAnnotator command."""
 
@@ -151,30 +505,33 @@ class WindowAnnotatorCommand(AnnotatorCommand):
         parser.add_argument('--closest', default=False, action='store_true')
         parser.add_argument('--blacklist', nargs='+', default=None)
 
+        parser.add_argument('--cache_dir', default=None, type=Path)
+        parser.add_argument('--processes', default=1, type=int)
+        parser.add_argument('--segment_map', default=None, type=Path)
+
     def run(self, args):
-        # Read insertions and genes.
-        insertions = self._read_insertions(args.insertions)
-        genes = self._read_genes_from_gtf(args.gtf)
+        # Read genes.
+        genes = self._read_genes_from_gtf(
+            args.gtf, cache_dir=args.cache_dir, processes=args.processes)
 
         # Setup annotator.
-        if args.cis_sites is not None:
-            cis_sites = list(self._read_cis_sites(args.cis_sites))
+        annotator = WindowAnnotator.from_window_size(
+            genes=genes,
+            window_size=args.window_size,
+            closest=args.closest,
+            blacklist=args.blacklist)
 
-            sub_annotator = WindowAnnotator.from_window_size(
-                genes=genes,
-                window_size=args.window_size,
-                closest=args.closest,
-                blacklist=args.blacklist)
+        if args.segment_map is not None:
+            annotator.read_segment_map(args.segment_map)
 
+        if args.cis_sites is not None:
+            cis_sites = list(self._read_cis_sites(args.cis_sites))
             annotator = CisAnnotator(
-                annotator=sub_annotator, genes=genes, cis_sites=cis_sites)
-        else:
-            annotator = WindowAnnotator.from_window_size(
-                genes=genes,
-                window_size=args.window_size,
-                closest=args.closest,
-                blacklist=args.blacklist)
+                annotator=annotator, genes=genes, cis_sites=cis_sites)
 
         # Annotate insertions and write output.
-        annotated = annotator.annotate(insertions)
-        self._write_output(args.output, insertions=annotated)
+        self._annotate(
+            annotator,
+            insertion_path=args.insertions,
+            output_path=args.output,
+            chunk_size=args.chunk_size)
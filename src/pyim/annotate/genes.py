@@ -0,0 +1,137 @@
+"""Functions for reading genes from GTF files, with optional caching.
+
+Parsing a (large) GTF file can take longer than the annotation itself.
+Genes can therefore be cached in a compact binary (Feather) file, together
+with their (array-based) genomic index, so that later runs only need to
+load these files. Cached genes are keyed on the path, size, modification
+time and contents of the GTF file, so that changed files are re-parsed.
+"""
+
+import logging
+
+from pyim.util.cache import StageCache, file_digest, file_stamp
+from pyim.util.frame import frame_columns, read_frame, write_frame
+from pyim.vendor.genopandas import GenomicDataFrame, GenomicIntervalArray
+
+# Version of the cached files, which should be bumped whenever the format
+# of the cached genes changes, to avoid re-using outdated caches.
+GENE_CACHE_VERSION = 2
+
+GENE_CACHE_STAGE = 'genes'
+GENE_CACHE_FILES = ['genes.feather', 'index.npz']
+
+# Attributes of genes that are included as columns.
+GENE_ATTRIBUTES = ['gene_id', 'gene_name', 'gene_biotype']
+
+# Categorical columns of the cached genes.
+GENE_CATEGORIES = ['contig', 'source', 'feature', 'gene_biotype']
+
+
+def read_genes_from_gtf(gtf_path,
+                        cache_dir=None,
+                        backend='tree',
+                        processes=1,
+                        logger=None):
+    """Reads genes from a GTF file, optionally using a cache.
+
+    Parameters
+    ----------
+    gtf_path : Path
+        Path to the (bgzip-compressed, tabix-indexed) GTF file.
+    cache_dir : Path
+        Directory in which genes are cached. If given, genes are loaded
+        from the cache if possible or parsed and cached otherwise. Cached
+        genes are always indexed using the array backend. Caching
+        requires pyarrow to be installed.
+    backend : str
+        Backend used for indexing genes that are not cached.
+    processes : int
+        Number of processes used for parsing the GTF file.
+    logger : logging.Logger
+        Logger used to report re-use of cached genes.
+
+    Returns
+    -------
+    GenomicDataFrame
+        Frame containing the genes, with strands encoded as 1/-1.
+
+    """
+
+    if cache_dir is None:
+        return _parse_genes(gtf_path, backend=backend, processes=processes)
+
+    frame_path, index_path = cache_genes(
+        gtf_path, cache_dir=cache_dir, processes=processes, logger=logger)
+
+    return _load_genes(frame_path, index_path)
+
+
+def cache_genes(gtf_path, cache_dir, processes=1, logger=None):
+    """Parses genes from a GTF file into the cache (if not yet cached).
+
+    Parameters
+    ----------
+    gtf_path : Path
+        Path to the GTF file.
+    cache_dir : Path
+        Directory in which genes are cached.
+    processes : int
+        Number of processes used for parsing the GTF file.
+    logger : logging.Logger
+        Logger used to report re-use of cached genes.
+
+    Returns
+    -------
+    Tuple[Path, Path]
+        Paths to the cached genes and their genomic index.
+
+    """
+
+    cache = StageCache(cache_dir, logger=logger or logging.getLogger())
+
+    inputs = {
+        'gtf': file_stamp(gtf_path),
+        'digest': file_digest(gtf_path),
+        'version': GENE_CACHE_VERSION
+    }
+
+    def _cache(frame_path, index_path):
+        genes = _parse_genes(gtf_path, backend='array', processes=processes)
+
+        write_frame(
+            genes,
+            frame_path,
+            dtypes={col: 'category'
+                    for col in GENE_CATEGORIES})
+
+        genes.gi.trees.save(index_path)
+
+    frame_path, index_path = cache.run(GENE_CACHE_STAGE, inputs,
+                                       GENE_CACHE_FILES, _cache)
+
+    return frame_path, index_path
+
+
+def _parse_genes(gtf_path, backend='tree', processes=1):
+    genes = GenomicDataFrame.from_gtf(
+        gtf_path,
+        feature='gene',
+        attributes=GENE_ATTRIBUTES,
+        processes=processes,
+        backend=backend)
+    genes['strand'] = genes['strand'].map({'+': 1, '-': -1})
+    return genes
+
+
+def _load_genes(frame_path, index_path):
+    columns = set(frame_columns(frame_path))
+
+    frame = read_frame(
+        frame_path,
+        dtypes={col: 'category'
+                for col in GENE_CATEGORIES if col in columns})
+
+    genes = GenomicDataFrame(frame, chromosome_col='contig', backend='array')
+    genes.gi.trees = GenomicIntervalArray.load(index_path)
+
+    return genes
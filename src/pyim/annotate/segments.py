@@ -0,0 +1,339 @@
+"""Precomputed segment maps for annotating insertions by lookup.
+
+For a fixed set of genes and windows, the genes hit by an insertion only
+depend on its chromosome, position and strand. A segment map divides each
+chromosome (per strand) into segments in which insertions hit the same
+genes, so that insertions can be annotated using a single binary search.
+"""
+
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+
+class SegmentMap(object):
+    """Piecewise-constant map of the genes hit by insertions.
+
+    Segments are stored per chromosome and strand as an array of
+    breakpoints, together with the index of the hit set of each segment
+    (the segment ``i`` spanning positions ``breakpoints[i]`` up to
+    ``breakpoints[i + 1]``). Hit sets are deduplicated and contain the
+    (positional) indices of the hit genes and windows, ordered in the
+    same way as the hits of ``WindowAnnotator.search_windows``.
+
+    Segment maps are built using ``build`` and are only valid for the
+    genes and windows that they were built from, which are identified
+    by the key of the map.
+    """
+
+    def __init__(self, key, segments, set_offsets, set_genes, set_windows):
+        self._key = key
+        self._segments = segments
+
+        self._set_offsets = set_offsets
+        self._set_genes = set_genes
+        self._set_windows = set_windows
+
+    @property
+    def key(self):
+        """Key identifying the genes and windows of the map."""
+        return self._key
+
+    @property
+    def num_segments(self):
+        """Total number of segments in the map."""
+        return sum(len(set_ids) for _, set_ids in self._segments.values())
+
+    @property
+    def num_sets(self):
+        """Number of (distinct) hit sets in the map."""
+        return len(self._set_offsets) - 1
+
+    @staticmethod
+    def compute_key(genes, windows):
+        """Computes the key identifying given genes and windows."""
+
+        hasher = hashlib.sha1()
+
+        window_params = [[
+            window.upstream, window.downstream, window.strand,
+            window.strict_left, window.strict_right
+        ] for window in windows]
+        hasher.update(json.dumps(window_params, default=int).encode())
+
+        hasher.update(
+            np.asarray(genes.gi.chromosome, dtype=str).astype('U').tobytes())
+
+        for values in [
+                genes.gi.start, genes.gi.end, genes['strand'], genes.index
+        ]:
+            hasher.update(pd.util.hash_array(np.asarray(values)).tobytes())
+
+        return hasher.hexdigest()
+
+    @classmethod
+    def build(cls, genes, windows):
+        """Builds a segment map for given genes and windows.
+
+        Parameters
+        ----------
+        genes : GenomicDataFrame
+            Genes used for annotation.
+        windows : List[Window]
+            Windows in which genes are searched.
+
+        Returns
+        -------
+        SegmentMap
+            Segment map for the given genes and windows.
+
+        """
+
+        gene_chroms = np.asarray(genes.gi.chromosome, dtype=object)
+        gene_starts = genes.gi.start.to_numpy(dtype=np.int64)
+        gene_ends = genes.gi.end.to_numpy(dtype=np.int64)
+        gene_strands = genes['strand'].to_numpy()
+
+        ranks = np.empty(len(genes), dtype=np.int64)
+        ranks[np.argsort(genes.index.to_numpy(), kind='stable')] = \
+            np.arange(len(genes))
+
+        # Determine the range of positions in which each gene is hit
+        # by each window, for insertions on either strand.
+        ranges = []
+        for window_idx, window in enumerate(windows):
+            for strand in [1, -1]:
+                lower, upper, mask = _hit_range(window, strand, gene_starts,
+                                                gene_ends, gene_strands)
+
+                gene_idx = np.flatnonzero(mask)
+                ranges.append((gene_chroms[gene_idx],
+                               np.full(len(gene_idx), strand), lower[mask],
+                               upper[mask], np.full(len(gene_idx),
+                                                    window_idx), gene_idx))
+
+        chroms, strands, lowers, uppers, window_idx, gene_idx = (
+            np.concatenate(arrays) for arrays in zip(*ranges))
+
+        # Encode labels so that they sort by window and gene rank.
+        labels = window_idx * len(genes) + ranks[gene_idx]
+
+        hit_sets = {(): 0}
+        segments = {}
+
+        groups = pd.DataFrame({'chrom': chroms, 'strand': strands})
+        grouped = groups.groupby(['chrom', 'strand'], sort=False).indices
+
+        for (chrom, strand), idx in grouped.items():
+            segments[(chrom, strand)] = _build_segments(
+                lowers[idx], uppers[idx], labels[idx], hit_sets)
+
+        # Convert hit sets to flat arrays.
+        sets = sorted(hit_sets.items(), key=lambda item: item[1])
+
+        set_labels = np.array(
+            [label for hit_set, _ in sets for label in hit_set],
+            dtype=np.int64)
+        set_offsets = np.concatenate(
+            [[0], np.cumsum([len(hit_set) for hit_set, _ in sets])])
+
+        rank_genes = np.argsort(ranks)
+
+        return cls(
+            key=cls.compute_key(genes, windows),
+            segments=segments,
+            set_offsets=set_offsets.astype(np.int64),
+            set_genes=rank_genes[set_labels % len(genes)],
+            set_windows=set_labels // len(genes))
+
+    def search(self, chromosomes, positions, strands):
+        """Looks up the genes hit by insertions at given positions.
+
+        Parameters
+        ----------
+        chromosomes : List[str]
+            Chromosomes of the positions.
+        positions : np.ndarray
+            Genomic positions.
+        strands : np.ndarray
+            Strands of the positions (1 or -1).
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray, np.ndarray]
+            Arrays containing the indices of the position, the (positional)
+            index of the gene and the index of the window of each hit
+            (see ``WindowAnnotator.search_windows``).
+
+        """
+
+        positions = np.asarray(positions, dtype=np.int64)
+        strands = np.asarray(strands)
+
+        invalid = ~((strands == 1) | (strands == -1))
+        if np.any(invalid):
+            raise ValueError('Unknown value for strand ({})'.format(
+                strands[invalid][0]))
+
+        # Look up hit set of each position (0 is the empty set).
+        set_ids = np.zeros(len(positions), dtype=np.int64)
+
+        keys = pd.DataFrame({
+            'chrom': np.asarray(chromosomes, dtype=object),
+            'strand': strands.astype(np.int64)
+        })
+        grouped = keys.groupby(['chrom', 'strand'], sort=False).indices
+
+        for key, idx in grouped.items():
+            if key not in self._segments:
+                continue
+
+            breakpoints, segment_sets = self._segments[key]
+            segment = np.searchsorted(
+                breakpoints, positions[idx], side='right') - 1
+
+            valid = (segment >= 0) & (segment < len(segment_sets))
+            set_ids[idx[valid]] = segment_sets[segment[valid]]
+
+        # Expand hit sets into hits.
+        starts = self._set_offsets[set_ids]
+        counts = self._set_offsets[set_ids + 1] - starts
+
+        ins_idx = np.repeat(np.arange(len(positions)), counts)
+        offsets = np.arange(len(ins_idx)) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        hit_idx = np.repeat(starts, counts) + offsets
+
+        return ins_idx, self._set_genes[hit_idx], self._set_windows[hit_idx]
+
+    def save(self, file_path):
+        """Saves the segment map to a (NumPy .npz) file."""
+
+        keys = list(self._segments.keys())
+
+        breakpoints = [self._segments[key][0] for key in keys]
+        segment_sets = [self._segments[key][1] for key in keys]
+
+        with open(str(file_path), 'wb') as file_:
+            np.savez(
+                file_,
+                key=np.array(self._key),
+                chromosomes=np.array([key[0] for key in keys], dtype=str),
+                strands=np.array([key[1] for key in keys], dtype=np.int64),
+                breakpoint_counts=np.array(
+                    [len(bps) for bps in breakpoints], dtype=np.int64),
+                breakpoints=_concatenate(breakpoints),
+                segment_sets=_concatenate(segment_sets),
+                set_offsets=self._set_offsets,
+                set_genes=self._set_genes,
+                set_windows=self._set_windows)
+
+    @classmethod
+    def load(cls, file_path):
+        """Loads a segment map previously saved using ``save``."""
+
+        with np.load(str(file_path), allow_pickle=False) as arrays:
+            counts = arrays['breakpoint_counts']
+
+            breakpoints = np.split(arrays['breakpoints'],
+                                   np.cumsum(counts)[:-1])
+            segment_sets = np.split(arrays['segment_sets'],
+                                    np.cumsum(counts - 1)[:-1])
+
+            keys = zip(arrays['chromosomes'].tolist(),
+                       arrays['strands'].tolist())
+            segments = dict(zip(keys, zip(breakpoints, segment_sets)))
+
+            return cls(
+                key=str(arrays['key']),
+                segments=segments,
+                set_offsets=arrays['set_offsets'],
+                set_genes=arrays['set_genes'],
+                set_windows=arrays['set_windows'])
+
+
+def _hit_range(window, strand, gene_starts, gene_ends, gene_strands):
+    """Determines positions in which genes are hit by a window.
+
+    Returns the (half-open) range of positions for which insertions on the
+    given strand hit each gene with the window, together with a mask that
+    indicates which genes are hit at all. Follows the semantics of applying
+    the window (see ``Window.apply``) and searching overlapping genes.
+    """
+
+    # Window spans [position - before, position + after).
+    if strand == 1:
+        before, after = window.upstream, window.downstream
+        strict_left, strict_right = window.strict_left, window.strict_right
+    else:
+        before, after = window.downstream, window.upstream
+        strict_left, strict_right = window.strict_right, window.strict_left
+
+    # Genes overlap if start < position + after and end > position - before.
+    lower = gene_starts - after + 1
+    upper = gene_ends + before
+
+    if strict_left:
+        # Genes should start within window: start >= position - before.
+        upper = np.minimum(upper, gene_starts + before + 1)
+
+    if strict_right:
+        # Genes should end within window: end < position + after.
+        lower = np.maximum(lower, gene_ends - after + 1)
+
+    mask = lower < upper
+
+    if before + after <= 0:
+        # Empty windows do not overlap any genes.
+        mask[:] = False
+
+    if window.strand is not None:
+        mask &= gene_strands == window.strand * strand
+
+    return lower, upper, mask
+
+
+def _build_segments(lowers, uppers, labels, hit_sets):
+    """Builds segments from ranges in which labels (hits) are present.
+
+    Hit sets of segments are added to ``hit_sets`` (which maps sorted
+    tuples of labels to their index) if they are not yet present.
+    Adjacent segments with the same hit set are merged.
+    """
+
+    breakpoints = np.unique(np.concatenate([lowers, uppers]))
+
+    # Expand ranges into the segments they span.
+    first = np.searchsorted(breakpoints, lowers)
+    counts = np.searchsorted(breakpoints, uppers) - first
+
+    segment = np.repeat(first, counts) + (
+        np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                            counts))
+    segment_labels = np.repeat(labels, counts)
+
+    order = np.lexsort((segment_labels, segment))
+    segment, segment_labels = segment[order], segment_labels[order]
+
+    bounds = np.searchsorted(segment, np.arange(len(breakpoints)))
+
+    # Determine (deduplicated) hit set of each segment.
+    segment_sets = np.empty(len(breakpoints) - 1, dtype=np.int64)
+
+    for i in range(len(breakpoints) - 1):
+        hit_set = tuple(segment_labels[bounds[i]:bounds[i + 1]].tolist())
+        segment_sets[i] = hit_sets.setdefault(hit_set, len(hit_sets))
+
+    # Merge adjacent segments with the same hit set.
+    keep = np.concatenate([[True], segment_sets[1:] != segment_sets[:-1]])
+
+    return (np.append(breakpoints[:-1][keep], breakpoints[-1]),
+            segment_sets[keep])
+
+
+def _concatenate(arrays):
+    if len(arrays) == 0:
+        return np.array([], dtype=np.int64)
+    return np.concatenate(arrays)
@@ -0,0 +1,226 @@
+"""Columnar tables of insertion-gene hits."""
+
+import numpy as np
+import pandas as pd
+
+from .util import calc_distances, calc_orientations
+
+# Columns of the (long-format) hit frame.
+HIT_COLUMNS = ['insertion', 'gene', 'window', 'distance', 'orientation']
+
+
+class AnnotationTable(object):
+    """Columnar (long-format) table of the genes hit by insertions.
+
+    Hits are stored as a frame with a row per (insertion, gene) hit,
+    containing the (positional) index of the insertion, the (positional)
+    index of the gene in the genes frame, the index of the window in which
+    the gene was hit and the distance and orientation of the insertion
+    relative to the gene. Gene and insertion metadata are only combined
+    with the hits when joining the table with the annotated insertions
+    (see ``join``), so that no objects need to be built per hit.
+
+    Parameters
+    ----------
+    hits : pd.DataFrame
+        Frame containing the hits (see ``HIT_COLUMNS``), sorted by
+        insertion. The frame is used as is (without copying).
+    genes : GenomicDataFrame
+        Genes that were used for annotation.
+    windows : List[Window]
+        Windows that were used for annotation.
+
+    """
+
+    def __init__(self, hits, genes, windows=None):
+        missing = set(HIT_COLUMNS) - set(hits.columns)
+        if len(missing) > 0:
+            raise ValueError('Missing required columns: {}'
+                             .format(', '.join(sorted(missing))))
+
+        self._hits = hits
+        self._genes = genes
+        self._windows = windows
+
+    @classmethod
+    def from_hits(cls,
+                  genes,
+                  ins_idx,
+                  gene_idx,
+                  window_idx,
+                  positions,
+                  strands,
+                  windows=None):
+        """Builds table from arrays of hits.
+
+        Parameters
+        ----------
+        genes : GenomicDataFrame
+            Genes that were used for annotation.
+        ins_idx : np.ndarray
+            (Positional) indices of the insertion of each hit.
+        gene_idx : np.ndarray
+            (Positional) indices of the gene of each hit.
+        window_idx : np.ndarray
+            Indices of the window of each hit.
+        positions : np.ndarray
+            Positions of the insertions (indexed by ``ins_idx``).
+        strands : np.ndarray
+            Strands of the insertions (indexed by ``ins_idx``).
+        windows : List[Window]
+            Windows that were used for annotation.
+
+        Returns
+        -------
+        AnnotationTable
+            Table containing the given hits, sorted by insertion.
+
+        """
+
+        ins_idx = np.asarray(ins_idx, dtype=np.int64)
+        gene_idx = np.asarray(gene_idx, dtype=np.int64)
+        window_idx = np.asarray(window_idx, dtype=np.int64)
+
+        if np.any(np.diff(ins_idx) < 0):
+            order = np.argsort(ins_idx, kind='stable')
+            ins_idx = ins_idx[order]
+            gene_idx = gene_idx[order]
+            window_idx = window_idx[order]
+
+        positions = np.asarray(positions, dtype=np.int64)[ins_idx]
+        strands = np.asarray(strands)[ins_idx]
+        gene_strands = genes['strand'].to_numpy()[gene_idx]
+
+        distances = calc_distances(positions,
+                                   genes.gi.start.to_numpy()[gene_idx],
+                                   genes.gi.end.to_numpy()[gene_idx],
+                                   gene_strands)
+
+        orientations = pd.Categorical(
+            calc_orientations(strands, gene_strands),
+            categories=['sense', 'antisense'])
+
+        hits = pd.DataFrame({
+            'insertion': ins_idx,
+            'gene': gene_idx,
+            'window': window_idx,
+            'distance': distances,
+            'orientation': orientations
+        })
+
+        return cls(hits, genes=genes, windows=windows)
+
+    @property
+    def hits(self):
+        """Frame containing the hits (without copying)."""
+        return self._hits
+
+    @property
+    def genes(self):
+        """Genes that were used for annotation."""
+        return self._genes
+
+    def __len__(self):
+        return len(self._hits)
+
+    def __repr__(self):
+        return '<{} with {} hits>'.format(self.__class__.__name__, len(self))
+
+    def _subset(self, mask):
+        hits = self._hits.loc[mask].reset_index(drop=True)
+        return self.__class__(hits, genes=self._genes, windows=self._windows)
+
+    def select_closest(self):
+        """Selects hits of the genes closest to each insertion."""
+
+        if len(self) == 0:
+            return self
+
+        ins_idx = self._hits['insertion'].to_numpy()
+        abs_distances = np.abs(self._hits['distance'].to_numpy())
+
+        closest = np.full(ins_idx.max() + 1, np.iinfo(np.int64).max)
+        np.minimum.at(closest, ins_idx, abs_distances)
+
+        return self._subset(abs_distances == closest[ins_idx])
+
+    def filter_blacklist(self, blacklist, field='gene_id'):
+        """Removes hits of genes in the given blacklist."""
+
+        values = self._genes[field].iloc[self._hits['gene'].to_numpy()]
+        return self._subset(~values.isin(blacklist).to_numpy(dtype=bool))
+
+    def to_frame(self):
+        """Returns hits together with the ids and names of the hit genes.
+
+        Windows are identified by their names if the windows of the
+        table are known, otherwise by their index.
+        """
+
+        gene_idx = self._hits['gene'].to_numpy()
+
+        frame = self._hits.assign(
+            gene_id=self._genes['gene_id'].to_numpy()[gene_idx],
+            gene_name=self._genes['gene_name'].to_numpy()[gene_idx])
+
+        if self._windows is not None:
+            names = np.array(
+                [window.name for window in self._windows], dtype=object)
+            frame['window'] = names[frame['window'].to_numpy()]
+
+        return frame
+
+    def join(self, insertions):
+        """Joins hits with the annotated insertions.
+
+        Parameters
+        ----------
+        insertions : pd.DataFrame
+            Annotated insertions (in frame format), in the same order
+            as used for annotation.
+
+        Returns
+        -------
+        pd.DataFrame
+            Frame containing a row per hit of each insertion, with the
+            metadata of the hit gene added as extra columns (see
+            ``GENE_METADATA_COLUMNS``). Insertions without hits are
+            included once, without gene metadata.
+
+        """
+
+        ins_idx = self._hits['insertion'].to_numpy()
+        gene_idx = self._hits['gene'].to_numpy()
+
+        # Determine the rows of the joined frame, in which insertions
+        # without any hits occupy a single row.
+        counts = np.bincount(ins_idx, minlength=len(insertions))
+        rows = np.maximum(counts, 1)
+
+        joined = insertions.iloc[np.repeat(np.arange(len(insertions)), rows)]
+        joined = joined.reset_index(drop=True)
+
+        hit_rows = (np.arange(len(ins_idx)) +
+                    (np.cumsum(rows) - rows - np.cumsum(counts) +
+                     counts)[ins_idx])
+
+        gene_metadata = {
+            'gene_id': self._genes['gene_id'].to_numpy()[gene_idx],
+            'gene_name': self._genes['gene_name'].to_numpy()[gene_idx],
+            'gene_distance': self._hits['distance'].to_numpy(),
+            'gene_orientation':
+            self._hits['orientation'].to_numpy(dtype=object)
+        }
+
+        for column, values in gene_metadata.items():
+            # Rows without hits get missing values (or keep any
+            # existing values of the column).
+            values = pd.Series(values, index=hit_rows).reindex(
+                np.arange(len(joined)))
+
+            if column in joined.columns:
+                values = values.fillna(joined[column])
+
+            joined[column] = values
+
+        return joined
@@ -1,5 +1,3 @@
-import itertools
-
 import numpy as np
 
 from pyim.vendor.frozendict import frozendict
@@ -11,8 +9,8 @@ def select_closest(insertion, genes):
     if len(genes) == 0:
         return genes
 
-    distances = np.array([_calc_distance(insertion, gene)
-                          for gene in genes.itertuples()])  # yapf: disable
+    distances = calc_distances(insertion.position, genes['start'].values,
+                               genes['end'].values, genes['strand'].values)
     abs_distances = np.abs(distances)
 
     return genes.loc[abs_distances == abs_distances.min()]
@@ -23,18 +21,31 @@ def filter_blacklist(genes, blacklist, field='gene_id'):
     return genes.loc[~genes[field].isin(blacklist)]
 
 
+# Metadata columns added to annotated insertions.
+GENE_METADATA_COLUMNS = [
+    'gene_id', 'gene_name', 'gene_distance', 'gene_orientation'
+]
+
+
 def annotate_insertion(insertion, hits):
     """Annotates insertion with given gene hits."""
 
     if len(hits) > 0:
         # Annotate insertion with overlapping genes.
-        for row in hits.itertuples():
+        distances = calc_distances(insertion.position, hits['start'].values,
+                                   hits['end'].values, hits['strand'].values)
+        orientations = calc_orientations(insertion.strand,
+                                         hits['strand'].values)
+
+        columns = zip(hits['gene_id'].tolist(), hits['gene_name'].tolist(),
+                      distances.tolist(), orientations.tolist())
+
+        for gene_id, gene_name, distance, orientation in columns:
             gene_metadata = {
-                'gene_id': row.gene_id,
-                'gene_name': row.gene_name,
-                'gene_distance': _calc_distance(insertion, row),
-                'gene_orientation': 'sense' if row.strand \
-                    == insertion.strand else 'antisense'
+                'gene_id': gene_id,
+                'gene_name': gene_name,
+                'gene_distance': distance,
+                'gene_orientation': orientation
             }
 
             metadata = {**insertion.metadata,
@@ -45,16 +56,28 @@ def annotate_insertion(insertion, hits):
         yield insertion
 
 
-def _calc_distance(insertion, gene):
-    assert not isinstance(gene.strand, str)
+def calc_distances(positions, starts, ends, strands):
+    """Calculates distances between insertions and genes.
 
-    if gene.start <= insertion.position < gene.end:
-        return 0
-    elif insertion.position > gene.end:
-        dist = insertion.position - gene.end
-    else:
-        dist = insertion.position - gene.start
+    Distances are zero for insertions within a gene and are otherwise
+    relative to the closest end of the gene, with negative distances
+    for insertions upstream of the gene (with respect to its strand).
+    Arguments may be given as arrays (of equal length) or scalars.
+    """
+
+    positions = np.asarray(positions, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    inside = (starts <= positions) & (positions < ends)
+    distances = np.where(positions > ends, positions - ends,
+                         positions - starts) * np.asarray(strands)
+
+    return np.where(inside, 0, distances).astype(np.int64)
 
-    dist *= gene.strand
 
-    return dist
+def calc_orientations(strands, gene_strands):
+    """Determines orientation of insertions relative to genes."""
+    return np.where(
+        np.asarray(strands) == np.asarray(gene_strands), 'sense',
+        'antisense').astype(object)
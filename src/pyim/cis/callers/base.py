@@ -1,4 +1,4 @@
- import abc
+import abc
 from pathlib import Path
 
 import toolz
@@ -37,6 +37,7 @@ class CisCallerCommand(Command):
         parser.add_argument('--output', type=Path, required=True)
         parser.add_argument(
             '--output_sites', type=Path, required=False, default=None)
+        parser.add_argument('--chunk_size', type=int, default=None)
 
     @staticmethod
     def _annotate_insertions(insertions, cis_mapping):
@@ -51,12 +52,16 @@ class CisCallerCommand(Command):
                 yield insertion._replace(metadata=frozendict(new_metadata))
 
     @staticmethod
-    def _write_outputs(insertions, cis_sites, args):
-        Insertion.to_csv(args.output, insertions, sep='\t', index=False)
+    def _write_outputs(insertions, cis_sites, args, metadata_columns=None):
+        Insertion.write(
+            args.output,
+            insertions,
+            chunksize=args.chunk_size,
+            metadata_columns=metadata_columns)
 
         if args.output_sites is None:
-            cis_path = args.output.with_suffix('.sites.txt')
+            cis_path = args.output.with_suffix('.sites' + args.output.suffix)
         else:
             cis_path = args.output_sites
 
-        CisSite.to_csv(cis_path, cis_sites, sep='\t', index=False)
+        CisSite.write(cis_path, cis_sites)
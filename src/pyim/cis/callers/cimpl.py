@@ -6,7 +6,7 @@ from rpy2.robjects.packages import importr
 from rpy2.robjects.vectors import DataFrame as RDataFrame, StrVector, IntVector
 from pyim.util.rpy2 import pandas_to_dataframe, dataframe_to_pandas
 
-from pyim.model import Insertion, CisSite
+from pyim.model import Insertion, InsertionTable, CisSite
 from pyim.util import add_prefix, remove_prefix
 
 from .base import CisCaller, CisCallerCommand
@@ -107,6 +107,9 @@ class CimplCisCaller(CisCaller):
         cimpl_ins = (ins_frame[list(column_map.keys())]
                      .rename(columns=column_map))
 
+        # Pass categorical columns as plain strings (rather than factors).
+        cimpl_ins = cimpl_ins.astype({'chr': str, 'sampleID': str})
+
         # Add chr prefix.
         cimpl_ins['chr'] = add_prefix(cimpl_ins['chr'], prefix='chr')
 
@@ -242,7 +245,7 @@ class CimplCisCallerCommand(CisCallerCommand):
 
     def run(self, args):
         # Read insertions.
-        insertions = list(Insertion.from_csv(args.insertions, sep='\t'))
+        insertions = InsertionTable.read(args.insertions)
 
         # Call CIS sites.
         caller = CimplCisCaller(
@@ -259,7 +262,11 @@ class CimplCisCallerCommand(CisCallerCommand):
 
         # Annotate insertions and write outputs.
         annotated_ins = self._annotate_insertions(insertions, cis_mapping)
-        self._write_outputs(annotated_ins, cis_sites, args)
+        self._write_outputs(
+            annotated_ins,
+            cis_sites,
+            args,
+            metadata_columns=insertions.metadata_columns + ['cis_id'])
 
 
 def expand_column(frame, col, delimiter):
@@ -1,5 +1,6 @@
 """Module with functions for calling bowtie2."""
 
+from pathlib import Path
 import sys
 
 from . import util as shell
@@ -10,6 +11,7 @@ def bowtie2(read_paths,
             output_path,
             options=None,
             read2_paths=None,
+            sort_order='coordinate',
             verbose=False):
     """
     Aligns reads to a reference genome using Bowtie2.
@@ -25,6 +27,11 @@ def bowtie2(read_paths,
         format expected by flatten_arguments.
     read2_paths : List[Path]
         Path to input files containing the second end (for paired-end data).
+    sort_order : str
+        Order of the alignments in the output bam file. Can be either
+        'coordinate' (sorted by position), 'name' (sorted by read name)
+        or 'collate' (alignments grouped by read name, which is faster
+        than sorting by name).
     verbose : bool
         Whether to print output from bowtie2 to stderr.
 
@@ -43,20 +50,187 @@ def bowtie2(read_paths,
     if any(ext in read_paths[0].suffixes for ext in {'.fa', '.fna'}):
         options['-f'] = True
 
+    _run_bowtie2(
+        options,
+        index_path=index_path,
+        output_path=output_path,
+        sort_order=sort_order,
+        verbose=verbose)
+
+
+def bowtie2_stdin(read_chunks,
+                  index_path,
+                  output_path,
+                  options=None,
+                  fasta=False,
+                  interleaved=False,
+                  sort_order='coordinate',
+                  verbose=False):
+    """
+    Aligns reads that are streamed to Bowtie2 via stdin.
+
+    Parameters
+    ----------
+    read_chunks : Iterable[bytes]
+        Chunks of fastq (or fasta) formatted reads.
+    index_path : Path
+        Path to the bowtie2 index.
+    output_path : Path
+        Output path for the aligned (and sorted) bam file.
+    options : dict
+        Dict of extra options to pass to Bowtie2. Should conform to the
+        format expected by flatten_arguments.
+    fasta : bool
+        Whether the reads are in fasta (instead of fastq) format.
+    interleaved : bool
+        Whether the reads are interleaved mate pairs (paired-end data).
+    sort_order : str
+        Order of the alignments in the output bam file (see ``bowtie2``).
+    verbose : bool
+        Whether to print output from bowtie2 to stderr.
+
+    """
+
+    options = _stdin_options(options, fasta=fasta, interleaved=interleaved)
+
+    _run_bowtie2(
+        options,
+        index_path=index_path,
+        output_path=output_path,
+        sort_order=sort_order,
+        verbose=verbose,
+        input_chunks=read_chunks)
+
+
+def bowtie2_piped(input_args,
+                  index_path,
+                  output_path,
+                  options=None,
+                  fasta=False,
+                  interleaved=False,
+                  sort_order='coordinate',
+                  verbose=False):
+    """
+    Aligns reads produced by a pipeline of (trimming) commands.
+
+    The given commands are piped into each other and into Bowtie2, so that
+    all steps run concurrently without writing intermediate files.
+
+    Parameters
+    ----------
+    input_args : List[List[str]]
+        Arguments of the commands that produce the reads. The first
+        command should read its own inputs, the last command should write
+        the reads in fastq (or fasta) format to stdout.
+    index_path : Path
+        Path to the bowtie2 index.
+    output_path : Path
+        Output path for the aligned (and sorted) bam file.
+    options : dict
+        Dict of extra options to pass to Bowtie2. Should conform to the
+        format expected by flatten_arguments.
+    fasta : bool
+        Whether the reads are in fasta (instead of fastq) format.
+    interleaved : bool
+        Whether the reads are interleaved mate pairs (paired-end data).
+    sort_order : str
+        Order of the alignments in the output bam file (see ``bowtie2``).
+    verbose : bool
+        Whether to print output from bowtie2 to stderr.
+
+    Returns
+    -------
+    List[subprocess.Popen]
+        Handles to the completed input processes, which can be used to
+        read the stderr output of these processes.
+
+    """
+
+    if len(input_args) == 0:
+        raise ValueError('At least one input command should be given')
+
+    options = _stdin_options(options, fasta=fasta, interleaved=interleaved)
+
+    processes = _run_bowtie2(
+        options,
+        index_path=index_path,
+        output_path=output_path,
+        sort_order=sort_order,
+        verbose=verbose,
+        input_args=input_args)
+
+    return processes[:len(input_args)]
+
+
+def bowtie2_index_files(index_path):
+    """Returns the files making up a bowtie2 index."""
+
+    index_path = Path(index_path)
+    return sorted(index_path.parent.glob(index_path.name + '.*.bt2*'))
+
+
+def _stdin_options(options, fasta=False, interleaved=False):
+    """Builds options for reading reads from stdin."""
+
+    options = dict(options) if options is not None else {}
+
+    if interleaved:
+        options['--interleaved'] = '-'
+    else:
+        options['-U'] = '-'
+
+    if fasta:
+        options['-f'] = True
+
+    return options
+
+
+def _run_bowtie2(options,
+                 index_path,
+                 output_path,
+                 sort_order='coordinate',
+                 verbose=False,
+                 input_chunks=None,
+                 input_args=None):
+    """Runs bowtie2 with given options, piping output to samtools."""
+
+    options = dict(options)
     options['-x'] = str(index_path)
 
     # Build bowtie2 arguments.
     bowtie_args = ['bowtie2'] + shell.flatten_arguments(options)
 
     # Sort arguments for samtools.
-    sort_args = ['samtools', 'sort', '-o', str(output_path), '-']
+    sort_args = _samtools_sort_args(output_path, sort_order=sort_order)
 
     # Run in piped fashion to avoid extra IO.
-    processes = shell.run_piped([bowtie_args, sort_args])
+    args_list = list(input_args or []) + [bowtie_args, sort_args]
+
+    if input_chunks is None:
+        processes = shell.run_piped(args_list)
+    else:
+        processes = shell.run_piped(args_list, input_chunks=input_chunks)
 
     if verbose:
         # Print bowtie output to stderr for now.
         # TODO: Rewrite to use logging.
         print('', file=sys.stderr)
-        stderr = processes[0].stderr.read().decode()
+        stderr = processes[-2].stderr.read().decode()
         print(stderr, file=sys.stderr)
+
+    return processes
+
+
+def _samtools_sort_args(output_path, sort_order='coordinate'):
+    """Builds samtools arguments for sorting alignments in given order."""
+
+    if sort_order == 'coordinate':
+        sort_args = ['samtools', 'sort']
+    elif sort_order == 'name':
+        sort_args = ['samtools', 'sort', '-n']
+    elif sort_order == 'collate':
+        sort_args = ['samtools', 'collate']
+    else:
+        raise ValueError('Unknown sort order {!r}'.format(sort_order))
+
+    return sort_args + ['-o', str(output_path), '-']
@@ -2,12 +2,16 @@
 
 import itertools
 from pathlib import Path
+import re
 import shutil
 
 import pyfaidx
 
 from . import util as shell
 
+# Minimum version of cutadapt that supports the --interleaved option.
+INTERLEAVED_MIN_VERSION = (1, 15)
+
 
 def cutadapt(read_path, out_path, options, read2_path=None, out2_path=None):
     """Runs cutadapt using the given options."""
@@ -37,6 +41,80 @@ def cutadapt(read_path, out_path, options, read2_path=None, out2_path=None):
     return shell.run(cmdline_args)
 
 
+def cutadapt_stream_args(options, read_path=None, read2_path=None):
+    """Builds arguments for running cutadapt on interleaved mate pairs.
+
+    Trimmed mates are written in interleaved format to stdout, which
+    allows the output to be piped into another process. As cutadapt writes
+    its report to stderr in this case, the summary can be obtained by
+    passing the stderr of the process to ``cutadapt_summary``.
+
+    Parameters
+    ----------
+    options : dict
+        Dict of options to pass to cutadapt.
+    read_path : Path
+        Path to the first mates. If not given, interleaved mates are
+        read from stdin.
+    read2_path : Path
+        Path to the second mates. Required if read_path is given.
+
+    Returns
+    -------
+    List[str]
+        Arguments for the cutadapt process.
+
+    """
+
+    if (read_path is None) != (read2_path is None):
+        raise ValueError('Both read_path and read2_path must be specified '
+                         'for reading mates from separate files')
+
+    options = dict(options) if options is not None else {}
+    options['--interleaved'] = True
+
+    cmdline_args = ['cutadapt'] + shell.flatten_arguments(options)
+
+    if read_path is None:
+        cmdline_args += ['-']
+    else:
+        cmdline_args += [str(read_path), str(read2_path)]
+
+    return cmdline_args
+
+
+def cutadapt_version():
+    """Returns the (major, minor) version of the cutadapt executable."""
+
+    process = shell.run(['cutadapt', '--version'])
+    version = process.stdout.read().decode().strip()
+
+    match = re.match(r'(\d+)\.(\d+)', version)
+    if match is None:
+        raise ValueError('Unable to determine cutadapt version from {!r}'
+                         .format(version))
+
+    return int(match.group(1)), int(match.group(2))
+
+
+def check_interleaved_support():
+    """Checks if the cutadapt executable supports interleaved mates.
+
+    Raises a ValueError if the installed version of cutadapt is older
+    than ``INTERLEAVED_MIN_VERSION``, which is required for streaming
+    mates through cutadapt (see ``cutadapt_stream_args``).
+    """
+
+    version = cutadapt_version()
+
+    if version < INTERLEAVED_MIN_VERSION:
+        raise ValueError(
+            'Streaming mates requires cutadapt {} or newer (found {}), '
+            'upgrade cutadapt or disable streaming'.format(
+                '.'.join(map(str, INTERLEAVED_MIN_VERSION)),
+                '.'.join(map(str, version))))
+
+
 def demultiplex_samples(read_path,
                         output_dir,
                         barcode_path,
@@ -1,6 +1,7 @@
 """Utility module for running with external commands."""
 
 import subprocess
+import threading
 
 
 def run(args, stdout=None, stderr=None, check=True):
@@ -54,12 +55,19 @@ def _open_stdstream(file_path, mode='w'):
         return file_path.open(mode)
 
 
+def _read_stdstream(stdstream):
+    if stdstream is None or stdstream.closed:
+        return ''
+    return stdstream.read().decode()
+
+
 def _close_stdstream(stdstream):
     if stdstream != subprocess.PIPE:
         stdstream.close()
 
 
-def run_piped(args_list, stdout=None, stderrs=None, check=True):
+def run_piped(args_list, stdout=None, stderrs=None, check=True,
+              input_chunks=None):
     """Runs piped command for given list of arguments.
 
     Parameters
@@ -72,11 +80,15 @@ def run_piped(args_list, stdout=None, stderrs=None, check=True):
         Specifies the standard error handles for the processes.
     check : bool
         Whether to check the returncode of the process.
+    input_chunks : Iterable[bytes]
+        Optional iterable of bytes, which is written (from a separate
+        thread) to the standard input of the first process.
 
     Returns
     -------
-    subprocess.Popen
-        Handle to completed process.
+    List[subprocess.Popen]
+        Handles to the completed processes. If check is True, the return
+        codes of all processes are checked (not only of the final one).
 
     """
 
@@ -89,9 +101,11 @@ def run_piped(args_list, stdout=None, stderrs=None, check=True):
     # Handle processes 1 to n-1.
     processes = []
     stream_handles = []
+    writer = None
 
     try:
-        prev_out = None
+        prev_out = None if input_chunks is None else subprocess.PIPE
+
         for arg_list, stderr in zip(args_list[:-1], stderrs[:-1]):
             # Setup processes.
             stderr_fh = _open_stdstream(stderr)
@@ -120,15 +134,29 @@ def run_piped(args_list, stdout=None, stderrs=None, check=True):
         for process in processes[:-1]:
             process.stdout.close()
 
+        # Feed input to the first process.
+        if input_chunks is not None:
+            writer = _StdinWriter(processes[0].stdin, input_chunks)
+            writer.start()
+
         final_process.wait()
 
+        for process in processes[:-1]:
+            process.wait()
+
+        if writer is not None:
+            writer.join()
+            writer.check()
+
         # Check return codes.
         if check:
-            if final_process.returncode != 0:
-                stderr_msg = final_process.stderr.read().decode()
-                raise ValueError('Process terminated with errorcode {}\n\n'
-                                 'Output from stderr:\n\n'.format(
-                                     final_process.returncode) + stderr_msg)
+            for process in processes:
+                if process.returncode != 0:
+                    stderr_msg = _read_stdstream(process.stderr)
+                    raise ValueError('Process {} terminated with errorcode '
+                                     '{}\n\nOutput from stderr:\n\n'.format(
+                                         process.args[0], process.returncode)
+                                     + stderr_msg)
 
     finally:
         # Close all file handles.
@@ -138,6 +166,36 @@ def run_piped(args_list, stdout=None, stderrs=None, check=True):
     return processes
 
 
+class _StdinWriter(threading.Thread):
+    """Thread that writes chunks of bytes to the stdin of a process."""
+
+    def __init__(self, stdin, chunks):
+        super().__init__(daemon=True)
+        self._stdin = stdin
+        self._chunks = chunks
+        self._error = None
+
+    def run(self):
+        try:
+            for chunk in self._chunks:
+                self._stdin.write(chunk)
+        except BrokenPipeError:
+            # Process exited early, which is reported by its return code.
+            pass
+        except Exception as error:  # pylint: disable=broad-except
+            self._error = error
+        finally:
+            try:
+                self._stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def check(self):
+        """Re-raises any error that occurred while generating input."""
+        if self._error is not None:
+            raise self._error
+
+
 def flatten_arguments(arg_dict):
     """Flattens a dict of options into an argument list.
 
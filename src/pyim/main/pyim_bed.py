@@ -10,6 +10,7 @@ import numpy as np
 import pandas as pd
 
 from pyim.model import Insertion
+from pyim.util.tabix import write_tabix
 
 RED = '255,0,0'
 BLUE = '0,0,255'
@@ -22,7 +23,7 @@ def main():
     args = parse_args()
 
     # Read insertions.
-    insertion_df = Insertion.from_csv(args.insertions, sep='\t', as_frame=True)
+    insertion_df = Insertion.read(args.insertions, as_frame=True)
 
     # Drop any columns if needed.
     if args.drop_columns is not None:
@@ -51,7 +52,22 @@ def main():
     )  # yapf: disable
 
     # Write output.
-    bed_frame.to_csv(str(args.output), sep='\t', index=False, header=False)
+    if args.tabix:
+        # Note: start positions are clipped to zero, as tabix does not
+        # accept negative coordinates.
+        for column in ['chromStart', 'thickStart']:
+            bed_frame[column] = bed_frame[column].clip(lower=0)
+
+        write_tabix(
+            bed_frame,
+            args.output,
+            chrom_col='chrom',
+            start_col='chromStart',
+            end_col='chromEnd',
+            header=False)
+    else:
+        bed_frame.to_csv(
+            str(args.output), sep='\t', index=False, header=False)
 
 
 def parse_args():
@@ -64,6 +80,7 @@ def parse_args():
 
     parser.add_argument('--width', default=500, type=int)
     parser.add_argument('--drop_columns', nargs='+', default=None)
+    parser.add_argument('--tabix', default=False, action='store_true')
 
     return parser.parse_args()
 
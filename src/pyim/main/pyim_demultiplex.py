@@ -1,14 +1,19 @@
 import argparse
+from collections import Counter
+import logging
 from pathlib import Path
 
 import pandas as pd
 
+from pyim.align.barcode import BarcodeIndex, demultiplex_reads
 from pyim.external.cutadapt import demultiplex_samples
 
 
 def main():
     """Main function for pyim-demultiplex."""
 
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+
     args = parse_args()
 
     # Construct sample mapping if given.
@@ -19,12 +24,33 @@ def main():
         sample_mapping = None
 
     # Perform de-multiplexing.
-    demultiplex_samples(
-        reads_path=args.reads,
-        output_dir=args.output_dir,
-        barcode_path=args.barcodes,
-        error_rate=args.error_rate,
-        sample_mapping=sample_mapping)
+    if args.native:
+        index = BarcodeIndex.from_fasta(
+            args.barcodes,
+            barcode_mapping=sample_mapping,
+            mismatches=args.mismatches)
+
+        counts = Counter()
+        demultiplex_reads(
+            read_path=args.reads,
+            read2_path=args.reads2,
+            output_dir=args.output_dir,
+            index=index,
+            processes=args.processes,
+            compress=True if args.compress else None,
+            counts=counts)
+
+        logging.info('Read counts per barcode:')
+
+        for name in index.names + ['ambiguous', 'unmatched']:
+            logging.info('  %-18s: %d', name, counts[name])
+    else:
+        demultiplex_samples(
+            read_path=args.reads,
+            output_dir=args.output_dir,
+            barcode_path=args.barcodes,
+            error_rate=args.error_rate,
+            sample_mapping=sample_mapping)
 
 
 def parse_args():
@@ -33,13 +59,30 @@ def parse_args():
     parser = argparse.ArgumentParser(prog='pyim-demultiplex')
 
     parser.add_argument('--reads', required=True, type=Path)
+    parser.add_argument('--reads2', default=None, type=Path)
     parser.add_argument('--output_dir', required=True, type=Path)
     parser.add_argument('--barcodes', required=True, type=Path)
 
     parser.add_argument('--sample_mapping', type=Path)
     parser.add_argument('--error_rate', type=float, default=0.0)
 
-    return parser.parse_args()
+    parser.add_argument('--native', default=False, action='store_true')
+    parser.add_argument('--mismatches', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--compress', default=False, action='store_true')
+
+    args = parser.parse_args()
+
+    # Check for options that are only supported by one of the methods.
+    if args.native:
+        if args.error_rate > 0:
+            parser.error('--error_rate is not supported for native '
+                         'de-multiplexing, use --mismatches instead')
+    elif args.reads2 is not None or args.processes > 1:
+        parser.error('Paired-end data and multiple processes are '
+                     'only supported for native de-multiplexing')
+
+    return args
 
 
 if __name__ == '__main__':
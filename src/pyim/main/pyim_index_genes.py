@@ -0,0 +1,40 @@
+"""Script for the pyim-index-genes command.
+
+Parses genes from a GTF file into the gene cache used by pyim-annotate."""
+
+import argparse
+import logging
+from pathlib import Path
+
+from pyim.annotate.genes import cache_genes
+
+logging.basicConfig(
+    format='[%(asctime)-15s]  %(message)s',
+    level=logging.INFO,
+    datefmt='%Y-%m-%d %H:%M:%S')
+
+
+def main():
+    """Main function for pyim-index-genes."""
+
+    args = parse_args()
+
+    frame_path, _ = cache_genes(
+        args.gtf, cache_dir=args.cache_dir, processes=args.processes)
+    logging.info('Cached genes in %s', frame_path.parent)
+
+
+def parse_args():
+    """Parses arguments for pyim-index-genes."""
+
+    parser = argparse.ArgumentParser(prog='pyim-index-genes')
+
+    parser.add_argument('--gtf', type=Path, required=True)
+    parser.add_argument('--cache_dir', type=Path, required=True)
+    parser.add_argument('--processes', type=int, default=1)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,266 @@
 import logging
 from argparse import ArgumentParser
 from collections import Counter
-from itertools import chain
 from pathlib import Path
 
+from natsort import natsorted
+import numpy as np
 import pandas as pd
+import toolz
 
-from pyim.model import Insertion
+from pyim.model import FRAME_CHUNK_SIZE, Insertion
+from pyim.util.frame import frame_format, frame_memory, read_frame
+from pyim.util.path import WorkDirectory
+
+# Default maximum number of inputs that are merged (and opened) at once.
+DEFAULT_MAX_OPEN = 64
+
+logging.basicConfig(
+    format='[%(asctime)-15s]  %(message)s',
+    level=logging.INFO,
+    datefmt='%Y-%m-%d %H:%M:%S')
 
 
 def main():
     args = parse_args()
 
-    # Read insertions.
-    frames = [pd.read_csv(fp, sep='\t') for fp in args.insertions]
+    logger = logging.getLogger()
+
+    # Check for duplicate samples (only reading sample/chromosome columns).
+    samples, chromosomes = _read_samples(args.insertions)
 
-    # Check for duplicate samples.
-    samples = list(chain.from_iterable(set(df['sample']) for df in frames))
-    duplicates = [s for s, count in Counter(samples).items() if count > 1]
+    counts = Counter(toolz.concat(samples))
+    duplicates = sorted(s for s, count in counts.items() if count > 1)
 
-    if len(duplicates) > 1:
+    if len(duplicates) > 0:
         raise ValueError('Duplicate sample names in inputs: {}'
                          .format(', '.join(duplicates)))
 
-    # Merge and write output.
-    merged = pd.concat(frames, axis=0, ignore_index=True)
-    merged.to_csv(str(args.output), sep='\t', index=False)
+    if args.max_open < 2:
+        raise ValueError('--max_open should be at least 2')
+
+    metadata_columns = _read_metadata_columns(args.insertions)
+
+    keep_work_dir = args.work_dir is not None
+
+    with WorkDirectory(args.work_dir, keep=keep_work_dir) as work_dir:
+        if args.sorted:
+            logger.info('Merging %d sorted inputs', len(args.insertions))
+            merged = _merge_sorted_files(
+                args.insertions,
+                chromosomes=chromosomes,
+                chunk_size=args.chunk_size,
+                max_open=args.max_open,
+                work_dir=work_dir)
+        else:
+            # Inputs are read lazily, so only one input is open at a time.
+            logger.info('Merging %d inputs', len(args.insertions))
+            merged = toolz.concat(
+                _iter_chunks(args.insertions, chunk_size=args.chunk_size))
+
+        # Write merged output.
+        num_written = _write_chunks(args.output, merged, metadata_columns)
+        logger.info('Wrote %d merged insertions', num_written)
+
+
+def _iter_chunks(file_paths, chunk_size):
+    """Returns iterables of insertion chunks for the given inputs."""
+    return [
+        Insertion.iter_read(file_path, chunksize=chunk_size, as_frame=True)
+        for file_path in file_paths
+    ]
+
+
+def _read_metadata_columns(file_paths):
+    """Reads the (combined) metadata columns of the given inputs."""
+    return list(
+        toolz.unique(
+            toolz.concat(
+                Insertion.read_metadata_columns(file_path)
+                for file_path in file_paths)))
+
+
+def _merge_sorted_files(file_paths, chromosomes, chunk_size, max_open,
+                        work_dir):
+    """Merges sorted input files, opening at most max_open at a time.
+
+    If there are more inputs than ``max_open``, consecutive groups of
+    ``max_open`` inputs are first merged into temporary (sorted) files
+    in ``work_dir``, repeating until few enough files remain. As groups
+    are consecutive, insertions at the same position remain ordered by
+    input. Temporary files should be kept until the merged chunks have
+    been consumed.
+    """
+
+    file_paths = list(file_paths)
+    level = 0
+
+    while len(file_paths) > max_open:
+        logging.info('Merging %d sorted inputs in groups of %d',
+                     len(file_paths), max_open)
+
+        merged_paths = []
+
+        for i, group in enumerate(toolz.partition_all(max_open, file_paths)):
+            if len(group) == 1:
+                merged_paths.append(group[0])
+            else:
+                merged_path = work_dir / 'merged.{}.{}.txt'.format(level, i)
+
+                merged = merge_sorted(
+                    _iter_chunks(group, chunk_size=chunk_size),
+                    chromosomes=chromosomes)
+                _write_chunks(merged_path, merged,
+                              _read_metadata_columns(group))
+
+                merged_paths.append(merged_path)
+
+        file_paths = merged_paths
+        level += 1
+
+    return merge_sorted(
+        _iter_chunks(file_paths, chunk_size=chunk_size),
+        chromosomes=chromosomes)
+
+
+def _read_samples(file_paths):
+    """Reads the samples and chromosomes contained in each input."""
+
+    samples, chromosomes = [], set()
+
+    for file_path in file_paths:
+        frame = read_frame(
+            file_path,
+            columns=['sample', 'chromosome'],
+            dtypes={'sample': 'category',
+                    'chromosome': 'category'})
+
+        samples.append(set(frame['sample']))
+        chromosomes |= set(frame['chromosome'])
+
+    return samples, natsorted(chromosomes)
+
+
+def _write_chunks(output_path, chunks, metadata_columns):
+    """Writes chunks of insertions to the output file.
+
+    Chunks are written incrementally for tsv outputs, whereas binary
+    outputs are written at once (after concatenating all chunks).
+    """
+
+    num_written = 0
+
+    if frame_format(output_path) == 'text':
+        with Insertion.csv_writer(
+                output_path, metadata_columns=metadata_columns,
+                sep='\t') as writer:
+            for chunk in chunks:
+                writer.write_frame(chunk)
+                num_written += len(chunk)
+    else:
+        merged = Insertion.format_frame(
+            pd.concat(list(chunks), axis=0, ignore_index=True))
+
+        logging.info('Merged insertions use %s', frame_memory(merged))
+        Insertion.write_frame(output_path, merged)
+
+        num_written = len(merged)
+
+    return num_written
+
+
+def merge_sorted(chunk_iters, chromosomes):
+    """Merges chunks of coordinate-sorted insertions from multiple inputs.
+
+    Inputs are expected to be sorted by chromosome (in natural order, as
+    given by ``chromosomes``) and position. Merging is performed on chunks
+    rather than single rows: in each step, all buffered rows up to the
+    smallest of the last (buffered) keys of the inputs are merged and
+    emitted, as no row following in any of the inputs can precede these
+    rows. This guarantees that at least one buffer is exhausted per step,
+    after which its input is advanced by one chunk. As such, at most one
+    chunk per input is held in memory at a time.
+
+    Parameters
+    ----------
+    chunk_iters : List[Iterable[pd.DataFrame]]
+        Chunks of insertions (in frame format) for each input.
+    chromosomes : List[str]
+        Chromosomes in sort order.
+
+    Yields
+    ------
+    pd.DataFrame
+        Chunks of merged insertions, in sorted order. Insertions
+        at the same position are ordered by input.
+
+    """
+
+    ranks = {chrom: i for i, chrom in enumerate(chromosomes)}
+
+    iters = [iter(chunk_iter) for chunk_iter in chunk_iters]
+    buffers = [_next_sorted(it, ranks) for it in iters]
+    last_keys = [None] * len(iters)
+
+    while True:
+        active = [i for i, buf in enumerate(buffers) if buf is not None]
+
+        if len(active) == 0:
+            break
+
+        bound = min(buffers[i][1][-1] for i in active)
+
+        parts, part_keys = [], []
+        for i in active:
+            chunk, keys = buffers[i]
+
+            # Check ordering across chunks of the same input.
+            if last_keys[i] is not None and keys[0] < last_keys[i]:
+                raise ValueError('Input {} is not sorted by chromosome/'
+                                 'position'.format(i + 1))
+
+            num_rows = np.searchsorted(keys, bound, side='right')
+
+            parts.append(chunk.iloc[:num_rows])
+            part_keys.append(keys[:num_rows])
+
+            if num_rows > 0:
+                last_keys[i] = keys[num_rows - 1]
+
+            if num_rows < len(keys):
+                buffers[i] = (chunk.iloc[num_rows:], keys[num_rows:])
+            else:
+                buffers[i] = _next_sorted(iters[i], ranks)
+
+        merged = pd.concat(parts, axis=0, ignore_index=True)
+        order = np.argsort(np.concatenate(part_keys), kind='stable')
+
+        yield merged.iloc[order].reset_index(drop=True)
+
+
+def _next_sorted(chunk_iter, ranks):
+    """Returns the next (chunk, keys) tuple of an input (or None)."""
+
+    for chunk in chunk_iter:
+        if len(chunk) > 0:
+            keys = _sort_keys(chunk, ranks)
+
+            if np.any(np.diff(keys) < 0):
+                raise ValueError('Inputs are not sorted by '
+                                 'chromosome/position')
+
+            return chunk, keys
+
+    return None
+
+
+def _sort_keys(chunk, ranks):
+    """Computes (int64) sort keys from chromosome ranks and positions."""
+
+    chrom_ranks = chunk['chromosome'].astype(str).map(ranks)
+    positions = chunk['position'].to_numpy(dtype=np.int64)
+
+    return (chrom_ranks.to_numpy(dtype=np.int64) << 32) + positions
 
 
 def parse_args():
@@ -34,6 +269,11 @@ def parse_args():
     parser.add_argument('--insertions', nargs='+', type=Path, required=True)
     parser.add_argument('--output', type=Path, required=True)
 
+    parser.add_argument('--sorted', default=False, action='store_true')
+    parser.add_argument('--chunk_size', default=FRAME_CHUNK_SIZE, type=int)
+    parser.add_argument('--max_open', default=DEFAULT_MAX_OPEN, type=int)
+    parser.add_argument('--work_dir', default=None, type=Path)
+
     return parser.parse_args()
 
 
@@ -1,10 +1,13 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import logging
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
-from pyim.model import Insertion
+from pyim.model import FRAME_CHUNK_SIZE, Insertion
+from pyim.util.frame import frame_format
 
 logging.basicConfig(
     format='[%(asctime)-15s]  %(message)s',
@@ -17,30 +20,153 @@ def main():
 
     args = parse_args()
 
-    # Read frame.
-    insertion_df = Insertion.from_csv(args.insertions, sep='\t', as_frame=True)
-
     # Create output directory if it doesn't exist.
     args.output_dir.mkdir(exist_ok=True, parents=True)
 
+    # Write outputs using the input format for binary inputs
+    # and tsv otherwise.
+    if frame_format(args.insertions) == 'text':
+        suffix = '.txt'
+    else:
+        suffix = args.insertions.suffix
+
+    # Route insertions into per-sample outputs in a single pass.
+    chunks = Insertion.iter_read(
+        args.insertions, chunksize=args.chunk_size, as_frame=True)
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        writer = SampleWriter(args.output_dir, suffix=suffix, pool=pool)
+
+        for chunk in chunks:
+            if args.samples is not None:
+                chunk = chunk.loc[chunk['sample'].isin(args.samples)]
+
+            writer.add(chunk, remove_prefix=args.remove_prefix)
+
+            if writer.num_buffered >= args.buffer_size:
+                writer.flush()
+
+        writer.close()
+
+    logging.info('Wrote insertions for %d samples', len(writer.samples))
+
+    # Write empty outputs for requested samples without insertions.
     if args.samples is not None:
-        # Subset for samples and convert to categorical.
-        mask = insertion_df['sample'].isin(args.samples)
+        for sample in args.samples:
+            if sample not in writer.samples:
+                logging.warning('No insertions found for sample %s', sample)
+
+                sample_path = args.output_dir / (sample + suffix)
+                Insertion.write(sample_path, [])
+
+
+class SampleWriter(object):
+    """Writes insertions to separate output files per sample.
+
+    Insertions are buffered per sample and written in batches when the
+    writer is flushed. Output files are only opened while writing a batch,
+    so that the number of open file handles is bounded by the number of
+    threads of the pool, rather than the number of samples. Batches for
+    different samples are written concurrently using the pool.
+
+    Binary (Parquet/Feather) outputs cannot be appended to, and are
+    therefore written at once when the writer is closed.
+
+    Parameters
+    ----------
+    output_dir : Path
+        Output directory.
+    suffix : str
+        Suffix of the output files, which determines the output format.
+    pool : concurrent.futures.Executor
+        Pool used for writing batches.
+
+    """
+
+    def __init__(self, output_dir, suffix, pool):
+        self._output_dir = output_dir
+        self._suffix = suffix
+        self._pool = pool
+
+        self._buffers = {}
+        self._num_buffered = 0
+
+        self._samples = set()
+        self._written = set()
 
-        insertion_df = insertion_df.loc[mask]
-        insertion_df['sample'] = pd.Categorical(
-            insertion_df['sample'], categories=args.samples)
+        self._append = frame_format(Path('sample' + suffix)) == 'text'
 
-    # Split and write individual outputs.
-    for sample, grp in insertion_df.groupby('sample'):
-        if args.remove_prefix:
-            grp['id'] = grp['id'].str.replace(sample + '.', '')
+    @property
+    def num_buffered(self):
+        """Number of currently buffered insertions."""
+        return self._num_buffered
 
-        if len(grp) == 0:
-            print('WARNING: no insertions found for sample {}'.format(sample))
+    @property
+    def samples(self):
+        """Samples for which insertions have been added."""
+        return set(self._samples)
 
-        sample_path = args.output_dir / '{}.txt'.format(sample)
-        grp.to_csv(str(sample_path), sep='\t', index=False)
+    def add(self, frame, remove_prefix=False):
+        """Adds insertions (in frame format) to the sample buffers."""
+
+        grouped = frame.groupby('sample', sort=False, observed=True)
+
+        for sample, grp in grouped:
+            if remove_prefix:
+                grp = grp.assign(id=_remove_prefix(grp['id'], sample + '.'))
+
+            self._buffers.setdefault(sample, []).append(grp)
+            self._samples.add(sample)
+
+        self._num_buffered += len(frame)
+
+    def flush(self):
+        """Writes all buffered insertions to their respective outputs."""
+
+        if self._append:
+            self._write_buffers()
+
+    def close(self):
+        """Writes any remaining buffered insertions."""
+        self._write_buffers()
+
+    def _write_buffers(self):
+        buffers, self._buffers = self._buffers, {}
+        self._num_buffered = 0
+
+        # Samples occur once per round, so batches for the same
+        # sample are never written concurrently.
+        list(self._pool.map(self._write, buffers.items()))
+
+    def _write(self, item):
+        sample, frames = item
+
+        frame = pd.concat(frames, axis=0, ignore_index=True)
+        sample_path = self._output_dir / (sample + self._suffix)
+
+        if self._append:
+            # Write header with the first batch, append others.
+            exists = sample in self._written
+
+            frame.to_csv(
+                str(sample_path),
+                sep='\t',
+                index=False,
+                mode='a' if exists else 'w',
+                header=not exists)
+
+            self._written.add(sample)
+        else:
+            Insertion.write_frame(sample_path, frame)
+
+
+def _remove_prefix(values, prefix):
+    """Removes prefix from the (string) values that start with it."""
+
+    values = values.astype(str)
+    has_prefix = values.str.startswith(prefix).to_numpy(dtype=bool)
+
+    return np.where(has_prefix, values.str.slice(len(prefix)), values)
 
 
 def parse_args():
@@ -54,6 +180,10 @@ def parse_args():
     parser.add_argument('--samples', nargs='+', required=False, default=None)
     parser.add_argument('--remove_prefix', default=False, action='store_true')
 
+    parser.add_argument('--threads', default=1, type=int)
+    parser.add_argument('--chunk_size', default=FRAME_CHUNK_SIZE, type=int)
+    parser.add_argument('--buffer_size', default=FRAME_CHUNK_SIZE, type=int)
+
     return parser.parse_args()
 
 
@@ -6,12 +6,22 @@ import numpy as np
 import pandas as pd
 import toolz
 
+from pyim.util.frame import (compact_dtypes, frame_columns, frame_format,
+                             frame_memory, iter_frame, read_frame,
+                             write_frame)
+from pyim.util.tabix import fetch_tabix, write_tabix
 from pyim.vendor.frozendict import frozendict
 
+# Number of rows converted (or read) at once when converting
+# frames to objects (or reading files in chunks).
+FRAME_CHUNK_SIZE = 100000
+
 
 class MetadataFrameMixin(object):
     """Mixin class adding namedtuple/frame conversion support."""
 
+    # Compact types for (core) columns in frames. Integer types are
+    # only applied to columns without missing values.
     _dtypes = {}
 
     @classmethod
@@ -24,6 +34,10 @@ class MetadataFrameMixin(object):
     def to_frame(cls, insertions):
         """Converts list of objects to a dataframe representation."""
 
+        if isinstance(insertions, MetadataTable):
+            # Tables are already backed by a frame.
+            return insertions.to_frame()
+
         # Check if insertions is empty.
         is_empty, insertions = cls._is_empty(insertions)
 
@@ -31,11 +45,9 @@ class MetadataFrameMixin(object):
             df = pd.DataFrame.from_records(
                 [], columns=cls._non_metadata_fields())
         else:
-            rows = (cls._to_dict(ins) for ins in insertions)
-            df = pd.DataFrame.from_records(rows)
-            df = cls.format_frame(df)
+            df = cls._to_columns(insertions)
 
-        return df
+        return cls.format_frame(df)
 
     @staticmethod
     def _is_empty(iterable):
@@ -48,17 +60,40 @@ class MetadataFrameMixin(object):
         return empty, iterable
 
     @classmethod
-    def _to_dict(cls, obj):
-        obj_data = obj._asdict()
-        metadata = obj_data.pop('metadata')
-        return toolz.merge(metadata, obj_data)
+    def _to_columns(cls, objs):
+        """Builds a frame by transposing objects into columns."""
+
+        columns = list(zip(*objs))
+        metadata = columns.pop()
+
+        data = dict(zip(cls._non_metadata_fields(), columns))
+
+        # Metadata keys are collected in order of first occurrence,
+        # values are missing (NaN) for objects lacking the key.
+        keys = toolz.unique(toolz.concat(metadata))
+
+        for key in keys:
+            if key not in data:
+                data[key] = [md.get(key, np.nan) for md in metadata]
+
+        return pd.DataFrame(data)
 
     @classmethod
     def _reorder_columns(cls, df, order):
         extra_cols = set(df.columns) - set(order)
         col_order = list(order) + sorted(extra_cols)
+
+        if list(df.columns) == col_order:
+            return df
+
         return df[col_order]
 
+    @classmethod
+    def _parse_dtypes(cls):
+        """Returns types of columns that can be applied during parsing."""
+        return {col: dtype
+                for col, dtype in cls._dtypes.items() if dtype == 'category'}
+
     @classmethod
     def check_frame(cls, df):
         missing = set(cls._non_metadata_fields()) - set(df.columns)
@@ -68,45 +103,267 @@ class MetadataFrameMixin(object):
 
     @classmethod
     def format_frame(cls, df):
-        cls.check_frame(df)
+        """Formats frame using compact column types and column order.
+
+        Only columns that do not yet have the expected type are converted
+        and the frame is only re-indexed if the column order differs, so
+        that frames that are already formatted are returned as is.
+        """
 
-        df2 = df.copy()
+        cls.check_frame(df)
 
-        for col, dtype in cls._dtypes.items():
-            df2[col] = df[col].astype(dtype)
+        dtypes = compact_dtypes(df, cls._dtypes)
 
-        df2 = cls._reorder_columns(df, order=cls._non_metadata_fields())
+        if len(dtypes) > 0:
+            df = df.astype(dtypes)
 
-        return df2
+        return cls._reorder_columns(df, order=cls._non_metadata_fields())
 
     @classmethod
-    def from_frame(cls, df):
-        """Converts dataframe into a list of objects."""
+    def from_frame(cls, df, chunk_size=FRAME_CHUNK_SIZE):
+        """Converts dataframe into a list of objects.
+
+        Objects are generated lazily from chunks of rows. For each chunk,
+        columns are converted to lists in bulk and missing metadata values
+        are identified using per-column masks, after which objects are
+        built from the column values without any per-value checks.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Frame to convert.
+        chunk_size : int
+            Number of rows that are converted at once.
+
+        Yields
+        ------
+        MetadataFrameMixin
+            Objects for the rows of the frame.
+
+        """
 
         cls.check_frame(df)
 
         basic_fields = cls._non_metadata_fields()
-        metadata_fields = list(set(df.columns) - set(basic_fields))
+        metadata_fields = [col for col in df.columns
+                           if col not in set(basic_fields)]
 
-        for row in df.itertuples():
-            row_dict = row._asdict()
+        for start in range(0, len(df), chunk_size):
+            chunk = df.iloc[start:start + chunk_size]
 
-            metadata = {k: row_dict.pop(k) for k in metadata_fields}
-            metadata = frozendict(toolz.valfilter(_not_nan, metadata))
+            basic_values = [chunk[col].tolist() for col in basic_fields]
+            metadata = _metadata_dicts(chunk, metadata_fields)
 
-            row_dict.pop('Index', None)
+            for values, row_metadata in zip(zip(*basic_values), metadata):
+                yield cls(*values, metadata=row_metadata)
 
-            if not set(basic_fields) == set(row_dict.keys()):
-                missing_fields = set(basic_fields) - set(row_dict.keys())
-                raise ValueError('Missing required fields ({})'
-                                 .format(', '.join(missing_fields)))
+    @classmethod
+    def from_csv(cls, file_path, as_frame=False, **kwargs):
+        df = pd.read_csv(file_path, dtype=cls._parse_dtypes(), **kwargs)
+        df = cls.format_frame(df)
 
-            yield cls(metadata=metadata, **row_dict)
+        if as_frame:
+            return df
+        else:
+            return cls.from_frame(df)
 
     @classmethod
-    def from_csv(cls, file_path, as_frame=False, **kwargs):
-        df = pd.read_csv(file_path, dtype=cls._dtypes, **kwargs)
-        cls.check_frame(df)
+    def iter_csv(cls,
+                 file_path,
+                 chunksize=FRAME_CHUNK_SIZE,
+                 as_frame=False,
+                 **kwargs):
+        """Reads objects from a csv file in chunks.
+
+        Only a single chunk of the file is held in memory at a time,
+        provided that the returned objects are consumed lazily.
+
+        Parameters
+        ----------
+        file_path : Path
+            Path to the file.
+        chunksize : int
+            Number of rows per chunk.
+        as_frame : bool
+            Whether to yield a frame per chunk instead of objects.
+        **kwargs
+            Any extra arguments are passed to ``pd.read_csv``.
+
+        """
+
+        reader = pd.read_csv(
+            str(file_path),
+            dtype=cls._parse_dtypes(),
+            chunksize=chunksize,
+            **kwargs)
+
+        with reader:
+            for chunk in reader:
+                chunk = cls.format_frame(chunk)
+
+                if as_frame:
+                    yield chunk
+                else:
+                    yield from cls.from_frame(chunk)
+
+    @classmethod
+    def iter_read(cls,
+                  file_path,
+                  chunksize=FRAME_CHUNK_SIZE,
+                  as_frame=False,
+                  **kwargs):
+        """Reads objects from a tsv or binary file in chunks.
+
+        Equivalent to ``iter_csv``, but also supports binary (Parquet or
+        Feather) files. See ``pyim.util.frame.iter_frame`` for details.
+        """
+
+        chunks = iter_frame(
+            file_path,
+            chunksize=chunksize,
+            dtypes=cls._parse_dtypes(),
+            **kwargs)
+
+        for chunk in chunks:
+            chunk = cls.format_frame(chunk)
+
+            if as_frame:
+                yield chunk
+            else:
+                yield from cls.from_frame(chunk)
+
+    @classmethod
+    def fetch(cls, file_path, chromosome, start=None, end=None,
+              as_frame=False):
+        """Reads objects within a region from a tabix-indexed file.
+
+        Parameters
+        ----------
+        file_path : Path
+            Path to a tabix-indexed file (see ``to_csv``).
+        chromosome : str
+            Chromosome of the region.
+        start : int
+            Start of the region. Defaults to the chromosome start.
+        end : int
+            End of the region (exclusive). Defaults to the chromosome end.
+        as_frame : bool
+            Whether to return a frame instead of objects.
+
+        """
+
+        df = fetch_tabix(
+            file_path,
+            chromosome,
+            start=start,
+            end=end,
+            dtype=cls._parse_dtypes())
+        df = cls.format_frame(df)
+
+        if as_frame:
+            return df
+        else:
+            return cls.from_frame(df)
+
+    @classmethod
+    def read_metadata_columns(cls, file_path, **kwargs):
+        """Reads the metadata columns from the header of a file."""
+
+        core = cls._non_metadata_fields()
+        return [col for col in frame_columns(file_path, **kwargs)
+                if col not in core]
+
+    @classmethod
+    def csv_writer(cls, file_path, metadata_columns=None, **kwargs):
+        """Returns a writer for incrementally writing objects to a csv file.
+
+        See ``MetadataCsvWriter`` for details.
+        """
+        return MetadataCsvWriter(
+            cls, file_path, metadata_columns=metadata_columns, **kwargs)
+
+    @classmethod
+    def to_csv(cls,
+               file_path,
+               insertions,
+               index=False,
+               chunksize=None,
+               metadata_columns=None,
+               tabix=False,
+               **kwargs):
+        """Writes objects to a csv file.
+
+        If chunksize is given, objects are converted and written in batches
+        of chunksize objects, so that only a single batch is held in memory
+        at a time. In this case, the metadata columns are taken from
+        ``metadata_columns`` or otherwise from the first batch.
+
+        If tabix is True, objects are written as a tab-separated file that
+        is sorted by chromosome and position, bgzip-compressed and indexed
+        using tabix, allowing objects to be queried by region using
+        ``fetch``. The file should therefore have a ``.gz`` extension.
+        """
+
+        if tabix:
+            write_tabix(
+                cls.to_frame(insertions),
+                file_path,
+                chrom_col='chromosome',
+                start_col='position')
+        elif chunksize is None:
+            df = cls.to_frame(insertions)
+            df.to_csv(str(file_path), index=index, **kwargs)
+        else:
+            with cls.csv_writer(
+                    file_path,
+                    metadata_columns=metadata_columns,
+                    index=index,
+                    **kwargs) as writer:
+                for batch in toolz.partition_all(chunksize, insertions):
+                    writer.write(batch)
+
+    @classmethod
+    def read(cls,
+             file_path,
+             as_frame=False,
+             columns=None,
+             filters=None,
+             **kwargs):
+        """Reads objects from a tsv or binary (Parquet/Feather) file.
+
+        The file format is determined from the file extension
+        (see ``pyim.util.frame.read_frame``).
+
+        Parameters
+        ----------
+        file_path : Path
+            Path to the file.
+        as_frame : bool
+            Whether to return a frame instead of objects.
+        columns : List[str]
+            Metadata columns to read. Core fields are always read.
+            Defaults to all columns.
+        filters : Dict[str, Any]
+            Filters to apply on read, mapping column names to a value (or
+            list of values) that should be matched. For example,
+            ``{'sample': ['s1', 's2']}`` only reads insertions of samples
+            s1 and s2.
+        **kwargs
+            Any extra arguments are passed to ``pd.read_csv`` for tsv files.
+
+        """
+
+        if columns is not None:
+            core = cls._non_metadata_fields()
+            columns = core + [col for col in columns if col not in core]
+
+        df = read_frame(
+            file_path,
+            columns=columns,
+            filters=filters,
+            dtypes=cls._parse_dtypes(),
+            **kwargs)
+        df = cls.format_frame(df)
 
         if as_frame:
             return df
@@ -114,9 +371,38 @@ class MetadataFrameMixin(object):
             return cls.from_frame(df)
 
     @classmethod
-    def to_csv(cls, file_path, insertions, index=False, **kwargs):
-        df = cls.to_frame(insertions)
-        df.to_csv(str(file_path), index=index, **kwargs)
+    def write(cls,
+              file_path,
+              insertions,
+              chunksize=None,
+              metadata_columns=None,
+              tabix=False,
+              **kwargs):
+        """Writes objects to a tsv or binary (Parquet/Feather) file.
+
+        In binary files, core fields are stored using compact types
+        (such as dictionary-encoded chromosome/sample columns). For tsv
+        files, objects can be written in chunks or as a tabix-indexed file
+        (see ``to_csv``). Binary files are always written at once.
+        """
+
+        if tabix:
+            cls.to_csv(file_path, insertions, tabix=True)
+        elif chunksize is not None and frame_format(file_path) == 'text':
+            cls.to_csv(
+                file_path,
+                insertions,
+                chunksize=chunksize,
+                metadata_columns=metadata_columns,
+                sep='\t',
+                **kwargs)
+        else:
+            cls.write_frame(file_path, cls.to_frame(insertions), **kwargs)
+
+    @classmethod
+    def write_frame(cls, file_path, df, **kwargs):
+        """Writes frame to a tsv or binary (Parquet/Feather) file."""
+        write_frame(df, file_path, dtypes=cls._dtypes, **kwargs)
 
 
 _Insertion = namedtuple('Insertion', [
@@ -129,7 +415,13 @@ class Insertion(MetadataFrameMixin, _Insertion):
 
     __slots__ = ()
 
-    _dtypes = {'chromosome': str}
+    _dtypes = {
+        'chromosome': 'category',
+        'position': np.int32,
+        'strand': np.int8,
+        'support': np.uint32,
+        'sample': 'category'
+    }
 
 
 _CisSite = namedtuple('CisSite',
@@ -141,16 +433,230 @@ class CisSite(MetadataFrameMixin, _CisSite):
 
     __slots__ = ()
 
-    _dtypes = {'chromosome': str}
+    _dtypes = {
+        'chromosome': 'category',
+        'position': np.int32,
+        'strand': np.int8
+    }
+
+
+class MetadataCsvWriter(object):
+    """Writer for incrementally writing objects to a csv file.
+
+    Objects are written in batches, with the header being written once
+    (before the first batch). As all batches are written using the same
+    columns, metadata columns should be known in advance. These can either
+    be given explicitly or are taken from the first batch. Batches missing
+    any of the metadata columns are written with empty values, whilst
+    batches containing additional columns raise a ValueError.
+
+    Parameters
+    ----------
+    row_class : Type[MetadataFrameMixin]
+        Model class of the written objects.
+    file_path : Path
+        Path to the output file.
+    metadata_columns : List[str]
+        Metadata columns to write.
+    index : bool
+        Whether to write the index of the batch frames.
+    **kwargs
+        Any extra arguments are passed to ``pd.DataFrame.to_csv``.
+
+    """
+
+    def __init__(self,
+                 row_class,
+                 file_path,
+                 metadata_columns=None,
+                 index=False,
+                 **kwargs):
+        self._row_class = row_class
+        self._kwargs = toolz.merge(kwargs, {'index': index})
+
+        if metadata_columns is not None:
+            core = row_class._non_metadata_fields()
+            extra = sorted(set(metadata_columns) - set(core))
+            self._columns = core + extra
+        else:
+            self._columns = None
 
+        self._file = open(str(file_path), 'w', newline='')
+        self._header_written = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, objs):
+        """Writes a batch of objects."""
+        self.write_frame(self._row_class.to_frame(objs))
+
+    def write_frame(self, df):
+        """Writes a batch of objects, given in frame representation."""
+
+        df = self._row_class.format_frame(df)
+
+        if self._columns is None:
+            self._columns = list(df.columns)
+
+        extra = set(df.columns) - set(self._columns)
+        if len(extra) > 0:
+            raise ValueError('Columns not present in header: {}'
+                             .format(', '.join(sorted(extra))))
+
+        if list(df.columns) != self._columns:
+            df = df.reindex(columns=self._columns)
+
+        df.to_csv(self._file, header=not self._header_written, **self._kwargs)
+        self._header_written = True
+
+    def close(self):
+        """Closes the writer, writing the header if no batches were written."""
+
+        if not self._header_written:
+            columns = self._columns or self._row_class._non_metadata_fields()
+            pd.DataFrame(columns=columns).to_csv(self._file, **self._kwargs)
+            self._header_written = True
+
+        self._file.close()
+
+
+class MetadataTable(object):
+    """Base class for columnar tables of model objects.
+
+    Tables store objects (such as insertions) as columns of a DataFrame,
+    containing the core fields of the model class together with any number
+    of metadata columns. This avoids creating an object (and metadata dict)
+    per row. Iterating over a table lazily yields model objects, so that
+    tables can be passed to any function that expects an iterable of
+    model objects.
+
+    Parameters
+    ----------
+    frame : pd.DataFrame
+        DataFrame containing the table columns. The frame is used as is
+        (without copying), unless core columns need to be converted to
+        their expected (compact) types or re-ordered.
+
+    """
+
+    _row_class = None
+
+    def __init__(self, frame):
+        self._frame = self._row_class.format_frame(frame)
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Builds table from given DataFrame (without copying)."""
+        return cls(frame)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Builds table from an iterable of model objects."""
+        return cls(cls._row_class.to_frame(rows))
+
+    @classmethod
+    def from_csv(cls, file_path, **kwargs):
+        """Reads table from a csv file."""
+        frame = cls._row_class.from_csv(
+            str(file_path), as_frame=True, **kwargs)
+        return cls(frame)
+
+    @classmethod
+    def read(cls, file_path, columns=None, filters=None, **kwargs):
+        """Reads table from a tsv or binary (Parquet/Feather) file.
+
+        See ``MetadataFrameMixin.read`` for details.
+        """
+        frame = cls._row_class.read(
+            file_path,
+            as_frame=True,
+            columns=columns,
+            filters=filters,
+            **kwargs)
+        return cls(frame)
+
+    def write(self, file_path, **kwargs):
+        """Writes table to a tsv or binary (Parquet/Feather) file."""
+        self._row_class.write_frame(file_path, self._frame, **kwargs)
+
+    def to_frame(self):
+        """Returns the DataFrame backing the table (without copying)."""
+        return self._frame
+
+    def to_csv(self, file_path, index=False, **kwargs):
+        """Writes table to a csv file."""
+        self._frame.to_csv(str(file_path), index=index, **kwargs)
+
+    @property
+    def columns(self):
+        """Columns of the table."""
+        return list(self._frame.columns)
+
+    @property
+    def metadata_columns(self):
+        """Metadata columns of the table."""
+        core = set(self._row_class._non_metadata_fields())
+        return [col for col in self._frame.columns if col not in core]
+
+    @property
+    def memory_usage(self):
+        """Memory used by the table (in bytes)."""
+        return int(self._frame.memory_usage(deep=True).sum())
+
+    def __len__(self):
+        return len(self._frame)
+
+    def __iter__(self):
+        return self._row_class.from_frame(self._frame)
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            return self._frame[item]
+        elif isinstance(item, (int, np.integer)):
+            row = self._frame.iloc[[item]]
+            return next(self._row_class.from_frame(row))
+        else:
+            return self.__class__(self._frame.loc[item])
+
+    def __repr__(self):
+        return '<{} with {} rows ({})>'.format(
+            self.__class__.__name__, len(self), frame_memory(self._frame))
+
+
+class InsertionTable(MetadataTable):
+    """Columnar table of insertions."""
+
+    _row_class = Insertion
+
+
+class CisSiteTable(MetadataTable):
+    """Columnar table of CIS sites."""
+
+    _row_class = CisSite
+
+
+def _metadata_dicts(df, fields):
+    """Builds (frozen) metadata dicts for the rows of a frame.
+
+    Missing values (None, NaN or empty strings) are excluded.
+    """
+
+    if len(fields) == 0:
+        empty = frozendict()
+        return (empty for _ in range(len(df)))
+
+    columns = []
+
+    for field in fields:
+        values = df[field]
+        mask = (values.notnull() & (values != '')).to_numpy(dtype=bool)
+        columns.append((field, values.tolist(), mask.tolist()))
+
+    return (frozendict((field, values[i])
+                       for field, values, mask in columns if mask[i])
+            for i in range(len(df)))
 
-def _not_nan(value):
-    if value is None:
-        return False
-    elif isinstance(value, str) and value == '':
-        return False
-    else:
-        try:
-            return not np.isnan(value)
-        except TypeError:
-            return True
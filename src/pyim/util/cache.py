@@ -0,0 +1,136 @@
+"""Content-addressed cache for intermediate pipeline outputs."""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+import shutil
+
+COMPLETE_FILE = 'stage.json'
+
+
+class StageCache(object):
+    """Cache storing the outputs of pipeline stages.
+
+    Outputs of each stage are stored in a directory named after a hash of
+    the inputs of the stage (``{cache_dir}/{stage}/{key}``). If a stage
+    is run again with the same inputs, the previously produced outputs
+    are re-used instead of running the stage again. Outputs are first
+    written to a temporary directory, which is only moved into place if
+    the stage completes successfully, so that outputs of interrupted
+    runs are never re-used.
+
+    Parameters
+    ----------
+    cache_dir : Path
+        Directory in which cached outputs are stored.
+    logger : logging.Logger
+        Logger used to report re-use of cached outputs.
+
+    """
+
+    def __init__(self, cache_dir, logger=None):
+        self._cache_dir = Path(cache_dir)
+        self._logger = logger or logging.getLogger()
+
+    @staticmethod
+    def key(stage, inputs):
+        """Computes the cache key for given stage inputs.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage.
+        inputs : Dict[str, Any]
+            Inputs of the stage. Should be JSON serializable, apart from
+            Path objects, which are converted to strings. File contents
+            should be included using ``file_stamp`` or ``file_digest``.
+
+        Returns
+        -------
+        str
+            Hex digest identifying the stage inputs.
+
+        """
+
+        data = json.dumps({'stage': stage, 'inputs': inputs},
+                          sort_keys=True, default=str)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def run(self, stage, inputs, output_names, func):
+        """Runs stage, unless outputs for the same inputs are cached.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage.
+        inputs : Dict[str, Any]
+            Inputs of the stage (see ``key``).
+        output_names : List[str]
+            File names of the outputs produced by the stage.
+        func : Callable
+            Function that runs the stage. Is called with the
+            paths to which the outputs should be written.
+
+        Returns
+        -------
+        List[Path]
+            Paths to the (cached) outputs of the stage.
+
+        """
+
+        key = self.key(stage, inputs)
+        stage_dir = self._cache_dir / stage / key
+
+        output_paths = [stage_dir / name for name in output_names]
+
+        if (stage_dir / COMPLETE_FILE).exists() and \
+                all(path.exists() for path in output_paths):
+            self._logger.info('Using cached outputs for %s (%s)', stage,
+                              key[:12])
+            return output_paths
+
+        # Run stage in temporary directory.
+        tmp_dir = stage_dir.with_name(key + '.tmp')
+
+        if tmp_dir.exists():
+            shutil.rmtree(str(tmp_dir))
+        tmp_dir.mkdir(parents=True)
+
+        func(*[tmp_dir / name for name in output_names])
+
+        with (tmp_dir / COMPLETE_FILE).open('w') as file_:
+            json.dump({'stage': stage, 'inputs': inputs}, file_,
+                      sort_keys=True, indent=4, default=str)
+
+        # Move outputs into place.
+        if stage_dir.exists():
+            shutil.rmtree(str(stage_dir))
+        tmp_dir.rename(stage_dir)
+
+        return output_paths
+
+
+def file_stamp(file_path):
+    """Identifies a (large) file by its path, size and modification time."""
+
+    file_path = Path(file_path)
+    stat = file_path.stat()
+
+    return {
+        'path': str(file_path.resolve()),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns
+    }
+
+
+def file_digest(file_path, block_size=65536):
+    """Identifies a file by a hash of its contents."""
+
+    hasher = hashlib.sha1()
+
+    with Path(file_path).open('rb') as file_:
+        for block in iter(lambda: file_.read(block_size), b''):
+            hasher.update(block)
+
+    return hasher.hexdigest()
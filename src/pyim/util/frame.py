@@ -0,0 +1,292 @@
+"""Utility functions for reading/writing frames in text or binary formats.
+
+Besides tab-separated text files, frames can be stored in the (columnar)
+Parquet and Feather (Arrow IPC) formats, which are much faster to read and
+write for large files. Formats are detected using the file extension.
+Binary formats require pyarrow to be installed.
+"""
+
+from functools import reduce
+import operator
+from pathlib import Path
+
+import pandas as pd
+
+BINARY_FORMATS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather'
+}
+
+
+def frame_format(file_path):
+    """Determines the format of a frame file from its extension.
+
+    Returns one of ``parquet``, ``feather`` or ``text``.
+    """
+    return BINARY_FORMATS.get(Path(file_path).suffix.lower(), 'text')
+
+
+def read_frame(file_path,
+               columns=None,
+               filters=None,
+               dtypes=None,
+               sep='\t',
+               **kwargs):
+    """Reads a frame from a text or binary (Parquet/Feather) file.
+
+    For binary files, only the requested columns are read and filters are
+    applied while scanning the file, so that (for Parquet) row groups not
+    matching the filters are skipped entirely. Dictionary-encoded columns
+    are decoded (unless given a categorical type in ``dtypes``), so that
+    frames are the same as when read from text.
+
+    Parameters
+    ----------
+    file_path : Path
+        Path to the file.
+    columns : List[str]
+        Columns to read. Defaults to all columns.
+    filters : Dict[str, Any]
+        Filters to apply, given as a dictionary mapping column names to a
+        value (or list of values) that rows should match.
+    dtypes : Dict[str, Any]
+        Types for specific columns. Dictionary-encoded columns in binary
+        files are kept as categoricals if their type is ``category``.
+    sep : str
+        Separator used in text files.
+    **kwargs
+        Any extra arguments are passed to ``pd.read_csv`` for text files.
+
+    Returns
+    -------
+    pd.DataFrame
+        Frame containing the file contents.
+
+    """
+
+    format_ = frame_format(file_path)
+    filters = {col: _as_list(values)
+               for col, values in (filters or {}).items()}
+
+    if format_ == 'text':
+        frame = pd.read_csv(
+            str(file_path), sep=sep, usecols=columns, dtype=dtypes, **kwargs)
+
+        if filters:
+            masks = (frame[col].isin(values)
+                     for col, values in filters.items())
+            frame = frame.loc[reduce(operator.and_, masks)]
+            frame = frame.reset_index(drop=True)
+    else:
+        frame = _read_binary(file_path, format_, columns, filters)
+        frame = _decode_binary(frame, dtypes)
+
+    return frame
+
+
+def iter_frame(file_path, chunksize, dtypes=None, sep='\t', **kwargs):
+    """Reads a frame from a text or binary file in chunks of rows.
+
+    Parameters
+    ----------
+    file_path : Path
+        Path to the file.
+    chunksize : int
+        (Maximum) number of rows per chunk.
+    dtypes : Dict[str, Any]
+        Types for specific columns (see ``read_frame``).
+    sep : str
+        Separator used in text files.
+    **kwargs
+        Any extra arguments are passed to ``pd.read_csv`` for text files.
+
+    Yields
+    ------
+    pd.DataFrame
+        Chunks of the frame.
+
+    """
+
+    format_ = frame_format(file_path)
+
+    if format_ == 'text':
+        reader = pd.read_csv(
+            str(file_path),
+            sep=sep,
+            dtype=dtypes,
+            chunksize=chunksize,
+            **kwargs)
+
+        with reader:
+            yield from reader
+    else:
+        dataset = _import_pyarrow_dataset()
+        source = dataset.dataset(
+            str(file_path),
+            format='parquet' if format_ == 'parquet' else 'ipc')
+
+        for batch in source.to_batches(batch_size=chunksize):
+            if batch.num_rows > 0:
+                yield _decode_binary(batch.to_pandas(), dtypes)
+
+
+def _decode_binary(frame, dtypes):
+    for col in frame.columns:
+        if (isinstance(frame[col].dtype, pd.CategoricalDtype) and
+                col not in (dtypes or {})):
+            categories = frame[col].cat.categories
+            frame[col] = frame[col].astype(categories.dtype)
+
+    if dtypes:
+        frame = frame.astype(dtypes)
+
+    return frame
+
+
+def frame_columns(file_path, sep='\t', **kwargs):
+    """Reads the column names of a text or binary frame file.
+
+    Only the header (or schema) of the file is read.
+    """
+
+    format_ = frame_format(file_path)
+
+    if format_ == 'text':
+        header = pd.read_csv(str(file_path), sep=sep, nrows=0, **kwargs)
+        columns = list(header.columns)
+    else:
+        dataset = _import_pyarrow_dataset()
+        source = dataset.dataset(
+            str(file_path),
+            format='parquet' if format_ == 'parquet' else 'ipc')
+        columns = source.schema.names
+
+    return columns
+
+
+def _as_list(values):
+    if isinstance(values, (list, tuple, set)):
+        return list(values)
+    return [values]
+
+
+def _read_binary(file_path, format_, columns, filters):
+    dataset = _import_pyarrow_dataset()
+
+    source = dataset.dataset(
+        str(file_path), format='parquet' if format_ == 'parquet' else 'ipc')
+
+    if filters:
+        expressions = (dataset.field(col).isin(values)
+                       for col, values in filters.items())
+        filter_ = reduce(operator.and_, expressions)
+    else:
+        filter_ = None
+
+    table = source.to_table(columns=columns, filter=filter_)
+
+    return table.to_pandas()
+
+
+def write_frame(frame, file_path, dtypes=None, sep='\t', index=False,
+                **kwargs):
+    """Writes a frame to a text or binary (Parquet/Feather) file.
+
+    Parameters
+    ----------
+    frame : pd.DataFrame
+        Frame to write.
+    file_path : Path
+        Path to the output file.
+    dtypes : Dict[str, Any]
+        Types with which columns are stored in binary files (see
+        ``compact_dtypes``). Categorical columns are dictionary-encoded.
+    sep : str
+        Separator used in text files.
+    index : bool
+        Whether to write the index of the frame (text files only).
+    **kwargs
+        Any extra arguments are passed to ``pd.DataFrame.to_csv``
+        for text files.
+
+    """
+
+    format_ = frame_format(file_path)
+
+    if format_ == 'text':
+        frame.to_csv(str(file_path), sep=sep, index=index, **kwargs)
+    else:
+        _import_pyarrow_dataset()
+
+        dtypes = compact_dtypes(frame, dtypes or {})
+
+        if len(dtypes) > 0:
+            frame = frame.astype(dtypes)
+
+        frame = frame.reset_index(drop=True)
+
+        if format_ == 'parquet':
+            frame.to_parquet(str(file_path), index=False)
+        else:
+            frame.to_feather(str(file_path))
+
+
+def compact_dtypes(frame, dtypes):
+    """Selects the types that should be applied to convert a frame.
+
+    Types are skipped for columns that are missing from the frame or that
+    already have the given type, so that no columns are converted (or
+    copied) needlessly. Integer types are skipped for columns containing
+    missing values, as these cannot be represented by integers.
+
+    Parameters
+    ----------
+    frame : pd.DataFrame
+        Frame to convert.
+    dtypes : Dict[str, Any]
+        Types for specific columns.
+
+    Returns
+    -------
+    Dict[str, Any]
+        Types of the columns that should be converted.
+
+    """
+
+    selected = {}
+
+    for col, dtype in dtypes.items():
+        if col not in frame.columns or frame[col].dtype == dtype:
+            continue
+
+        if (pd.api.types.is_integer_dtype(dtype) and
+                frame[col].isnull().any()):
+            continue
+
+        selected[col] = dtype
+
+    return selected
+
+
+def frame_memory(frame):
+    """Formats the (deep) memory usage of a frame for logging."""
+
+    size = float(frame.memory_usage(deep=True).sum())
+
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            break
+        size /= 1024
+
+    return '{:.1f} {}'.format(size, unit)
+
+
+def _import_pyarrow_dataset():
+    try:
+        from pyarrow import dataset
+    except ImportError:
+        raise ImportError('pyarrow is required for reading/writing '
+                          'Parquet or Feather files')
+    return dataset
@@ -0,0 +1,44 @@
+"""Utility functions for processing work using process pools."""
+
+from collections import deque
+
+
+def imap_bounded(pool, func, iterable, max_pending):
+    """Lazily maps func over iterable using pool, in order.
+
+    Unlike ``Pool.imap``, which consumes its input as fast as possible,
+    at most ``max_pending`` items are submitted to the pool that have not
+    yet been yielded. Items are therefore only read from the input as the
+    results are consumed, bounding the memory used by pending inputs and
+    results if the consumer is slower than the workers.
+
+    Parameters
+    ----------
+    pool : multiprocessing.pool.Pool
+        Pool used to apply func.
+    func : Callable
+        Function to apply (should be picklable).
+    iterable : Iterable
+        Items to apply func to.
+    max_pending : int
+        Maximum number of items that are submitted ahead of the consumer.
+
+    Yields
+    ------
+    Any
+        Results of func for each item, in the order of the input.
+
+    """
+
+    if max_pending < 1:
+        raise ValueError('max_pending should be at least 1')
+
+    pending = deque()
+
+    for item in iterable:
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (item, )))
+
+    while pending:
+        yield pending.popleft().get()
@@ -0,0 +1,126 @@
+"""Utility functions for writing and querying tabix-indexed files."""
+
+import gzip
+import io
+from pathlib import Path
+
+from natsort import natsorted
+import numpy as np
+import pandas as pd
+import pysam
+
+
+def sort_by_position(frame, chrom_col, position_col):
+    """Sorts frame by chromosome (in natural order) and position."""
+
+    chromosomes = natsorted(set(frame[chrom_col].astype(str)))
+    ranks = {chrom: i for i, chrom in enumerate(chromosomes)}
+
+    chrom_ranks = frame[chrom_col].astype(str).map(ranks)
+    order = np.lexsort((frame[position_col].to_numpy(),
+                        chrom_ranks.to_numpy(dtype=np.int64)))
+
+    return frame.iloc[order]
+
+
+def write_tabix(frame,
+                file_path,
+                chrom_col,
+                start_col,
+                end_col=None,
+                header=True,
+                zerobased=True):
+    """Writes a frame as a sorted, bgzip-compressed and tabix-indexed file.
+
+    Parameters
+    ----------
+    frame : pd.DataFrame
+        Frame to write.
+    file_path : Path
+        Path to the output file. The index is written to the same path,
+        with an extra ``.tbi`` extension.
+    chrom_col : str
+        Column containing chromosomes.
+    start_col : str
+        Column containing start positions.
+    end_col : str
+        Column containing end positions. Defaults to start_col.
+    header : bool
+        Whether to include a header line with column names, which is
+        skipped when indexing the file.
+    zerobased : bool
+        Whether positions are zero-based.
+
+    """
+
+    end_col = end_col or start_col
+    frame = sort_by_position(frame, chrom_col, start_col)
+
+    file_path = Path(file_path)
+    tmp_path = file_path.with_name(file_path.name + '.tmp')
+
+    try:
+        frame.to_csv(str(tmp_path), sep='\t', index=False, header=header)
+        pysam.tabix_compress(str(tmp_path), str(file_path), force=True)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    columns = list(frame.columns)
+
+    pysam.tabix_index(
+        str(file_path),
+        force=True,
+        seq_col=columns.index(chrom_col),
+        start_col=columns.index(start_col),
+        end_col=columns.index(end_col),
+        line_skip=1 if header else 0,
+        zerobased=zerobased)
+
+
+def fetch_tabix(file_path, chromosome, start=None, end=None, header=True,
+                **kwargs):
+    """Reads rows overlapping the given region from a tabix-indexed file.
+
+    Parameters
+    ----------
+    file_path : Path
+        Path to the (bgzip-compressed, tabix-indexed) file.
+    chromosome : str
+        Chromosome of the region.
+    start : int
+        Start of the region (zero-based). Defaults to the chromosome start.
+    end : int
+        End of the region (exclusive). Defaults to the chromosome end.
+    header : bool
+        Whether the file contains a header line with column names.
+        Note that this is assumed to be the first line of the file.
+    **kwargs
+        Any extra arguments are passed to ``pd.read_csv`` when
+        parsing the fetched rows.
+
+    Returns
+    -------
+    pd.DataFrame
+        Frame containing the fetched rows.
+
+    """
+
+    with pysam.TabixFile(str(file_path)) as tabix_file:
+        if chromosome in tabix_file.contigs:
+            lines = list(tabix_file.fetch(chromosome, start, end))
+        else:
+            lines = []
+
+    if header:
+        # Add header line, which is skipped by the index.
+        with gzip.open(str(file_path), 'rt') as file_:
+            lines.insert(0, file_.readline().rstrip('\n'))
+        header = 0
+    elif len(lines) == 0:
+        return pd.DataFrame()
+    else:
+        header = None
+
+    buffer = io.StringIO('\n'.join(lines) + '\n')
+    return pd.read_csv(buffer, sep='\t', header=header, **kwargs)
@@ -0,0 +1,199 @@
+from collections import Counter
+import gzip
+from pathlib import Path
+import random
+
+from cutadapt import seqio
+from cutadapt.seqio import Sequence
+import pytest
+
+from pyim.align.barcode import (BarcodeIndex, demultiplex_reads,
+                                extract_barcode_mapping)
+
+# pylint: disable=redefined-outer-name
+
+BARCODES = {'BC01': 'ACGTAC', 'BC02': 'TTGACC', 'BC03': 'GGCATT'}
+
+
+@pytest.fixture
+def index():
+    """Exact barcode index for example barcodes."""
+    return BarcodeIndex(BARCODES)
+
+
+@pytest.fixture
+def reads():
+    """Example reads with various barcode matches."""
+
+    def _read(name, sequence):
+        return Sequence(name, sequence, 'I' * len(sequence))
+
+    return [
+        _read('read1 extra', 'ACGTACGATCGATCGA'),  # BC01 at start.
+        _read('read2', 'GATTTGACCGATCGAT'),  # BC02 in middle.
+        _read('read3', 'GATCGATCGATCGATC'),  # No barcode.
+        _read('read4', 'ACGTACTTGACCGATC'),  # BC01 + BC02.
+        _read('read5', 'ACGAACGATCGATCGA')  # BC01 with mismatch.
+    ]
+
+
+class TestBarcodeIndex(object):
+    """Unit tests for the BarcodeIndex class."""
+
+    def test_match(self, index, reads):
+        """Tests matching of barcodes against the naive approach."""
+
+        for read in reads:
+            expected = {name for name, seq in BARCODES.items()
+                        if seq in read.sequence}
+            assert index.match(read.sequence) == expected
+
+    def test_match_many(self):
+        """Tests k-mer based matching of many barcodes."""
+
+        rng = random.Random(0)
+
+        def _random_seq(length):
+            return ''.join(rng.choice('ACGT') for _ in range(length))
+
+        barcodes = {'BC{}'.format(i): _random_seq(6) for i in range(50)}
+        index = BarcodeIndex(barcodes)
+
+        for _ in range(200):
+            sequence = _random_seq(40)
+            expected = {name for name, seq in barcodes.items()
+                        if seq in sequence}
+            assert index.match(sequence) == expected
+
+    def test_match_mismatches(self, reads):
+        """Tests matching of barcodes with mismatches."""
+
+        index = BarcodeIndex(BARCODES, mismatches=1)
+
+        assert index.match(reads[4].sequence) == {'BC01'}
+        assert index.match(reads[2].sequence) == set()
+
+    def test_match_lowercase(self, index):
+        """Tests matching of lowercase sequences."""
+        assert index.match('gatttgaccgat') == {'BC02'}
+
+    def test_locate(self, index, reads):
+        """Tests locating barcodes in reads."""
+
+        assert index.locate(reads[0].sequence) == {'BC01': (0, 6)}
+        assert index.locate(reads[1].sequence) == {'BC02': (3, 9)}
+        assert index.locate(reads[3].sequence) == {
+            'BC01': (0, 6),
+            'BC02': (6, 12)
+        }
+
+    def test_different_lengths(self):
+        """Tests matching of barcodes with different lengths."""
+
+        index = BarcodeIndex({'short': 'ACGT', 'long': 'TTTGGGCC'})
+
+        assert index.match('AAACGTAA') == {'short'}
+        assert index.match('ATTTGGGCCA') == {'long'}
+
+    def test_negative_mismatches(self):
+        """Tests that negative mismatches raise an error."""
+
+        with pytest.raises(ValueError):
+            BarcodeIndex(BARCODES, mismatches=-1)
+
+    def test_from_fasta(self, tmpdir):
+        """Tests building index from fasta file with sample mapping."""
+
+        fasta_path = Path(str(tmpdir / 'barcodes.fa'))
+        fasta_path.write_text(''.join('>{}\n{}\n'.format(*item)
+                                      for item in BARCODES.items()))
+
+        index = BarcodeIndex.from_fasta(
+            fasta_path, barcode_mapping={'BC01': 'S1',
+                                         'BC03': 'S3'})
+
+        assert sorted(index.names) == ['S1', 'S3']
+        assert index.match('GATTGGCATTA') == {'S3'}
+        assert index.match('GATTTGACCGAT') == set()
+
+
+def test_extract_barcode_mapping(index, reads):
+    """Tests mapping of reads to barcodes."""
+
+    mapping = extract_barcode_mapping(reads, index)
+    assert mapping == {'read1': 'BC01', 'read2': 'BC02'}
+
+
+def test_demultiplex_reads(index, reads, tmpdir):
+    """Tests de-multiplexing of reads into barcode files."""
+
+    read_path = Path(str(tmpdir / 'reads.fastq'))
+
+    with seqio.open(str(read_path), mode='w') as writer:
+        for read in reads:
+            writer.write(read)
+
+    counts = Counter()
+    output_paths = demultiplex_reads(
+        read_path, Path(str(tmpdir / 'out')), index, counts=counts)
+
+    assert set(output_paths) == set(BARCODES)
+
+    with seqio.open(str(output_paths['BC02'])) as bc_reads:
+        bc_reads = list(bc_reads)
+
+    assert len(bc_reads) == 1
+    assert bc_reads[0].sequence == 'GATCGAT'
+
+    assert counts == Counter({
+        'BC01': 1,
+        'BC02': 1,
+        'ambiguous': 1,
+        'unmatched': 2
+    })
+
+
+def _write_reads(file_path, reads):
+    with seqio.open(str(file_path), mode='w') as writer:
+        for read in reads:
+            writer.write(read)
+
+
+def test_demultiplex_reads_parallel(index, reads, tmpdir):
+    """Tests parallel de-multiplexing of paired reads into gzip files."""
+
+    read_path = Path(str(tmpdir / 'reads.R1.fastq'))
+    read2_path = Path(str(tmpdir / 'reads.R2.fastq'))
+
+    mates = [Sequence(read.name, 'GGGGCCCC', 'IIIIIIII') for read in reads]
+
+    _write_reads(read_path, reads * 3)
+    _write_reads(read2_path, mates * 3)
+
+    counts = Counter()
+    output_paths = demultiplex_reads(
+        read_path,
+        Path(str(tmpdir / 'out')),
+        index,
+        read2_path=read2_path,
+        processes=2,
+        chunk_size=4,
+        compress=True,
+        counts=counts)
+
+    r1_path, r2_path = output_paths['BC01']
+    assert r1_path.name == 'BC01.R1.fastq.gz'
+
+    with seqio.open(str(r1_path), file2=str(r2_path)) as bc_reads:
+        bc_reads = list(bc_reads)
+
+    assert [r1.name for r1, _ in bc_reads] == ['read1 extra'] * 3
+    assert [r1.sequence for r1, _ in bc_reads] == ['GATCGATCGA'] * 3
+    assert [r2.sequence for _, r2 in bc_reads] == ['GGGGCCCC'] * 3
+
+    # Files without reads should still be valid gzip files.
+    with gzip.open(str(output_paths['BC03'][0])) as file_:
+        assert file_.read() == b''
+
+    assert counts['BC01'] == 3
+    assert counts['unmatched'] == 6
@@ -0,0 +1,206 @@
+from collections import OrderedDict
+import errno
+import os
+from pathlib import Path
+
+import pysam
+import pytest
+
+from pyim.align.aligners import nextera
+from pyim.align.aligners.nextera import (NexteraAligner, _tagged_read_chunks,
+                                         _sample_for_tagged_mates)
+
+HEADER = {'HD': {'VN': '1.0', 'SO': 'coordinate'},
+          'SQ': [{'LN': 5000, 'SN': '1'}, {'LN': 3000, 'SN': '2'}]}
+
+# (name, contig_id, mate1 position, mate2 position, is_reverse)
+PAIRS = {
+    'S1': [('r1', 0, 100, 200, False), ('r2', 0, 100, 210, False),
+           ('r3', 0, 400, 300, True), ('r4', 1, 50, 150, False)],
+    'S2': [('r1', 0, 100, 200, False), ('r2', 1, 50, 150, False),
+           ('r3', 1, 60, 150, False), ('r4', 1, 900, 800, True)]
+}  # yapf: disable
+
+
+def _write_bam(bam_path, pairs):
+    """Writes a coordinate-sorted bam file with given mate pairs."""
+
+    alignments = []
+
+    for name, ref_id, pos1, pos2, is_reverse in pairs:
+        for is_read1, pos in [(True, pos1), (False, pos2)]:
+            aln = pysam.AlignedSegment()
+            aln.query_name = name
+            aln.query_sequence = 'A' * 30
+            aln.flag = (1 | 2 | (64 if is_read1 else 128) |
+                        (16 if is_reverse == is_read1 else 32))
+            aln.reference_id = ref_id
+            aln.reference_start = pos
+            aln.next_reference_id = ref_id
+            aln.next_reference_start = pos2 if is_read1 else pos1
+            aln.mapping_quality = 40
+            aln.cigartuples = [(0, 30)]
+            alignments.append(aln)
+
+    alignments.sort(key=lambda aln: (aln.reference_id, aln.reference_start))
+
+    with pysam.AlignmentFile(str(bam_path), 'wb', header=HEADER) as bam_file:
+        for aln in alignments:
+            bam_file.write(aln)
+
+
+def _aligner(sample_name=None):
+    return NexteraAligner(
+        transposon_path=Path('transposon.fa'),
+        bowtie_index_path=Path('index'),
+        min_support=1,
+        sample_name=sample_name)
+
+
+def test_extract_pooled(tmpdir):
+    """Tests extraction from pooled alignment against per-sample runs."""
+
+    expected = []
+
+    for sample, pairs in PAIRS.items():
+        bam_path = Path(str(tmpdir / (sample + '.bam')))
+        _write_bam(bam_path, pairs)
+
+        expected += list(_aligner(sample).extract(bam_path))
+
+    pooled_path = Path(str(tmpdir / 'pooled.bam'))
+    pooled_pairs = [(sample + '|' + name, ) + tuple(rest)
+                    for sample, pairs in PAIRS.items()
+                    for name, *rest in pairs]
+    _write_bam(pooled_path, pooled_pairs)
+
+    pooled = list(_aligner().extract(
+        pooled_path, sample_func=_sample_for_tagged_mates))
+    pooled.sort(key=lambda ins: ins.sample)
+
+    assert len(expected) == 7
+    assert pooled == expected
+
+
+def test_tagged_read_chunks(tmpdir):
+    """Tests tagging and interleaving of mates from multiple samples."""
+
+    read_paths = OrderedDict()
+
+    for sample in ['S1', 'S2']:
+        paths = (Path(str(tmpdir / (sample + '.R1.fastq'))),
+                 Path(str(tmpdir / (sample + '.R2.fastq'))))
+
+        for i, path in enumerate(paths, 1):
+            path.write_text('@read/{0}\nACGT\n+\nIIII\n'.format(i))
+
+        read_paths[sample] = paths
+
+    data = b''.join(_tagged_read_chunks(read_paths))
+
+    assert data.decode() == ('@S1|read/1\nACGT\n+\nIIII\n'
+                             '@S1|read/2\nACGT\n+\nIIII\n'
+                             '@S2|read/1\nACGT\n+\nIIII\n'
+                             '@S2|read/2\nACGT\n+\nIIII\n')
+
+
+def test_align_pooled_invalid_sample():
+    """Tests that sample names containing the separator are rejected."""
+
+    read_paths = {'S|1': (Path('a.R1.fastq'), Path('a.R2.fastq'))}
+
+    with pytest.raises(ValueError):
+        _aligner().align_pooled(read_paths, output_path=Path('out.bam'))
+
+
+def test_trim_cross_device(mocker, tmpdir):
+    """Tests moving trimmed reads to outputs on another file system."""
+
+    tmpdir = Path(str(tmpdir))
+
+    def _write(read_paths, output_paths):
+        # pylint: disable=unused-argument
+        for output_path in output_paths:
+            output_path.write_text('@read\nACGT\n+\nIIII\n')
+
+    mocker.patch.object(
+        NexteraAligner, '_trim_transposon', side_effect=_write)
+    mocker.patch.object(NexteraAligner, '_trim_nextera', side_effect=_write)
+
+    # Renames across file systems fail with EXDEV.
+    mocker.patch.object(
+        os, 'rename', side_effect=OSError(errno.EXDEV, 'Cross-device link'))
+
+    read_paths = (Path('reads.R1.fastq'), Path('reads.R2.fastq'))
+    output_paths = (tmpdir / 'trimmed.R1.fastq', tmpdir / 'trimmed.R2.fastq')
+
+    _aligner().trim(read_paths, output_paths)
+
+    for output_path in output_paths:
+        assert output_path.read_text() == '@read\nACGT\n+\nIIII\n'
+
+
+def test_trim_and_align_old_cutadapt(mocker):
+    """Tests that streaming fails early for unsupported cutadapt versions."""
+
+    mocker.patch.object(nextera, 'check_interleaved_support',
+                        side_effect=ValueError('cutadapt too old'))
+    bowtie2_piped = mocker.patch.object(nextera, 'bowtie2_piped')
+
+    read_paths = (Path('reads.R1.fastq'), Path('reads.R2.fastq'))
+
+    with pytest.raises(ValueError):
+        _aligner().trim_and_align(read_paths, output_path=Path('out.bam'))
+
+    assert not bowtie2_piped.called
+
+
+def test_run_cached(mocker, tmpdir):
+    """Tests re-use of cached trimmed reads and alignments."""
+
+    tmpdir = Path(str(tmpdir))
+
+    read_paths = (tmpdir / 'reads.R1.fastq', tmpdir / 'reads.R2.fastq')
+    for read_path in read_paths:
+        read_path.write_text('@read\nACGT\n+\nIIII\n')
+
+    transposon_path = tmpdir / 'transposon.fa'
+    transposon_path.write_text('>tr\nACGT\n')
+
+    def _trim(read_paths, output_paths, work_dir=None):
+        # pylint: disable=unused-argument
+        for output_path in output_paths:
+            output_path.write_text('')
+
+    def _align(read_paths, output_path):
+        # pylint: disable=unused-argument
+        output_path.write_text('')
+
+    trim = mocker.patch.object(NexteraAligner, 'trim', side_effect=_trim)
+    align = mocker.patch.object(NexteraAligner, 'align', side_effect=_align)
+    extract = mocker.patch.object(NexteraAligner, 'extract', return_value=[])
+
+    def _run(**kwargs):
+        aligner = NexteraAligner(
+            transposon_path=transposon_path,
+            bowtie_index_path=tmpdir / 'index',
+            cache_dir=tmpdir / 'cache',
+            **kwargs)
+        aligner.run(read_paths)
+
+    # Changing extraction parameters should re-use the alignment.
+    _run(min_support=2)
+    _run(min_support=5)
+
+    assert trim.call_count == 1
+    assert align.call_count == 1
+    assert extract.call_count == 2
+
+    # Both cached alignments should be the same file.
+    assert extract.call_args_list[0] == extract.call_args_list[1]
+
+    # Changing trimming parameters should re-run trimming and alignment.
+    _run(min_length=20)
+
+    assert trim.call_count == 2
+    assert align.call_count == 2
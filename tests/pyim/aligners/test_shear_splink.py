@@ -0,0 +1,432 @@
+import argparse
+from functools import partial
+from pathlib import Path
+
+import pysam
+import pytest
+
+from pyim.align.aligners import shear_splink
+from pyim.align.aligners.shear_splink import (
+    ShearSplinkAligner, ShearSplinkCommand, MultiplexedShearSplinkAligner,
+    MultiplexedShearSplinkCommand,
+    _sample_for_alignment)
+from pyim.model import Insertion
+
+# pylint: disable=redefined-outer-name
+
+TRANSPOSON = 'GTGTATGTAAACTTCCGACTTCAACTG'
+LINKER = 'CCTATAGTGAGTCGTATTA'
+
+HEADER = {'HD': {'VN': '1.0', 'SO': 'coordinate'},
+          'SQ': [{'LN': 5000, 'SN': '1'}, {'LN': 3000, 'SN': '2'}]}
+
+# Genomic sequences that are 'aligned' by the fake aligner, given as
+# (sequence, contig_id, position, is_reverse) tuples. Reads align to a
+# site if they are a prefix of the site sequence.
+SITES = [('ACGTTGCAAGGCTTAACGGATCAAGTC', 0, 100, False),
+         ('TTGACCATGGCAAGTTCAGGACTTAGC', 0, 900, True),
+         ('GGCATTCAGTTAGCCAAGTGGTACCAT', 1, 50, False)]
+
+# Example reads, given as (name, genomic sequence) tuples.
+READS = [('r1', SITES[0][0][:20]), ('r2', SITES[0][0][:24]),
+         ('r3', SITES[0][0][:24]), ('r4', SITES[1][0][:22]),
+         ('r5', SITES[2][0][:21]), ('r6', SITES[2][0][:25])]
+
+# Sample barcodes of the (multiplexed) example reads. The barcode of r3
+# contains a single mismatch with respect to the barcode of sample B.
+BARCODES = {'A': 'ACTACTGC', 'B': 'TGCAGCTA'}
+READ_BARCODES = {'r1': 'ACTACTGC', 'r2': 'TGCAGCTA', 'r3': 'TGCAGGTA',
+                 'r4': 'ACTACTGC', 'r5': 'ACTACTGC', 'r6': 'TGCAGCTA'}
+
+
+def _write_fasta(file_path, sequences):
+    with file_path.open('w') as file_:
+        for name, sequence in sequences:
+            file_.write('>{}\n{}\n'.format(name, sequence))
+    return file_path
+
+
+def _write_fastq(file_path, reads):
+    with file_path.open('w') as file_:
+        for name, sequence in reads:
+            file_.write('@{}\n{}\n+\n{}\n'.format(name, sequence,
+                                                  'I' * len(sequence)))
+    return file_path
+
+
+def _fake_bowtie2_stdin(read_chunks, output_path, **kwargs):
+    """Aligns (fastq) reads by looking up their sequence in SITES."""
+
+    # pylint: disable=unused-argument
+
+    lines = b''.join(read_chunks).decode().splitlines()
+    reads = [(name[1:], seq) for name, seq in zip(lines[::4], lines[1::4])]
+
+    alignments = []
+
+    for name, sequence in reads:
+        for site_seq, ref_id, position, is_reverse in SITES:
+            if site_seq.startswith(sequence):
+                aln = pysam.AlignedSegment()
+                aln.query_name = name
+                aln.query_sequence = sequence
+                aln.flag = 16 if is_reverse else 0
+                aln.reference_id = ref_id
+                aln.reference_start = position
+                aln.mapping_quality = 40
+                aln.cigartuples = [(0, len(sequence))]
+                alignments.append(aln)
+
+    alignments.sort(key=lambda aln: (aln.reference_id, aln.reference_start))
+
+    with pysam.AlignmentFile(
+            str(output_path), 'wb', header=HEADER) as bam_file:
+        for aln in alignments:
+            bam_file.write(aln)
+
+
+@pytest.fixture
+def read_path(tmpdir):
+    """Example ShearSplink reads, including a read without transposon."""
+
+    reads = [(name, TRANSPOSON + seq + LINKER) for name, seq in READS]
+    reads += [('r7', 'TTTTTTTTTT' + SITES[0][0] + LINKER)]
+
+    return _write_fastq(Path(str(tmpdir / 'reads.fastq')), reads)
+
+
+@pytest.fixture
+def multiplexed_read_path(tmpdir):
+    """Example multiplexed ShearSplink reads."""
+
+    reads = [(name, READ_BARCODES[name] + TRANSPOSON + seq + LINKER)
+             for name, seq in READS]
+
+    return _write_fastq(Path(str(tmpdir / 'reads.fastq')), reads)
+
+
+@pytest.fixture
+def barcode_path(tmpdir):
+    """Path to the sample barcodes."""
+    return _write_fasta(
+        Path(str(tmpdir / 'barcodes.fa')), sorted(BARCODES.items()))
+
+
+@pytest.fixture
+def sequence_paths(tmpdir):
+    """Paths to the transposon and linker sequences."""
+
+    tmpdir = Path(str(tmpdir))
+
+    return {
+        'transposon_path':
+        _write_fasta(tmpdir / 'transposon.fa', [('transposon', TRANSPOSON)]),
+        'linker_path':
+        _write_fasta(tmpdir / 'linker.fa', [('linker', LINKER)])
+    }
+
+
+@pytest.fixture
+def bowtie2_stdin(mocker):
+    """Mocks bowtie2_stdin using the fake aligner."""
+    return mocker.patch.object(
+        shear_splink, 'bowtie2_stdin', side_effect=_fake_bowtie2_stdin)
+
+
+class TestShearSplinkAligner(object):
+    """Tests for the ShearSplinkAligner class."""
+
+    @pytest.mark.parametrize('trim_processes', [1, 2])
+    def test_run_native_trim(self, read_path, sequence_paths, bowtie2_stdin,
+                             trim_processes, tmpdir):
+        """Tests trimming reads natively and streaming them to bowtie2."""
+
+        aligner = ShearSplinkAligner(
+            bowtie_index_path=Path('index'),
+            min_support=1,
+            native_trim=True,
+            trim_processes=trim_processes,
+            **sequence_paths)
+
+        work_dir = Path(str(tmpdir / 'work'))
+        insertions = aligner.run(read_path, work_dir=work_dir)
+
+        assert bowtie2_stdin.call_count == 1
+        assert (work_dir / 'alignment.bam').exists()
+
+        summary = [(ins.chromosome, ins.position, ins.strand, ins.support,
+                    ins.metadata['depth']) for ins in insertions]
+
+        assert summary == [('1', 100, 1, 2, 3), ('1', 922, -1, 1, 1),
+                           ('2', 50, 1, 2, 2)]
+
+    @pytest.mark.parametrize('extract_processes', [1, 2])
+    def test_extract_insertions_samples(self, sequence_paths, tmpdir,
+                                        extract_processes):
+        """Tests extracting insertions per sample (in parallel)."""
+
+        alignment_path = Path(str(tmpdir / 'alignment.bam'))
+        _fake_bowtie2_stdin(
+            [_write_fastq(Path(str(tmpdir / 'genomic.fastq')), READS)
+             .read_bytes()], alignment_path)
+
+        aligner = ShearSplinkAligner(
+            bowtie_index_path=Path('index'),
+            min_support=1,
+            extract_processes=extract_processes,
+            extract_region_size=500,
+            **sequence_paths)
+
+        read_map = {'r1': 'A', 'r2': 'B', 'r3': 'B', 'r4': 'A', 'r5': 'A',
+                    'r6': 'B'}
+
+        insertions = aligner._extract_insertions(
+            alignment_path,
+            sample_func=partial(_sample_for_alignment, read_map))
+
+        summary = sorted((ins.sample, ins.chromosome, ins.position,
+                          ins.support) for ins in insertions)
+
+        assert summary == [('A', '1', 100, 1), ('A', '1', 922, 1),
+                           ('A', '2', 50, 1), ('B', '1', 100, 1),
+                           ('B', '2', 50, 1)]
+
+
+    def test_run_cached(self, read_path, sequence_paths, mocker, tmpdir):
+        """Tests re-use of cached genomic reads and alignments."""
+
+        def _extract_genomic(read_path, output_path, work_dir, logger):
+            # pylint: disable=unused-argument
+            output_path.write_text('')
+
+        def _align(read_path, output_path, logger):
+            # pylint: disable=unused-argument
+            output_path.write_text('')
+
+        extract_genomic = mocker.patch.object(
+            ShearSplinkAligner, '_extract_genomic',
+            side_effect=_extract_genomic)
+        align = mocker.patch.object(
+            ShearSplinkAligner, '_align', side_effect=_align)
+        extract = mocker.patch.object(
+            ShearSplinkAligner, 'extract', return_value=[])
+
+        def _run(**kwargs):
+            kwargs.update(sequence_paths)
+            aligner = ShearSplinkAligner(
+                bowtie_index_path=Path(str(tmpdir / 'index')),
+                cache_dir=Path(str(tmpdir / 'cache')),
+                **kwargs)
+            aligner.run(read_path)
+
+        # Changing extraction parameters should re-use the alignment.
+        _run(min_support=2)
+        _run(min_support=5)
+
+        assert extract_genomic.call_count == 1
+        assert align.call_count == 1
+        assert extract.call_count == 2
+
+        # Both cached alignments should be the same file.
+        assert extract.call_args_list[0] == extract.call_args_list[1]
+
+        # Changing trimming parameters should re-run trimming and alignment.
+        _run(min_length=20)
+
+        assert extract_genomic.call_count == 2
+        assert align.call_count == 2
+
+        # Changing the linker sequence should also invalidate the cache.
+        sequence_paths['linker_path'].write_text('>linker\nACGTACGT\n')
+        _run(min_length=20)
+
+        assert extract_genomic.call_count == 3
+
+    def test_run_cached_native_trim(self, read_path, sequence_paths,
+                                    bowtie2_stdin, tmpdir):
+        """Tests re-use of cached alignments with native trimming."""
+
+        aligner = ShearSplinkAligner(
+            bowtie_index_path=Path('index'),
+            min_support=1,
+            native_trim=True,
+            cache_dir=Path(str(tmpdir / 'cache')),
+            **sequence_paths)
+
+        insertions = aligner.run(read_path)
+        assert aligner.run(read_path) == insertions
+
+        assert bowtie2_stdin.call_count == 1
+
+
+class TestShearSplinkCommand(object):
+    """Tests for the ShearSplinkCommand class."""
+
+    def test_run(self, read_path, sequence_paths, bowtie2_stdin, tmpdir):
+        """Tests running the aligner from the command line arguments."""
+
+        output_path = Path(str(tmpdir / 'out' / 'insertions.txt'))
+
+        command = ShearSplinkCommand()
+        parser = command.configure(argparse.ArgumentParser())
+
+        args = parser.parse_args([
+            '--reads', str(read_path),
+            '--output', str(output_path),
+            '--transposon', str(sequence_paths['transposon_path']),
+            '--linker', str(sequence_paths['linker_path']),
+            '--bowtie_index', 'index',
+            '--min_support', '1',
+            '--native_trim'
+        ])  # yapf: disable
+
+        command.run(args)
+
+        assert bowtie2_stdin.call_count == 1
+
+        insertions = list(Insertion.from_csv(output_path, sep='\t'))
+        assert [(ins.chromosome, ins.position, ins.support)
+                for ins in insertions] == [('1', 100, 2), ('1', 922, 1),
+                                           ('2', 50, 2)]
+
+    def test_run_from_bam(self, sequence_paths, tmpdir):
+        """Tests extracting insertions from an existing alignment."""
+
+        tmpdir = Path(str(tmpdir))
+
+        alignment_path = tmpdir / 'alignment.bam'
+        _fake_bowtie2_stdin(
+            [_write_fastq(tmpdir / 'genomic.fastq', READS).read_bytes()],
+            alignment_path)
+
+        output_path = tmpdir / 'insertions.txt'
+
+        command = ShearSplinkCommand()
+        parser = command.configure(argparse.ArgumentParser())
+
+        args = parser.parse_args([
+            '--from_bam', str(alignment_path),
+            '--output', str(output_path),
+            '--transposon', str(sequence_paths['transposon_path']),
+            '--bowtie_index', 'index',
+            '--min_support', '1'
+        ])  # yapf: disable
+
+        command.run(args)
+
+        insertions = list(Insertion.from_csv(output_path, sep='\t'))
+        assert [(ins.chromosome, ins.position, ins.support)
+                for ins in insertions] == [('1', 100, 2), ('1', 922, 1),
+                                           ('2', 50, 2)]
+
+
+class TestMultiplexedShearSplinkAligner(object):
+    """Tests for the MultiplexedShearSplinkAligner class."""
+
+    @pytest.mark.parametrize('mismatches', [0, 1])
+    def test_get_barcode_mapping(self, multiplexed_read_path, barcode_path,
+                                 sequence_paths, mismatches):
+        """Tests mapping reads to samples, with and without mismatches."""
+
+        aligner = MultiplexedShearSplinkAligner(
+            bowtie_index_path=Path('index'),
+            barcode_path=barcode_path,
+            barcode_mismatches=mismatches,
+            **sequence_paths)
+
+        read_map = aligner._get_barcode_mapping(multiplexed_read_path)
+
+        expected = {'r1': 'A', 'r2': 'B', 'r3': 'B', 'r4': 'A', 'r5': 'A',
+                    'r6': 'B'}
+
+        if mismatches == 0:
+            del expected['r3']
+
+        assert read_map == expected
+
+
+    def test_extract_without_reads(self, barcode_path, sequence_paths):
+        """Tests that reads are required for assigning samples."""
+
+        aligner = MultiplexedShearSplinkAligner(
+            bowtie_index_path=Path('index'),
+            barcode_path=barcode_path,
+            **sequence_paths)
+
+        with pytest.raises(ValueError):
+            aligner.extract(Path('alignment.bam'))
+
+
+class TestMultiplexedShearSplinkCommand(object):
+    """Tests for the MultiplexedShearSplinkCommand class."""
+
+    def test_run(self, multiplexed_read_path, barcode_path, sequence_paths,
+                 bowtie2_stdin, tmpdir):
+        """Tests running the aligner with barcode mismatches."""
+
+        output_path = Path(str(tmpdir / 'insertions.txt'))
+
+        command = MultiplexedShearSplinkCommand()
+        parser = command.configure(argparse.ArgumentParser())
+
+        args = parser.parse_args([
+            '--reads', str(multiplexed_read_path),
+            '--output', str(output_path),
+            '--transposon', str(sequence_paths['transposon_path']),
+            '--linker', str(sequence_paths['linker_path']),
+            '--barcodes', str(barcode_path),
+            '--barcode_mismatches', '1',
+            '--bowtie_index', 'index',
+            '--min_support', '1',
+            '--native_trim'
+        ])  # yapf: disable
+
+        command.run(args)
+
+        assert bowtie2_stdin.call_count == 1
+
+        insertions = Insertion.from_csv(output_path, sep='\t')
+        summary = sorted((ins.sample, ins.chromosome, ins.position,
+                          ins.metadata['depth']) for ins in insertions)
+
+        # Depth of ('B', '1', 100) includes r3 (matched with a mismatch).
+        assert summary == [('A', '1', 100, 1), ('A', '1', 922, 1),
+                           ('A', '2', 50, 1), ('B', '1', 100, 2),
+                           ('B', '2', 50, 1)]
+
+    def test_run_from_bam(self, multiplexed_read_path, barcode_path,
+                          sequence_paths, tmpdir):
+        """Tests extracting insertions per sample from an alignment."""
+
+        tmpdir = Path(str(tmpdir))
+
+        alignment_path = tmpdir / 'alignment.bam'
+        _fake_bowtie2_stdin(
+            [_write_fastq(tmpdir / 'genomic.fastq', READS).read_bytes()],
+            alignment_path)
+
+        output_path = tmpdir / 'insertions.txt'
+
+        command = MultiplexedShearSplinkCommand()
+        parser = command.configure(argparse.ArgumentParser())
+
+        args = parser.parse_args([
+            '--reads', str(multiplexed_read_path),
+            '--from_bam', str(alignment_path),
+            '--output', str(output_path),
+            '--transposon', str(sequence_paths['transposon_path']),
+            '--barcodes', str(barcode_path),
+            '--barcode_mismatches', '1',
+            '--bowtie_index', 'index',
+            '--min_support', '1'
+        ])  # yapf: disable
+
+        command.run(args)
+
+        insertions = Insertion.from_csv(output_path, sep='\t')
+        summary = sorted((ins.sample, ins.chromosome, ins.position,
+                          ins.metadata['depth']) for ins in insertions)
+
+        assert summary == [('A', '1', 100, 1), ('A', '1', 922, 1),
+                           ('A', '2', 50, 1), ('B', '1', 100, 2),
+                           ('B', '2', 50, 1)]
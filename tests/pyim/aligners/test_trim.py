@@ -0,0 +1,80 @@
+from collections import Counter
+
+from cutadapt.seqio import Sequence
+import pytest
+
+from pyim.align.reads import format_reads
+from pyim.align.trim import ShearSplinkTrimmer, trim_reads
+
+# pylint: disable=redefined-outer-name
+
+TRANSPOSON = 'GTGTATGTAAACTTCCGACTTCAACTG'
+LINKER = 'CCTATAGTGAGTCGTATTA'
+CONTAMINANT = 'TAGGGATCC'
+
+GENOMIC = 'ACGTTGCAAGGCTTAACGGATC'
+
+
+@pytest.fixture
+def trimmer(tmpdir):
+    """Trimmer using example transposon/linker/contaminant sequences."""
+
+    def _write_fasta(name, sequence):
+        fasta_path = tmpdir / (name + '.fa')
+        fasta_path.write('>{}\n{}\n'.format(name, sequence))
+        return str(fasta_path)
+
+    return ShearSplinkTrimmer(
+        transposon_path=_write_fasta('transposon', TRANSPOSON),
+        linker_path=_write_fasta('linker', LINKER),
+        contaminant_path=_write_fasta('contaminant', CONTAMINANT),
+        min_length=15)
+
+
+@pytest.fixture
+def reads():
+    """Example reads covering each of the trimming outcomes."""
+
+    def _read(name, sequence):
+        return Sequence(name, sequence, 'I' * len(sequence))
+
+    return [
+        _read('valid', TRANSPOSON + GENOMIC + LINKER),
+        _read('contaminant', TRANSPOSON + CONTAMINANT + GENOMIC + LINKER),
+        _read('no_linker', TRANSPOSON + GENOMIC),
+        _read('no_transposon', 'TTTTTTTTTT' + GENOMIC + LINKER),
+        _read('too_short', TRANSPOSON + GENOMIC[:10] + LINKER),
+        _read('partial', TRANSPOSON[10:] + GENOMIC + LINKER[:8])
+    ]
+
+
+class TestShearSplinkTrimmer(object):
+    """Tests for the ShearSplinkTrimmer class."""
+
+    def test_trim(self, trimmer, reads):
+        """Tests trimming of example reads."""
+
+        counts = Counter()
+        trimmed = list(trimmer.trim(reads, counts=counts))
+
+        assert [read.name for read in trimmed] == ['valid', 'partial']
+        assert all(read.sequence == GENOMIC for read in trimmed)
+
+        assert counts == {'total': 6, 'written': 2, 'contaminant': 1,
+                          'no_linker': 1, 'no_transposon': 1,
+                          'too_short': 1}
+
+    def test_trim_reads_parallel(self, trimmer, reads):
+        """Tests trimming with multiple processes."""
+
+        counts = Counter()
+        batches = list(trim_reads(reads * 5, trimmer, processes=2,
+                                  batch_size=4, counts=counts))
+
+        trimmed = [read for batch in batches for read in batch]
+        assert [read[0] for read in trimmed] == ['valid', 'partial'] * 5
+        assert counts['written'] == 10
+
+        record = format_reads(trimmed[:1])
+        assert record == '@valid\n{}\n+\n{}\n'.format(
+            GENOMIC, 'I' * len(GENOMIC)).encode()
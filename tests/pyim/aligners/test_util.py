@@ -1,4 +1,11 @@
-from pyim.align.util import AlignmentSummary
+from collections import namedtuple, Counter
+from pathlib import Path
+import random
+
+import pysam
+
+from pyim.align.util import (AlignmentSummary, ColumnarAlignmentSummary,
+                             iter_mates, iter_collated_mates)
 
 
 class TestAlignmentSummary(object):
@@ -63,3 +70,278 @@ class TestAlignmentSummary(object):
         summary_merged = summary.merge_within_distance(max_dist=0)
 
         assert summary_merged.values == values
+
+
+class TestColumnarAlignmentSummary(object):
+    """Unit tests for the ColumnarAlignmentSummary class."""
+
+    @staticmethod
+    def _alignments():
+        Alignment = namedtuple(
+            'Alignment', ['reference_name', 'reference_start', 'is_reverse',
+                          'is_secondary', 'mapping_quality', 'query_name'])
+
+        return [
+            Alignment('6', 58654912, False, False, 40, 's2'),
+            Alignment('6', 58654916, True, False, 40, 's1'),
+            Alignment('6', 58654912, False, False, 40, 's2'),
+            Alignment('5', 30484510, False, False, 40, 's1'),
+            Alignment('6', 58654912, False, False, 40, 's1'),
+            Alignment('6', 58654914, False, False, 40, 's1'),
+            Alignment('6', 58654912, False, False, 10, 's1'),
+            Alignment('6', 58654912, False, True, 40, 's1'),
+            Alignment('5', 30484510, False, False, 40, 's1')
+        ]  # yapf: disable
+
+    @staticmethod
+    def _position_func(aln):
+        strand = -1 if aln.is_reverse else 1
+        key = (aln.reference_name, aln.reference_start, strand)
+        return key, aln.reference_start + aln.mapping_quality
+
+    def _from_alignments(self, summary_class, **kwargs):
+        return summary_class.from_alignments(
+            self._alignments(),
+            position_func=self._position_func,
+            sample_func=lambda aln: aln.query_name,
+            min_mapq=30,
+            **kwargs)
+
+    def test_from_alignments(self):
+        """Tests construction from alignments against the dict summary."""
+
+        summary = self._from_alignments(
+            ColumnarAlignmentSummary, chunk_size=2)
+        expected = self._from_alignments(AlignmentSummary)
+
+        assert len(summary) == 7
+        assert summary.values == expected.values
+        assert list(summary.values.keys()) == ['s2', 's1']
+        assert (list(summary.values['s1'].keys()) ==
+                list(expected.values['s1'].keys()))
+
+    def test_to_insertions(self):
+        """Tests conversion to insertions against the dict summary."""
+
+        summary = self._from_alignments(ColumnarAlignmentSummary)
+        expected = self._from_alignments(AlignmentSummary)
+
+        insertions = list(summary.to_insertions(min_support=1))
+        assert insertions == list(expected.to_insertions(min_support=1))
+
+        assert insertions[0].id == 's2.INS_0'
+        assert insertions[0].metadata['depth'] == 2
+        assert insertions[0].metadata['depth_unique'] == 1
+
+    def test_to_insertions_min_support(self):
+        """Tests numbering of insertions with min_support."""
+
+        summary = ColumnarAlignmentSummary.from_values({
+            's1': {('6', 10, 1): [20, 21], ('6', 50, 1): [60],
+                   ('6', 80, 1): [90, 91]}
+        })  # yapf: disable
+
+        insertions = list(summary.to_insertions(min_support=2))
+        assert [ins.id for ins in insertions] == ['s1.INS_0', 's1.INS_2']
+
+    def test_merge_within_distance(self):
+        """Tests merging against the dict summary."""
+
+        values = {
+            's1': {
+                ('6', 30484510, 1): [30484517],
+                ('6', 58654912, 1): [58654922],
+                ('6', 58654914, 1): [58654922],
+                ('6', 58654916, 1): [58654923],
+                ('6', 58654916, -1): [58654926]
+            }
+        }
+
+        summary = ColumnarAlignmentSummary.from_values(values)
+        merged = summary.merge_within_distance(max_dist=10)
+        expected = AlignmentSummary(values).merge_within_distance(max_dist=10)
+
+        assert merged.values == expected.values
+        assert (list(merged.to_insertions()) ==
+                list(expected.to_insertions()))
+
+    def test_merge_within_distance_random(self):
+        """Tests merging of random summaries against the dict summary."""
+
+        rng = random.Random(0)
+
+        for _ in range(50):
+            values = {}
+
+            for sample in ['s2', 's1']:
+                sample_values = values.setdefault(sample, {})
+
+                for _ in range(rng.randint(1, 30)):
+                    key = (rng.choice(['1', '10', '2']), rng.randint(0, 200),
+                           rng.choice([1, -1]))
+                    sample_values.setdefault(key, []).append(
+                        rng.randint(0, 20))
+
+            max_dist = rng.randint(0, 15)
+
+            summary = ColumnarAlignmentSummary.from_values(values)
+            merged = summary.merge_within_distance(max_dist=max_dist)
+            expected = AlignmentSummary(values).merge_within_distance(
+                max_dist=max_dist)
+
+            assert (list(merged.to_insertions()) ==
+                    list(expected.to_insertions()))
+
+    def test_merge_across_samples(self):
+        """Tests merging of positions across samples."""
+
+        values = {
+            's1': {('6', 100, 1): [10], ('6', 200, 1): [20]},
+            's2': {('6', 104, 1): [11, 12, 13], ('6', 100, -1): [14]}
+        }  # yapf: disable
+
+        summary = ColumnarAlignmentSummary.from_values(values)
+        merged = summary.merge_within_distance(
+            max_dist=10, across_samples=True)
+
+        assert merged.values == {
+            's1': {('6', 103, 1): [10], ('6', 200, 1): [20]},
+            's2': {('6', 100, -1): [14], ('6', 103, 1): [11, 12, 13]}
+        }  # yapf: disable
+
+    def test_to_table(self):
+        """Tests conversion to an insertion table."""
+
+        values = {
+            's1': {('6', 10, 1): [1, 2], ('6', 30, -1): [3]},
+            's2': {('7', 5, 1): [4, 4, 5]}
+        }  # yapf: disable
+
+        summary = ColumnarAlignmentSummary.from_values(values)
+
+        for min_support in [0, 2]:
+            table = summary.to_table(min_support=min_support)
+            assert (list(table) ==
+                    list(summary.to_insertions(min_support=min_support)))
+
+    def test_empty(self):
+        """Tests an empty summary."""
+
+        summary = ColumnarAlignmentSummary.from_values({})
+
+        assert summary.values == {}
+        assert list(summary.to_insertions()) == []
+
+    @staticmethod
+    def _write_bam(bam_path):
+        """Writes a small coordinate-sorted bam file with single reads."""
+
+        header = {'HD': {'VN': '1.0', 'SO': 'coordinate'},
+                  'SQ': [{'LN': 5000, 'SN': '1'}, {'LN': 3000, 'SN': '2'}]}
+
+        # (contig_id, position, is_reverse)
+        positions = [(0, 100, False), (0, 100, False), (0, 120, True),
+                     (0, 1020, False), (0, 1990, True), (0, 2000, False),
+                     (1, 50, False), (1, 2500, True)]  # yapf: disable
+
+        with pysam.AlignmentFile(
+                str(bam_path), 'wb', header=header) as bam_file:
+            for i, (ref_id, pos, is_reverse) in enumerate(positions):
+                aln = pysam.AlignedSegment()
+                aln.query_name = 'read{}'.format(i)
+                aln.query_sequence = 'A' * (20 + i)
+                aln.flag = 16 if is_reverse else 0
+                aln.reference_id = ref_id
+                aln.reference_start = pos
+                aln.mapping_quality = 40
+                aln.cigartuples = [(0, 20 + i)]
+                bam_file.write(aln)
+
+    def test_from_bam_parallel(self, tmpdir):
+        """Tests parallel extraction against serial extraction."""
+
+        bam_path = Path(str(tmpdir / 'alignment.bam'))
+        self._write_bam(bam_path)
+
+        kwargs = {'position_func': _position_for_alignment,
+                  'sample_func': _sample_for_alignment}
+
+        serial = ColumnarAlignmentSummary.from_bam(bam_path, **kwargs)
+        serial_ins = list(serial.to_insertions())
+
+        assert len(serial) == 8
+        assert len(serial_ins) == 7
+
+        for processes, region_size in [(2, None), (2, 1000), (1, 500)]:
+            summary = ColumnarAlignmentSummary.from_bam(
+                bam_path,
+                processes=processes,
+                region_size=region_size,
+                **kwargs)
+            assert list(summary.to_insertions()) == serial_ins
+
+    def test_concat(self):
+        """Tests concatenation of summaries."""
+
+        summary1 = ColumnarAlignmentSummary.from_values(
+            {'s1': {('6', 10, 1): [20]}, 's2': {('6', 10, 1): [21]}})
+        summary2 = ColumnarAlignmentSummary.from_values(
+            {'s2': {('7', 15, -1): [5]}, 's1': {('6', 10, 1): [22]}})
+
+        merged = ColumnarAlignmentSummary.concat([summary1, summary2])
+
+        assert merged.values == {
+            's1': {('6', 10, 1): [20, 22]},
+            's2': {('6', 10, 1): [21], ('7', 15, -1): [5]}
+        }
+
+
+def _position_for_alignment(aln):
+    if aln.is_reverse:
+        return (aln.reference_name, aln.reference_end, -1), \
+            aln.reference_start
+    return (aln.reference_name, aln.reference_start, 1), aln.reference_end
+
+
+def _sample_for_alignment(aln):
+    # pylint: disable=unused-argument
+    return 's1'
+
+
+class TestIterCollatedMates(object):
+    """Unit tests for the iter_collated_mates function."""
+
+    @staticmethod
+    def _mate(name, is_read1, is_proper_pair=True):
+        Mate = namedtuple('Mate', ['query_name', 'is_read1', 'is_proper_pair'])
+        return Mate(name, is_read1, is_proper_pair)
+
+    def test_basic(self):
+        """Tests pairing of adjacent mates, counting orphans."""
+
+        alignments = [
+            self._mate('r1', False), self._mate('r1', True),
+            self._mate('r2', True),
+            self._mate('r3', True), self._mate('r3', False),
+            self._mate('r4', True, is_proper_pair=False),
+            self._mate('r5', False)
+        ]  # yapf: disable
+
+        counts = Counter()
+        mates = list(iter_collated_mates(alignments, counts=counts))
+
+        assert [(m1.query_name, m1.is_read1, m2.is_read1)
+                for m1, m2 in mates] == [('r1', True, False),
+                                         ('r3', True, False)]
+        assert counts == {'pairs': 2, 'orphans': 2}
+
+    def test_same_as_iter_mates(self):
+        """Tests that result matches iter_mates for collated input."""
+
+        alignments = [
+            self._mate('r1', True), self._mate('r1', False),
+            self._mate('r2', False), self._mate('r2', True)
+        ]  # yapf: disable
+
+        assert (list(iter_collated_mates(alignments)) ==
+                list(iter_mates(alignments)))
@@ -1,4 +1,6 @@
+
 from pyim.annotate.annotators import CisAnnotator, WindowAnnotator
+from pyim.model import Insertion
 
 
 class TestCisAnnotator(object):
@@ -17,3 +19,23 @@ class TestCisAnnotator(object):
 
         assert annotated['INS2'].metadata['cis_id'] == 'CIS2'
         assert 'gene_name' not in annotated['INS2'].metadata
+
+    def test_chunks(self, cis_insertions, cis_sites, genes):
+        """Tests annotating insertions in multiple chunks."""
+
+        annotator = CisAnnotator(
+            annotator=WindowAnnotator.from_window_size(
+                genes=genes, window_size=1000),
+            genes=genes,
+            cis_sites=cis_sites)
+
+        frame = Insertion.to_frame(cis_insertions)
+
+        chunks = [
+            annotator.annotate_frame(frame.iloc[[i]]) for i in range(2)
+        ]
+        chunks += [annotator.annotate_frame(frame.iloc[[0]])]
+
+        assert list(chunks[0]['gene_name']) == ['Trp53bp2']
+        assert 'gene_name' not in chunks[1]
+        assert list(chunks[2]['gene_name']) == ['Trp53bp2']
@@ -1,4 +1,11 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyim.annotate.annotators.rbm import RbmAnnotator
 from pyim.annotate.annotators.window import Window, WindowAnnotator
+from pyim.model import Insertion, InsertionTable
+from pyim.vendor.frozendict import frozendict
 
 # pylint: disable=redefined-outer-name
 
@@ -39,6 +46,18 @@ class TestWindowAnnotator(object):
         # Check that last insertion was not annotated.
         assert 'gene_name' not in annotated[2].metadata
 
+    def test_table(self, insertions, genes):
+        """Test annotation of insertions given as a table."""
+
+        annotator = WindowAnnotator.from_window_size(
+            genes=genes, window_size=20000)
+
+        expected = list(annotator.annotate(insertions))
+        annotated = list(
+            annotator.annotate(InsertionTable.from_rows(insertions)))
+
+        assert annotated == expected
+
     def test_small_window(self, insertions, genes):
         """Test example with smaller window. Should not annotate Myh9."""
 
@@ -85,3 +104,170 @@ class TestWindowAnnotator(object):
 
         assert len(annotated) == 3
         assert annotated[0].metadata['gene_name'] == 'Trp53bp2'
+
+
+@pytest.fixture(scope='module')
+def random_insertions(random_genes):
+    """Random insertions, including insertions at gene boundaries."""
+
+    random = np.random.RandomState(2)
+
+    positions = np.concatenate([
+        random.randint(0, 13000, size=200), random_genes['start'].values,
+        random_genes['end'].values, random_genes['end'].values - 1
+    ])
+
+    chromosomes = random.choice(['1', '2', '3'], size=len(positions))
+    strands = random.choice([1, -1], size=len(positions))
+
+    return [
+        Insertion(id='INS{}'.format(i), chromosome=chrom,
+                  position=int(pos), strand=int(strand), support=1,
+                  sample='s1', metadata=frozendict({'a': i}))
+        for i, (chrom, pos, strand)
+        in enumerate(zip(chromosomes, positions, strands))
+    ]  # yapf: disable
+
+
+class TestWindowAnnotatorBatch(object):
+    """Tests comparing batch annotation with per-insertion annotation."""
+
+    @pytest.mark.parametrize('kwargs', [
+        {'window_size': 500},
+        {'window_size': 2000, 'closest': True},
+        {'window_size': 2000, 'blacklist': {'GENE1', 'GENE2'}}
+    ])
+    def test_window_size(self, random_genes, random_insertions, kwargs):
+        """Compares annotations with symmetric windows."""
+
+        expected = WindowAnnotator.from_window_size(
+            random_genes, batch_size=None, **kwargs)
+        annotator = WindowAnnotator.from_window_size(
+            random_genes, batch_size=50, **kwargs)
+
+        expected = list(expected.annotate(random_insertions))
+        annotated = list(annotator.annotate(random_insertions))
+
+        assert len(annotated) > len(random_insertions)
+        assert annotated == expected
+
+    @pytest.mark.parametrize('single_query', [False, True])
+    def test_strict_windows(self, random_genes, random_insertions,
+                            single_query):
+        """Compares annotations with stranded and strict windows."""
+
+        windows = [
+            Window(0, 1, strand=1, name='is'),
+            Window(200, 0, strand=-1, strict_left=True, name='ua'),
+            Window(0, 300, strand=None, strict_right=True, name='ds'),
+            Window(-100, 400, strand=1, strict_left=True,
+                   strict_right=True, name='dd')
+        ]
+
+        expected = WindowAnnotator(
+            random_genes, windows=windows, batch_size=None)
+        annotator = WindowAnnotator(
+            random_genes, windows=windows, single_query=single_query)
+
+        annotated = list(annotator.annotate(random_insertions))
+        assert annotated == list(expected.annotate(random_insertions))
+
+    def test_single_query(self, random_genes):
+        """Tests that single queries give the same (ordered) hits."""
+
+        windows = [
+            Window(-200, 0, strand=1, name='empty'),
+            Window(0, 1, strand=None, name='is'),
+            Window(1000, -500, strand=-1, strict_right=True, name='us'),
+            Window(-2000, 2500, strand=None, strict_left=True, name='far')
+        ]
+
+        random = np.random.RandomState(3)
+
+        chromosomes = random.choice(['1', '2', '3'], size=300)
+        positions = random.randint(0, 13000, size=300)
+        strands = random.choice([1, -1], size=300)
+
+        hits = WindowAnnotator(random_genes, windows).search_windows(
+            chromosomes, positions, strands)
+        single_hits = WindowAnnotator(
+            random_genes, windows, single_query=True).search_windows(
+                chromosomes, positions, strands)
+
+        assert len(hits[0]) > 0
+        assert set(hits[2]) == {1, 2, 3}
+
+        for expected, result in zip(hits, single_hits):
+            np.testing.assert_array_equal(result, expected)
+
+    def test_search_windows(self, random_genes):
+        """Tests hit indices and window order of search_windows."""
+
+        windows = [
+            Window(0, 1, strand=None, name='a'),
+            Window(100000, 100000, strand=None, name='b')
+        ]
+        annotator = WindowAnnotator(random_genes, windows=windows)
+
+        gene = random_genes.iloc[0]
+        ins_idx, gene_idx, window_idx = annotator.search_windows(
+            [gene['contig'], '3'], np.array([gene['start'], 10]),
+            np.array([1, 1]))
+
+        on_chrom = np.flatnonzero(random_genes['contig'] == gene['contig'])
+
+        assert set(ins_idx) == {0}
+        assert window_idx[0] == 0 and 0 in gene_idx[window_idx == 0]
+        assert set(gene_idx[window_idx == 1]) == set(on_chrom)
+
+    def test_rbm(self, random_genes, random_insertions):
+        """Compares annotations with RBM windows."""
+
+        annotator = RbmAnnotator(
+            random_genes, window_sizes=(2000, 1000, 2500, 500))
+        annotated = list(annotator.annotate(random_insertions))
+
+        # pylint: disable=protected-access
+        annotator._annotator._batch_size = None
+        assert annotated == list(annotator.annotate(random_insertions))
+
+    def test_invalid_strand(self, random_genes):
+        """Tests that insertions with an unknown strand are rejected."""
+
+        annotator = WindowAnnotator.from_window_size(random_genes, 100)
+        insertion = Insertion(id='INS1', chromosome='1', position=10,
+                              strand=0, support=1, sample='s1',
+                              metadata=frozendict())
+
+        with pytest.raises(ValueError):
+            list(annotator.annotate([insertion]))
+
+    @pytest.mark.parametrize('kwargs', [
+        {'window_size': 2000},
+        {'window_size': 2000, 'closest': True},
+        {'window_size': 2000, 'blacklist': {'GENE1', 'GENE2'}}
+    ])
+    def test_annotate_frame(self, random_genes, random_insertions, kwargs):
+        """Compares columnar annotation with annotating objects."""
+
+        annotator = WindowAnnotator.from_window_size(random_genes, **kwargs)
+
+        expected = Insertion.to_frame(annotator.annotate(random_insertions))
+        annotated = annotator.annotate_frame(
+            Insertion.to_frame(random_insertions))
+
+        pd.testing.assert_frame_equal(
+            Insertion.format_frame(annotated), expected)
+
+    def test_annotate_table(self, random_genes, random_insertions):
+        """Tests columnar annotation with RBM windows."""
+
+        annotator = RbmAnnotator(
+            random_genes, window_sizes=(2000, 1000, 2500, 500))
+
+        frame = Insertion.to_frame(random_insertions)
+        table = annotator.annotate_table(frame)
+
+        assert set(table.to_frame()['window']) <= {'is', 'ia', 'ds', 'da'}
+        assert len(table.join(frame)) == len(
+            list(annotator.annotate(random_insertions)))
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyim.vendor.genopandas import GenomicDataFrame
+
+
+@pytest.fixture(scope='module')
+def random_genes():
+    """Random (overlapping) genes on two chromosomes."""
+
+    random = np.random.RandomState(1)
+
+    starts = random.randint(0, 10000, size=60)
+    ends = starts + random.randint(1, 3000, size=60)
+
+    genes = pd.DataFrame({
+        'contig': random.choice(['1', '2'], size=60),
+        'start': starts,
+        'end': ends,
+        'strand': random.choice([1, -1], size=60),
+        'gene_id': ['GENE{}'.format(i) for i in range(60)],
+        'gene_name': ['Gene{}'.format(i) for i in range(60)]
+    })
+
+    # Shuffle index to check that hits are ordered by index.
+    genes.index = random.permutation(60)
+
+    return GenomicDataFrame(genes, chromosome_col='contig')
@@ -0,0 +1,79 @@
+from pathlib import Path
+
+import pytest
+
+from pyim.annotate import genes as genes_module
+from pyim.annotate.annotators.window import WindowAnnotator
+from pyim.annotate.genes import read_genes_from_gtf
+from pyim.model import Insertion
+from pyim.vendor.frozendict import frozendict
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def gtf_path():
+    """Path to example GTF file."""
+    return Path(str(pytest.helpers.data_path('reference.gtf.gz')))
+
+
+def test_read_genes(gtf_path):
+    """Tests reading genes without a cache."""
+
+    genes = read_genes_from_gtf(gtf_path)
+
+    assert list(genes['gene_name']) == ['Ppp1r12b', 'Trp53bp2', 'Myh9']
+    assert list(genes['strand']) == [-1, 1, -1]
+
+
+def test_read_genes_cached(gtf_path, tmpdir, mocker):
+    """Tests reading genes using a cache."""
+
+    pytest.importorskip('pyarrow')
+
+    cache_dir = Path(str(tmpdir / 'cache'))
+    parse = mocker.spy(genes_module, '_parse_genes')
+
+    expected = read_genes_from_gtf(gtf_path)
+    assert parse.call_count == 1
+
+    genes = read_genes_from_gtf(gtf_path, cache_dir=cache_dir)
+    cached = read_genes_from_gtf(gtf_path, cache_dir=cache_dir)
+
+    # Genes should only be parsed when building the cache.
+    assert parse.call_count == 2
+
+    assert cached.gi.backend == 'array'
+    assert list(cached.columns) == list(expected.columns)
+    assert list(cached['gene_id']) == list(expected['gene_id'])
+    assert list(cached['start']) == list(expected['start'])
+    assert list(genes['gene_id']) == list(expected['gene_id'])
+
+    hits = cached.gi.search('1', 182408171, 182409172)
+    assert list(hits['gene_name']) == ['Trp53bp2']
+
+
+def test_annotate_cached(gtf_path, tmpdir):
+    """Tests that annotations are the same using cached genes."""
+
+    pytest.importorskip('pyarrow')
+
+    insertions = [
+        Insertion(id='INS1', chromosome='1', position=182408171,
+                  strand=1, support=2, sample='s1', metadata=frozendict()),
+        Insertion(id='INS2', chromosome='15', position=77758586,
+                  strand=-1, support=2, sample='s1', metadata=frozendict())
+    ]  # yapf: disable
+
+    cache_dir = Path(str(tmpdir / 'cache'))
+
+    expected = WindowAnnotator.from_window_size(
+        read_genes_from_gtf(gtf_path), window_size=20000)
+
+    read_genes_from_gtf(gtf_path, cache_dir=cache_dir)
+    annotator = WindowAnnotator.from_window_size(
+        read_genes_from_gtf(gtf_path, cache_dir=cache_dir),
+        window_size=20000)
+
+    assert (list(annotator.annotate(insertions)) ==
+            list(expected.annotate(insertions)))
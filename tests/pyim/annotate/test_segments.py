@@ -0,0 +1,140 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pyim.annotate.annotators.rbm import RbmAnnotator
+from pyim.annotate.annotators.window import Window, WindowAnnotator
+from pyim.annotate.segments import SegmentMap
+
+# pylint: disable=redefined-outer-name
+
+WINDOWS = [
+    Window(0, 1, strand=1, name='is'),
+    Window(-200, 0, strand=1, name='empty'),
+    Window(200, 0, strand=-1, strict_left=True, name='ua'),
+    Window(0, 300, strand=None, strict_right=True, name='ds'),
+    Window(-100, 400, strand=1, strict_left=True, strict_right=True,
+           name='dd'),
+    Window(1000, 1000, strand=None, name='ws')
+]  # yapf: disable
+
+
+@pytest.fixture(scope='module')
+def positions(random_genes):
+    """Random positions, including positions around gene boundaries."""
+
+    random = np.random.RandomState(2)
+
+    positions = np.concatenate([
+        random.randint(-2000, 15000, size=500),
+        np.concatenate([random_genes['start'].values + offset
+                        for offset in [-401, -1, 0, 1, 200]]),
+        np.concatenate([random_genes['end'].values + offset
+                        for offset in [-300, -1, 0, 1, 1000]])
+    ])  # yapf: disable
+
+    chromosomes = random.choice(['1', '2', '3'], size=len(positions))
+    strands = random.choice([1, -1], size=len(positions))
+
+    return chromosomes, positions, strands
+
+
+class TestSegmentMap(object):
+    """Tests for the SegmentMap class."""
+
+    def test_search(self, random_genes, positions):
+        """Tests that lookups give the same hits as searching windows."""
+
+        annotator = WindowAnnotator(random_genes, windows=WINDOWS)
+        segment_map = SegmentMap.build(random_genes, WINDOWS)
+
+        expected = annotator.search_windows(*positions)
+        hits = segment_map.search(*positions)
+
+        assert len(expected[0]) > 0
+        assert set(expected[2]) == {0, 2, 3, 4, 5}
+        assert segment_map.num_sets < segment_map.num_segments
+
+        for result, exp in zip(hits, expected):
+            np.testing.assert_array_equal(result, exp)
+
+    def test_save_load(self, random_genes, positions, tmpdir):
+        """Tests saving and loading of segment maps."""
+
+        segment_map = SegmentMap.build(random_genes, WINDOWS)
+
+        file_path = str(tmpdir / 'segments.npz')
+        segment_map.save(file_path)
+
+        loaded = SegmentMap.load(file_path)
+
+        assert loaded.key == segment_map.key
+        for result, exp in zip(
+                loaded.search(*positions), segment_map.search(*positions)):
+            np.testing.assert_array_equal(result, exp)
+
+    def test_invalid_strand(self, random_genes):
+        """Tests that positions with an unknown strand are rejected."""
+
+        segment_map = SegmentMap.build(random_genes, WINDOWS)
+
+        with pytest.raises(ValueError):
+            segment_map.search(['1'], np.array([10]), np.array([0]))
+
+
+class TestAnnotatorSegmentMap(object):
+    """Tests for annotating insertions using segment maps."""
+
+    def test_read_segment_map(self, random_genes, tmpdir, mocker):
+        """Tests building and re-using segment maps."""
+
+        file_path = Path(str(tmpdir / 'segments.npz'))
+        build = mocker.spy(SegmentMap, 'build')
+
+        annotator = RbmAnnotator(
+            random_genes, window_sizes=(2000, 1000, 2500, 500))
+        annotator.read_segment_map(file_path)
+        annotator.read_segment_map(file_path)
+
+        assert build.call_count == 1
+        assert file_path.exists()
+
+        # Segment maps of other windows should be rebuilt.
+        other = WindowAnnotator.from_window_size(random_genes, window_size=100)
+        other.read_segment_map(file_path)
+
+        assert build.call_count == 2
+
+    def test_mismatch(self, random_genes):
+        """Tests that segment maps of other windows are rejected."""
+
+        segment_map = SegmentMap.build(random_genes, WINDOWS)
+
+        with pytest.raises(ValueError):
+            WindowAnnotator.from_window_size(
+                random_genes, window_size=100, segment_map=segment_map)
+
+    def test_annotate(self, random_genes):
+        """Tests annotation using a segment map."""
+
+        from pyim.model import Insertion
+        from pyim.vendor.frozendict import frozendict
+
+        insertions = [
+            Insertion(id='INS{}'.format(i), chromosome='1', position=pos,
+                      strand=strand, support=1, sample='s1',
+                      metadata=frozendict())
+            for i, (pos, strand) in enumerate(
+                zip(range(0, 12000, 37), [1, -1] * 1000))
+        ]  # yapf: disable
+
+        expected = WindowAnnotator(random_genes, WINDOWS, closest=True)
+        annotator = WindowAnnotator(
+            random_genes,
+            WINDOWS,
+            closest=True,
+            segment_map=SegmentMap.build(random_genes, WINDOWS))
+
+        assert (list(annotator.annotate(insertions)) ==
+                list(expected.annotate(insertions)))
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyim.annotate.table import AnnotationTable
+from pyim.model import Insertion
+from pyim.vendor.genopandas import GenomicDataFrame
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def genes():
+    """Example genes."""
+
+    genes = pd.DataFrame({
+        'contig': ['1', '1', '2'],
+        'start': [100, 500, 100],
+        'end': [200, 1000, 300],
+        'strand': [1, -1, 1],
+        'gene_id': ['GENE1', 'GENE2', 'GENE3'],
+        'gene_name': ['Gene1', 'Gene2', 'Gene3']
+    })
+
+    return GenomicDataFrame(genes, chromosome_col='contig')
+
+
+@pytest.fixture
+def insertions():
+    """Example insertions (in frame format)."""
+
+    return Insertion.to_frame([
+        Insertion(id='INS1', chromosome='1', position=50, strand=1,
+                  support=1, sample='s1', metadata={'depth': 2}),
+        Insertion(id='INS2', chromosome='3', position=50, strand=1,
+                  support=1, sample='s1', metadata={'depth': 3}),
+        Insertion(id='INS3', chromosome='1', position=1100, strand=1,
+                  support=1, sample='s1', metadata={'depth': 4})
+    ])  # yapf: disable
+
+
+@pytest.fixture
+def table(genes, insertions):
+    """Example table with hits of the first and last insertion."""
+
+    return AnnotationTable.from_hits(
+        genes,
+        ins_idx=[2, 0, 0],
+        gene_idx=[1, 0, 1],
+        window_idx=[0, 0, 0],
+        positions=insertions['position'].values,
+        strands=insertions['strand'].values)
+
+
+class TestAnnotationTable(object):
+    """Tests for the AnnotationTable class."""
+
+    def test_from_hits(self, table):
+        """Tests calculation of distances and orientations."""
+
+        hits = table.hits
+
+        assert list(hits['insertion']) == [0, 0, 2]
+        assert list(hits['gene']) == [0, 1, 1]
+        assert list(hits['distance']) == [-50, 450, -100]
+        assert list(hits['orientation']) == ['sense', 'antisense',
+                                             'antisense']
+
+    def test_select_closest(self, table):
+        """Tests selecting the closest gene(s) per insertion."""
+
+        closest = table.select_closest()
+        assert list(closest.hits['gene']) == [0, 1]
+        assert list(closest.hits['insertion']) == [0, 2]
+
+    def test_filter_blacklist(self, table):
+        """Tests filtering hits of blacklisted genes."""
+
+        filtered = table.filter_blacklist({'GENE2'})
+        assert list(filtered.hits['gene']) == [0]
+
+    def test_to_frame(self, table):
+        """Tests adding gene ids and names to hits."""
+
+        frame = table.to_frame()
+        assert list(frame['gene_id']) == ['GENE1', 'GENE2', 'GENE2']
+
+    def test_join(self, table, insertions):
+        """Tests joining hits with insertions."""
+
+        joined = table.join(insertions)
+
+        assert list(joined['id']) == ['INS1', 'INS1', 'INS2', 'INS3']
+        assert list(joined['depth']) == [2, 2, 3, 4]
+        assert list(joined['gene_id'].fillna('')) == ['GENE1', 'GENE2', '',
+                                                      'GENE2']
+        assert np.isnan(joined['gene_distance'].iloc[2])
+        assert list(joined['gene_distance'].iloc[[0, 1, 3]]) == [-50, 450,
+                                                                  -100]
+
+    def test_join_objects(self, table, insertions):
+        """Tests that joining matches annotating insertion objects."""
+
+        joined = list(Insertion.from_frame(table.join(insertions)))
+
+        assert joined[0].metadata == {
+            'depth': 2,
+            'gene_id': 'GENE1',
+            'gene_name': 'Gene1',
+            'gene_distance': -50,
+            'gene_orientation': 'sense'
+        }
+        assert joined[2].metadata == {'depth': 3}
+
+    def test_join_empty(self, genes, insertions):
+        """Tests joining a table without hits."""
+
+        table = AnnotationTable.from_hits(
+            genes, [], [], [], positions=[], strands=[])
+        joined = table.join(insertions)
+
+        assert list(joined['id']) == ['INS1', 'INS2', 'INS3']
+        assert joined['gene_id'].isnull().all()
+
+    def test_missing_columns(self, genes):
+        """Tests that hits without the required columns are rejected."""
+
+        with pytest.raises(ValueError):
+            AnnotationTable(pd.DataFrame({'insertion': [0]}), genes=genes)
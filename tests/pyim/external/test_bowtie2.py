@@ -2,7 +2,7 @@ from pathlib import Path
 
 import pytest
 
-from pyim.external.bowtie2 import bowtie2, shell
+from pyim.external.bowtie2 import bowtie2, bowtie2_piped, shell
 
 # pylint: disable=redefined-outer-name
 
@@ -71,3 +71,47 @@ def test_single_fa(mocker, bowtie_args):
                    '-']
 
     mock.assert_called_with([expected_bt2, expected_st])
+
+
+def test_paired_collate(mocker, bowtie_args):
+    """Tests paired-end invocation of bowtie2 with collated output."""
+
+    mock = mocker.patch.object(shell, 'run_piped')
+    bowtie2(sort_order='collate', **bowtie_args)
+
+    expected_bt2 = ['bowtie2', '--threads', '10', '-1',
+                    str(bowtie_args['read_paths'][0]), '-2',
+                    str(bowtie_args['read2_paths'][0]), '-x',
+                    str(bowtie_args['index_path'])]
+    expected_st = ['samtools', 'collate', '-o',
+                   str(bowtie_args['output_path']), '-']
+
+    mock.assert_called_with([expected_bt2, expected_st])
+
+
+def test_invalid_sort_order(bowtie_args):
+    """Tests invocation of bowtie2 with an invalid sort order."""
+
+    with pytest.raises(ValueError):
+        bowtie2(sort_order='invalid', **bowtie_args)
+
+
+def test_piped_interleaved(mocker, bowtie_args):
+    """Tests invocation of bowtie2 with piped, interleaved input."""
+
+    input_args = [['cutadapt', '--interleaved', 'a.fastq', 'b.fastq']]
+
+    mock = mocker.patch.object(shell, 'run_piped')
+    bowtie2_piped(
+        input_args,
+        index_path=bowtie_args['index_path'],
+        output_path=bowtie_args['output_path'],
+        options=bowtie_args['options'],
+        interleaved=True)
+
+    expected_bt2 = ['bowtie2', '--interleaved', '-', '--threads', '10',
+                    '-x', str(bowtie_args['index_path'])]
+    expected_st = ['samtools', 'sort', '-o', str(bowtie_args['output_path']),
+                   '-']
+
+    mock.assert_called_with(input_args + [expected_bt2, expected_st])
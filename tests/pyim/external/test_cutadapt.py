@@ -2,7 +2,9 @@ from pathlib import Path
 
 import pytest
 
-from pyim.external.cutadapt import cutadapt, shell, Path
+from pyim.external.cutadapt import (cutadapt, cutadapt_stream_args, shell,
+                                    check_interleaved_support,
+                                    cutadapt_version, Path)
 
 # pylint: disable=redefined-outer-name
 
@@ -53,3 +55,57 @@ def test_single(mocker, cutadapt_args):
                 '-o', str(cutadapt_args['out_path']),
                 str(cutadapt_args['read_path'])] # yapf: disable
     mock_run.assert_called_with(expected)
+
+
+def test_stream_args(cutadapt_args):
+    """Tests arguments for streaming (interleaved) invocation of cutadapt."""
+
+    args = cutadapt_stream_args(
+        cutadapt_args['options'],
+        read_path=cutadapt_args['read_path'],
+        read2_path=cutadapt_args['read2_path'])
+
+    expected = ['cutadapt', '--interleaved', '-m', '10',
+                str(cutadapt_args['read_path']),
+                str(cutadapt_args['read2_path'])]  # yapf: disable
+
+    assert args == expected
+
+
+def test_stream_args_stdin(cutadapt_args):
+    """Tests arguments for streaming cutadapt from stdin."""
+
+    args = cutadapt_stream_args(cutadapt_args['options'])
+    assert args == ['cutadapt', '--interleaved', '-m', '10', '-']
+
+
+def _mock_version(mocker, version):
+    process = mocker.Mock()
+    process.stdout.read.return_value = version
+    return mocker.patch.object(shell, 'run', return_value=process)
+
+
+def test_version(mocker):
+    """Tests parsing of the cutadapt version."""
+
+    mock_run = _mock_version(mocker, b'1.18\n')
+
+    assert cutadapt_version() == (1, 18)
+    mock_run.assert_called_with(['cutadapt', '--version'])
+
+
+@pytest.mark.parametrize('version,supported', [
+    (b'1.12\n', False),
+    (b'1.15\n', True),
+    (b'2.10\n', True)
+])  # yapf: disable
+def test_check_interleaved_support(mocker, version, supported):
+    """Tests checking for --interleaved support."""
+
+    _mock_version(mocker, version)
+
+    if supported:
+        check_interleaved_support()
+    else:
+        with pytest.raises(ValueError):
+            check_interleaved_support()
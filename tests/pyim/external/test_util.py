@@ -1,5 +1,7 @@
 from collections import OrderedDict
 
+import pytest
+
 from pyim.external import util
 
 
@@ -51,6 +53,23 @@ class TestRunPiped(object):
         with log_path.open('rb') as log_file:
             assert log_file.read() == b'testing\n'
 
+    def test_input_chunks(self):
+        """Tests a simple piped command with input written to stdin."""
+
+        args = [['cat'], ['sed', 's/est/esting/g']]
+        processes = util.run_piped(args, input_chunks=[b'te', b'st\n'])
+
+        assert processes[-1].returncode == 0
+        assert processes[-1].stdout.read() == b'testing\n'
+
+    def test_failing_upstream(self):
+        """Tests that failures of upstream processes are detected."""
+
+        args = [['sh', '-c', 'echo test; exit 1'], ['sed', 's/est/esting/g']]
+
+        with pytest.raises(ValueError):
+            util.run_piped(args)
+
 
 class TestFlattenArguments(object):
     """Unit tests for the flatten_arguments function."""
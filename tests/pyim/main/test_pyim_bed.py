@@ -0,0 +1,56 @@
+import pandas as pd
+import pysam
+import pytest
+
+from pyim.main.pyim_bed import main
+from pyim.model import Insertion
+
+
+@pytest.fixture
+def insertion_path(tmpdir):
+    """Example insertions, including one close to the contig start."""
+
+    frame = Insertion.format_frame(pd.DataFrame({
+        'id': ['INS_1', 'INS_2'],
+        'chromosome': ['1', '1'],
+        'position': [100, 2000],
+        'strand': [1, -1],
+        'support': [10, 5],
+        'sample': 'S1'
+    }))
+
+    file_path = tmpdir / 'insertions.txt'
+    frame.to_csv(str(file_path), sep='\t', index=False)
+
+    return file_path
+
+
+@pytest.mark.parametrize('tabix', [False, True])
+def test_main(insertion_path, tmpdir, monkeypatch, tabix):
+    """Tests start clipping, which only applies to tabix output."""
+
+    output_path = tmpdir / ('insertions.bed' + ('.gz' if tabix else ''))
+
+    argv = ['pyim-bed', '--insertions', str(insertion_path),
+            '--output', str(output_path)]
+
+    if tabix:
+        argv += ['--tabix']
+
+    monkeypatch.setattr('sys.argv', argv)
+    main()
+
+    if tabix:
+        with pysam.TabixFile(str(output_path)) as tabix_file:
+            lines = list(tabix_file.fetch('1'))
+        expected_start = 0
+    else:
+        with open(str(output_path)) as file_:
+            lines = file_.read().splitlines()
+        expected_start = -150
+
+    rows = [line.split('\t') for line in lines]
+
+    assert [row[3] for row in rows] == ['INS_1', 'INS_2']
+    assert [int(row[1]) for row in rows] == [expected_start, 1750]
+    assert [int(row[6]) for row in rows] == [expected_start, 1750]
@@ -0,0 +1,41 @@
+import pytest
+
+from pyim.main.pyim_demultiplex import main
+
+
+@pytest.fixture
+def paths(tmpdir):
+    """Paths to example reads and barcodes."""
+
+    read_path = tmpdir / 'reads.fastq'
+    read_path.write('@read1\nACGTACGGGG\n+\nIIIIIIIIII\n')
+
+    barcode_path = tmpdir / 'barcodes.fa'
+    barcode_path.write('>BC01\nACGTAC\n')
+
+    return ['--reads', str(read_path), '--barcodes', str(barcode_path),
+            '--output_dir', str(tmpdir / 'out')]
+
+
+def test_main_native(paths, tmpdir, monkeypatch):
+    """Tests native de-multiplexing."""
+
+    monkeypatch.setattr('sys.argv', ['pyim-demultiplex'] + paths +
+                        ['--native'])
+    main()
+
+    assert (tmpdir / 'out' / 'BC01.fastq').exists()
+
+
+@pytest.mark.parametrize('extra_args', [
+    ['--native', '--error_rate', '0.1'],
+    ['--processes', '2']
+])  # yapf: disable
+def test_main_unsupported(paths, monkeypatch, extra_args):
+    """Tests rejecting options that are not supported by the method."""
+
+    monkeypatch.setattr('sys.argv', ['pyim-demultiplex'] + paths +
+                        extra_args)
+
+    with pytest.raises(SystemExit):
+        main()
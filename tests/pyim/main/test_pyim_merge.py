@@ -0,0 +1,151 @@
+import random
+
+import pandas as pd
+import pytest
+
+from pyim.main.pyim_merge import main, merge_sorted
+from pyim.model import Insertion
+
+# pylint: disable=redefined-outer-name
+
+CHROMOSOMES = ['1', '2', '10', 'X']
+
+
+def _random_frame(sample, num_rows, rng):
+    """Generates a coordinate-sorted insertion frame for a sample."""
+
+    rows = sorted(((rng.choice(CHROMOSOMES), rng.randint(0, 1000))
+                   for _ in range(num_rows)),
+                  key=lambda t: (CHROMOSOMES.index(t[0]), t[1]))
+
+    return Insertion.format_frame(pd.DataFrame({
+        'id': ['{}.INS_{}'.format(sample, i) for i in range(num_rows)],
+        'chromosome': [row[0] for row in rows],
+        'position': [row[1] for row in rows],
+        'strand': [rng.choice([-1, 1]) for _ in range(num_rows)],
+        'support': [rng.randint(1, 10) for _ in range(num_rows)],
+        'sample': sample
+    }))
+
+
+def _chunks(frame, size):
+    return (frame.iloc[i:i + size] for i in range(0, len(frame), size))
+
+
+def test_merge_sorted():
+    """Tests chunked merging against sorting the concatenated inputs."""
+
+    rng = random.Random(0)
+
+    frames = [_random_frame('S{}'.format(i), rng.randint(0, 40), rng)
+              for i in range(5)]
+
+    merged = pd.concat(
+        merge_sorted([_chunks(frame, 7) for frame in frames],
+                     chromosomes=CHROMOSOMES),
+        ignore_index=True)
+
+    expected = pd.concat(frames, ignore_index=True)
+    expected['rank'] = expected['chromosome'].astype(str).map(
+        CHROMOSOMES.index)
+    expected = expected.sort_values(['rank', 'position'], kind='stable')
+
+    assert list(merged['id']) == list(expected['id'])
+
+
+def test_merge_sorted_unsorted():
+    """Tests that unsorted inputs raise an error."""
+
+    frame = _random_frame('S1', 20, random.Random(0))
+    frame = frame.iloc[::-1]
+
+    with pytest.raises(ValueError):
+        list(merge_sorted([_chunks(frame, 7)], chromosomes=CHROMOSOMES))
+
+
+@pytest.mark.parametrize('sorted_', [False, True])
+def test_main(tmpdir, monkeypatch, sorted_):
+    """Tests merging files with different metadata columns."""
+
+    rng = random.Random(0)
+
+    frame1 = _random_frame('S1', 10, rng).assign(depth=5)
+    frame2 = _random_frame('S2', 10, rng)
+
+    paths = [str(tmpdir / 'S1.txt'), str(tmpdir / 'S2.txt')]
+    for frame, path in zip([frame1, frame2], paths):
+        frame.to_csv(path, sep='\t', index=False)
+
+    output_path = tmpdir / 'merged.txt'
+
+    argv = ['pyim-merge', '--insertions'] + paths + [
+        '--output', str(output_path), '--chunk_size', '3'
+    ]
+    if sorted_:
+        argv += ['--sorted']
+
+    monkeypatch.setattr('sys.argv', argv)
+    main()
+
+    merged = Insertion.from_csv(output_path, sep='\t', as_frame=True)
+
+    assert len(merged) == 20
+    assert list(merged.columns) == Insertion._non_metadata_fields() + [
+        'depth'
+    ]
+
+    if sorted_:
+        assert merged['chromosome'].iloc[0] == '1'
+        assert merged['chromosome'].iloc[-1] == 'X'
+    else:
+        assert list(merged['id']) == list(frame1['id']) + list(frame2['id'])
+
+
+def test_main_max_open(tmpdir, monkeypatch):
+    """Tests merging more sorted inputs than can be opened at once."""
+
+    rng = random.Random(0)
+
+    frames = [_random_frame('S{}'.format(i), rng.randint(0, 40), rng)
+              for i in range(7)]
+
+    paths = [str(tmpdir / 'S{}.txt'.format(i)) for i in range(len(frames))]
+    for frame, path in zip(frames, paths):
+        frame.to_csv(path, sep='\t', index=False)
+
+    output_path = tmpdir / 'merged.txt'
+    work_dir = tmpdir / 'work'
+
+    monkeypatch.setattr('sys.argv', ['pyim-merge', '--insertions'] + paths + [
+        '--output', str(output_path), '--sorted', '--chunk_size', '5',
+        '--max_open', '2', '--work_dir', str(work_dir)
+    ])
+    main()
+
+    merged = Insertion.from_csv(output_path, sep='\t', as_frame=True)
+
+    expected = pd.concat(frames, ignore_index=True)
+    expected['rank'] = expected['chromosome'].astype(str).map(
+        CHROMOSOMES.index)
+    expected = expected.sort_values(['rank', 'position'], kind='stable')
+
+    assert list(merged['id']) == list(expected['id'])
+
+    # Inputs should have been merged in groups (7 -> 4 -> 2 files).
+    assert len(work_dir.listdir()) == 5
+
+
+def test_main_duplicates(tmpdir, monkeypatch):
+    """Tests that duplicate samples raise an error."""
+
+    frame = _random_frame('S1', 5, random.Random(0))
+
+    paths = [str(tmpdir / 'a.txt'), str(tmpdir / 'b.txt')]
+    for path in paths:
+        frame.to_csv(path, sep='\t', index=False)
+
+    monkeypatch.setattr('sys.argv', ['pyim-merge', '--insertions'] + paths +
+                        ['--output', str(tmpdir / 'merged.txt')])
+
+    with pytest.raises(ValueError):
+        main()
@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+from pyim.main.pyim_split import main, _remove_prefix
+from pyim.model import Insertion
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def insertion_path(tmpdir):
+    """Merged insertion file containing multiple samples."""
+
+    samples = ['S1', 'S2', 'S3'] * 5
+
+    frame = pd.DataFrame({
+        'id': ['{}.INS_{}'.format(s, i) for i, s in enumerate(samples)],
+        'chromosome': '1',
+        'position': range(len(samples)),
+        'strand': 1,
+        'support': 2,
+        'sample': samples
+    })
+
+    file_path = tmpdir / 'merged.txt'
+    frame.to_csv(str(file_path), sep='\t', index=False)
+
+    return file_path
+
+
+@pytest.mark.parametrize('threads', [1, 2])
+def test_main(insertion_path, tmpdir, monkeypatch, threads):
+    """Tests splitting insertions in chunks with prefix removal."""
+
+    output_dir = tmpdir / 'out'
+
+    monkeypatch.setattr('sys.argv', [
+        'pyim-split', '--insertions', str(insertion_path), '--output_dir',
+        str(output_dir), '--samples', 'S1', 'S3', 'S4', '--remove_prefix',
+        '--chunk_size', '4', '--buffer_size', '6', '--threads', str(threads)
+    ])
+    main()
+
+    merged = Insertion.from_csv(insertion_path, sep='\t', as_frame=True)
+
+    for sample in ['S1', 'S3']:
+        split = Insertion.from_csv(
+            output_dir / (sample + '.txt'), sep='\t', as_frame=True)
+
+        expected = merged.loc[merged['sample'] == sample]
+        expected_ids = expected['id'].str.slice(3)
+
+        assert list(split['id']) == list(expected_ids)
+        assert list(split['position']) == list(expected['position'])
+
+    assert not (output_dir / 'S2.txt').exists()
+
+    empty = Insertion.from_csv(output_dir / 'S4.txt', sep='\t', as_frame=True)
+    assert len(empty) == 0
+
+
+def test_remove_prefix():
+    """Tests removal of prefixes."""
+
+    values = pd.Series(['S1.INS_1', 'S1.INS_2', 'S11.INS_3', 'INS_4'])
+    removed = _remove_prefix(values, 'S1.')
+
+    assert list(removed) == ['INS_1', 'INS_2', 'S11.INS_3', 'INS_4']
@@ -0,0 +1,258 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyim.model import Insertion, InsertionTable, CisSite, CisSiteTable
+from pyim.vendor.frozendict import frozendict
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def insertions():
+    """Example insertions with metadata."""
+
+    return [
+        Insertion(id='INS1', chromosome='1', position=100, strand=1,
+                  support=2, sample='s1', metadata=frozendict(depth=3)),
+        Insertion(id='INS2', chromosome='2', position=200, strand=-1,
+                  support=5, sample='s2', metadata=frozendict(depth=8))
+    ]  # yapf: disable
+
+
+class TestInsertionTable(object):
+    """Unit tests for the InsertionTable class."""
+
+    def test_from_rows(self, insertions):
+        """Tests round-trip conversion from/to insertions."""
+
+        table = InsertionTable.from_rows(insertions)
+
+        assert len(table) == 2
+        assert list(table) == insertions
+
+    def test_frame_no_copy(self, insertions):
+        """Tests that frames are used without copying."""
+
+        frame = Insertion.to_frame(insertions)
+        table = InsertionTable.from_frame(frame)
+
+        assert table.to_frame() is frame
+        assert Insertion.to_frame(table) is frame
+
+    def test_core_dtypes(self, insertions):
+        """Tests conversion of core columns to their expected types."""
+
+        frame = Insertion.to_frame(insertions)
+        frame['position'] = frame['position'].astype(float)
+
+        table = InsertionTable.from_frame(frame)
+        assert table['position'].dtype == np.int32
+
+    def test_missing_columns(self):
+        """Tests that frames without core columns are rejected."""
+
+        with pytest.raises(ValueError):
+            InsertionTable.from_frame(pd.DataFrame({'id': ['INS1']}))
+
+    def test_getitem(self, insertions):
+        """Tests column, row and mask access."""
+
+        table = InsertionTable.from_rows(insertions)
+
+        assert list(table['sample']) == ['s1', 's2']
+        assert table[1] == insertions[1]
+        assert list(table[table['support'] > 2]) == [insertions[1]]
+
+    def test_metadata_columns(self, insertions):
+        """Tests identification of metadata columns."""
+
+        table = InsertionTable.from_rows(insertions)
+        assert table.metadata_columns == ['depth']
+
+    def test_csv(self, insertions, tmpdir):
+        """Tests writing/reading tables to/from csv files."""
+
+        file_path = tmpdir / 'insertions.txt'
+
+        InsertionTable.from_rows(insertions).to_csv(file_path, sep='\t')
+        table = InsertionTable.from_csv(file_path, sep='\t')
+
+        assert list(table) == insertions
+
+    def test_empty(self):
+        """Tests table without rows."""
+
+        table = InsertionTable.from_rows([])
+
+        assert len(table) == 0
+        assert list(table) == []
+
+
+def test_cis_site_table():
+    """Tests CIS table with unstranded sites."""
+
+    frame = pd.DataFrame({
+        'id': ['CIS1'],
+        'chromosome': ['1'],
+        'position': [100],
+        'strand': [np.nan]
+    })
+
+    sites = list(CisSiteTable.from_frame(frame))
+
+    assert len(sites) == 1
+    assert np.isnan(sites[0].strand)
+
+
+def test_read_write(insertions, tmpdir):
+    """Tests reading insertions with column projection and filters."""
+
+    file_path = tmpdir / 'insertions.txt'
+    Insertion.write(file_path, insertions)
+
+    assert list(Insertion.read(file_path)) == insertions
+    assert list(Insertion.read(file_path, filters={'sample': 's2'})) == \
+        [insertions[1]]
+
+    frame = Insertion.read(file_path, as_frame=True, columns=[])
+    assert list(frame.columns) == Insertion._non_metadata_fields()
+
+    table = InsertionTable.read(file_path, filters={'chromosome': '1'})
+    assert list(table) == [insertions[0]]
+
+
+class TestFormatFrame(object):
+    """Unit tests for formatting frames with compact types."""
+
+    def test_compact_types(self, insertions):
+        """Tests conversion of core columns to compact types."""
+
+        frame = Insertion.to_frame(insertions)
+
+        assert frame['chromosome'].dtype == 'category'
+        assert frame['sample'].dtype == 'category'
+        assert frame['position'].dtype == np.int32
+        assert frame['strand'].dtype == np.int8
+        assert frame['support'].dtype == np.uint32
+        assert frame['depth'].dtype == np.int64
+
+        assert list(Insertion.from_frame(frame)) == insertions
+
+    def test_formatted(self, insertions):
+        """Tests that formatted frames are returned as is."""
+
+        frame = Insertion.to_frame(insertions)
+        assert Insertion.format_frame(frame) is frame
+
+    def test_missing_strand(self):
+        """Tests that strands with missing values are kept as floats."""
+
+        frame = pd.DataFrame({
+            'id': ['CIS1', 'CIS2'],
+            'chromosome': ['1', '2'],
+            'position': [100, 200],
+            'strand': [np.nan, 1]
+        })
+
+        formatted = CisSite.format_frame(frame)
+
+        assert formatted['position'].dtype == np.int32
+        assert formatted['strand'].dtype == np.float64
+
+    def test_read_csv(self, insertions, tmpdir):
+        """Tests reading of frames with compact types."""
+
+        file_path = tmpdir / 'insertions.txt'
+        Insertion.to_csv(file_path, insertions, sep='\t')
+
+        frame = Insertion.from_csv(file_path, sep='\t', as_frame=True)
+
+        assert frame['chromosome'].dtype == 'category'
+        assert list(frame['chromosome']) == ['1', '2']
+        assert frame['position'].dtype == np.int32
+
+
+class TestChunkedCsv(object):
+    """Unit tests for chunked reading/writing of csv files."""
+
+    def test_iter_csv(self, insertions, tmpdir):
+        """Tests reading insertions in chunks."""
+
+        file_path = tmpdir / 'insertions.txt'
+        Insertion.to_csv(file_path, insertions * 3, sep='\t')
+
+        chunks = list(
+            Insertion.iter_csv(
+                file_path, chunksize=4, as_frame=True, sep='\t'))
+
+        assert [len(chunk) for chunk in chunks] == [4, 2]
+        assert chunks[0]['position'].dtype == np.int32
+
+        read = Insertion.iter_csv(file_path, chunksize=4, sep='\t')
+        assert list(read) == insertions * 3
+
+    def test_to_csv_chunked(self, insertions, tmpdir):
+        """Tests that chunked writing gives the same output."""
+
+        expected_path = tmpdir / 'expected.txt'
+        Insertion.to_csv(expected_path, insertions * 3, sep='\t')
+
+        file_path = tmpdir / 'chunked.txt'
+        Insertion.to_csv(
+            file_path, iter(insertions * 3), sep='\t', chunksize=2)
+
+        assert file_path.read() == expected_path.read()
+
+    def test_writer_missing_columns(self, insertions, tmpdir):
+        """Tests writing batches lacking some of the metadata columns."""
+
+        batches = [[insertions[0]._replace(metadata=frozendict())],
+                   insertions]
+
+        file_path = tmpdir / 'insertions.txt'
+        with Insertion.csv_writer(
+                file_path, metadata_columns=['depth'], sep='\t') as writer:
+            for batch in batches:
+                writer.write(batch)
+
+        read = list(Insertion.from_csv(file_path, sep='\t'))
+        assert read == batches[0] + batches[1]
+
+        assert Insertion.read_metadata_columns(file_path) == ['depth']
+
+    def test_writer_extra_columns(self, insertions, tmpdir):
+        """Tests that batches with unexpected columns raise an error."""
+
+        file_path = tmpdir / 'insertions.txt'
+        with Insertion.csv_writer(file_path, sep='\t') as writer:
+            writer.write([insertions[0]._replace(metadata=frozendict())])
+
+            with pytest.raises(ValueError):
+                writer.write(insertions)
+
+    def test_writer_empty(self, tmpdir):
+        """Tests that a header is written without any batches."""
+
+        file_path = tmpdir / 'insertions.txt'
+
+        with Insertion.csv_writer(
+                file_path, metadata_columns=['depth'], sep='\t'):
+            pass
+
+        assert file_path.read() == ('id\tchromosome\tposition\tstrand\t'
+                                    'support\tsample\tdepth\n')
+
+
+def test_fetch(insertions, tmpdir):
+    """Tests fetching insertions from a tabix-indexed file."""
+
+    file_path = tmpdir / 'insertions.txt.gz'
+    Insertion.to_csv(file_path, insertions[::-1], tabix=True)
+
+    assert list(Insertion.fetch(file_path, '1', 50, 150)) == [insertions[0]]
+    assert list(Insertion.fetch(file_path, '1', 150, 250)) == []
+
+    frame = Insertion.fetch(file_path, '2', as_frame=True)
+    assert list(frame['id']) == ['INS2']
+    assert frame['chromosome'].dtype == 'category'
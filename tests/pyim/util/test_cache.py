@@ -0,0 +1,103 @@
+from pathlib import Path
+
+import pytest
+
+from pyim.util.cache import StageCache, file_digest, file_stamp
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def cache(tmpdir):
+    """Stage cache in temporary directory."""
+    return StageCache(Path(str(tmpdir / 'cache')))
+
+
+class TestStageCache(object):
+    """Unit tests for the StageCache class."""
+
+    def test_reuse(self, cache):
+        """Tests re-use of outputs for identical inputs."""
+
+        calls = []
+
+        def _stage(output_path):
+            calls.append(output_path)
+            output_path.write_text('output')
+
+        paths1 = cache.run('stage', {'a': 1}, ['out.txt'], _stage)
+        paths2 = cache.run('stage', {'a': 1}, ['out.txt'], _stage)
+
+        assert len(calls) == 1
+        assert paths1 == paths2
+        assert paths1[0].read_text() == 'output'
+
+    def test_changed_inputs(self, cache):
+        """Tests that stages are re-run if inputs change."""
+
+        calls = []
+
+        def _stage(output_path):
+            calls.append(output_path)
+            output_path.write_text('output')
+
+        paths1 = cache.run('stage', {'a': 1}, ['out.txt'], _stage)
+        paths2 = cache.run('stage', {'a': 2}, ['out.txt'], _stage)
+
+        assert len(calls) == 2
+        assert paths1 != paths2
+
+    def test_failed_stage(self, cache):
+        """Tests that outputs of failed stages are not re-used."""
+
+        def _failing_stage(output_path):
+            output_path.write_text('partial')
+            raise ValueError('Stage failed')
+
+        with pytest.raises(ValueError):
+            cache.run('stage', {'a': 1}, ['out.txt'], _failing_stage)
+
+        calls = []
+
+        def _stage(output_path):
+            calls.append(output_path)
+            output_path.write_text('output')
+
+        paths = cache.run('stage', {'a': 1}, ['out.txt'], _stage)
+
+        assert len(calls) == 1
+        assert paths[0].read_text() == 'output'
+
+    def test_key_paths(self):
+        """Tests that paths can be used in inputs."""
+
+        key1 = StageCache.key('stage', {'path': Path('/a/b')})
+        key2 = StageCache.key('stage', {'path': '/a/b'})
+
+        assert key1 == key2
+
+
+def test_file_digest(tmpdir):
+    """Tests digests of files with identical/different contents."""
+
+    path1, path2, path3 = (Path(str(tmpdir / name)) for name in 'abc')
+
+    path1.write_text('ACGT')
+    path2.write_text('ACGT')
+    path3.write_text('ACGA')
+
+    assert file_digest(path1) == file_digest(path2)
+    assert file_digest(path1) != file_digest(path3)
+
+
+def test_file_stamp(tmpdir):
+    """Tests that stamps change when files are modified."""
+
+    file_path = Path(str(tmpdir / 'reads.fastq'))
+    file_path.write_text('ACGT')
+
+    stamp = file_stamp(file_path)
+    assert stamp['size'] == 4
+
+    file_path.write_text('ACGTACGT')
+    assert file_stamp(file_path) != stamp
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from pyim.util.frame import frame_format, read_frame, write_frame
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def frame():
+    """Example insertion frame."""
+
+    return pd.DataFrame({
+        'id': ['INS1', 'INS2', 'INS3'],
+        'chromosome': ['1', '2', '1'],
+        'position': [100, 200, 300],
+        'strand': [1, -1, 1],
+        'sample': ['s1', 's2', 's2'],
+        'gene_name': ['Myc', 'Pten', 'Myc']
+    })
+
+
+def test_frame_format():
+    """Tests format detection from extensions."""
+
+    assert frame_format('insertions.txt') == 'text'
+    assert frame_format('insertions.parquet') == 'parquet'
+    assert frame_format('insertions.PQ') == 'parquet'
+    assert frame_format('insertions.feather') == 'feather'
+    assert frame_format('insertions.arrow') == 'feather'
+
+
+def test_read_text(frame, tmpdir):
+    """Tests reading a tsv file with projection and filters."""
+
+    file_path = tmpdir / 'insertions.txt'
+    write_frame(frame, file_path)
+
+    result = read_frame(
+        file_path,
+        columns=['id', 'sample'],
+        filters={'sample': 's2'},
+        dtypes={'chromosome': str})
+
+    assert list(result.columns) == ['id', 'sample']
+    assert list(result['id']) == ['INS2', 'INS3']
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.feather'])
+def test_binary_round_trip(frame, tmpdir, extension):
+    """Tests writing/reading binary files with projection and filters."""
+
+    pytest.importorskip('pyarrow')
+
+    file_path = tmpdir / ('insertions' + extension)
+    write_frame(frame, file_path, categorical=['chromosome', 'sample'])
+
+    pd.testing.assert_frame_equal(read_frame(file_path), frame)
+
+    result = read_frame(
+        file_path,
+        columns=['id', 'chromosome'],
+        filters={'sample': ['s1'],
+                 'chromosome': ['1']})
+
+    assert list(result.columns) == ['id', 'chromosome']
+    assert list(result['id']) == ['INS1']
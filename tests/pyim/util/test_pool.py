@@ -0,0 +1,47 @@
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+from pyim.util.pool import imap_bounded
+
+
+def _square(value):
+    return value**2
+
+
+class TestImapBounded(object):
+    """Tests for the imap_bounded function."""
+
+    def test_order(self):
+        """Tests that results are returned in input order."""
+
+        with ThreadPool(3) as pool:
+            results = list(imap_bounded(pool, _square, range(20), 4))
+
+        assert results == [value**2 for value in range(20)]
+
+    def test_bounded(self):
+        """Tests that input is only read ahead by max_pending items."""
+
+        consumed = []
+
+        def _items():
+            for i in range(20):
+                consumed.append(i)
+                yield i
+
+        with ThreadPool(2) as pool:
+            results = imap_bounded(pool, _square, _items(), 3)
+
+            assert next(results) == 0
+            assert len(consumed) == 4
+
+            assert next(results) == 1
+            assert len(consumed) == 5
+
+    def test_invalid(self):
+        """Tests that max_pending should be positive."""
+
+        with ThreadPool(1) as pool:
+            with pytest.raises(ValueError):
+                list(imap_bounded(pool, _square, range(5), 0))
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from pyim.util.tabix import fetch_tabix, sort_by_position, write_tabix
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def frame():
+    """Example (unsorted) frame with positions."""
+
+    return pd.DataFrame({
+        'id': ['a', 'b', 'c', 'd'],
+        'chromosome': ['2', '10', '2', 'X'],
+        'position': [100, 5, 50, 7]
+    })
+
+
+def test_sort_by_position(frame):
+    """Tests sorting by chromosome (natural order) and position."""
+
+    sorted_ = sort_by_position(frame, 'chromosome', 'position')
+    assert list(sorted_['id']) == ['c', 'a', 'b', 'd']
+
+
+def test_fetch(frame, tmpdir):
+    """Tests querying positions within regions."""
+
+    file_path = tmpdir / 'frame.txt.gz'
+    write_tabix(frame, file_path, 'chromosome', 'position')
+
+    assert (tmpdir / 'frame.txt.gz.tbi').exists()
+
+    def _fetch_ids(*args):
+        return list(fetch_tabix(file_path, *args)['id'])
+
+    assert _fetch_ids('2') == ['c', 'a']
+    assert _fetch_ids('2', 50, 51) == ['c']
+    assert _fetch_ids('2', 51, 100) == []
+    assert _fetch_ids('2', 0, 101) == ['c', 'a']
+    assert _fetch_ids('5') == []
+
+    fetched = fetch_tabix(file_path, '10', dtype={'chromosome': str})
+    assert list(fetched.columns) == ['id', 'chromosome', 'position']
+    assert list(fetched['chromosome']) == ['10']